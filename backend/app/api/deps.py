@@ -0,0 +1,70 @@
+from fastapi import Depends, Header, HTTPException, Query, status
+from fastapi.security import OAuth2PasswordBearer
+from jose import JWTError
+from typing import Optional
+from app.core.config import settings
+from app.core.security import decode_access_token
+from app.core.deadline import Deadline, start_deadline
+from app.db.mongodb import mongodb
+
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl=f"{settings.API_V1_PREFIX}/auth/login", auto_error=False)
+
+def _credentials_error() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+async def get_optional_user_id(token: Optional[str] = Depends(oauth2_scheme)) -> Optional[str]:
+    """Get the authenticated user's id, or None for anonymous requests."""
+    if not token:
+        return None
+    
+    try:
+        payload = decode_access_token(token)
+    except JWTError:
+        raise _credentials_error()
+    
+    # Tokens issued before `uid` was added only carry the email
+    user_id = payload.get("uid")
+    if user_id:
+        return user_id
+    
+    user = mongodb.get_user_by_email(payload.get("sub") or "")
+    if not user:
+        raise _credentials_error()
+    return user["id"]
+
+async def get_current_user_id(user_id: Optional[str] = Depends(get_optional_user_id)) -> str:
+    """Get the authenticated user's id, rejecting anonymous requests."""
+    if not user_id:
+        raise _credentials_error()
+    return user_id
+
+async def profiling_requested(
+    profile: bool = Query(default=False, description="Profile this request (requires login)"),
+    x_profile: Optional[str] = Header(default=None),
+    user_id: Optional[str] = Depends(get_optional_user_id)
+) -> bool:
+    """Whether the caller opted into profiling with `?profile=1` or an `X-Profile: 1` header."""
+    if not (profile or (x_profile or "").lower() in ("1", "true", "yes")):
+        return False
+    if not settings.PROFILING_ENABLED:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Profiling is disabled")
+    if not user_id:
+        raise _credentials_error()
+    return True
+
+def request_deadline(default_seconds: float):
+    """
+    Dependency factory that starts the request's deadline.
+    
+    The budget is the endpoint default, or the `X-Request-Timeout` header
+    (seconds) when given, capped at `DEADLINE_MAX_SECONDS`.
+    """
+    async def dependency(x_request_timeout: Optional[float] = Header(default=None, gt=0)) -> Deadline:
+        budget = x_request_timeout if x_request_timeout is not None else default_seconds
+        return start_deadline(min(budget, settings.DEADLINE_MAX_SECONDS))
+    
+    return dependency
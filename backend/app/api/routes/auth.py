@@ -47,7 +47,7 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends()):
         )
     
     access_token = create_access_token(
-        data={"sub": user["email"]}
+        data={"sub": user["email"], "uid": user["id"]}
     )
     
     return {"access_token": access_token, "token_type": "bearer"}
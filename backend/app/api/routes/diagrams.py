@@ -1,44 +1,332 @@
-from fastapi import APIRouter, HTTPException
-from app.models.diagram import DiagramRequest, DiagramResponse
-from app.services.llm_service import llm_service
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from app.models.diagram import DiagramRequest, DiagramResponse, DiagramEditRequest, DiagramEditResponse, DiagramJobResponse
+from app.models.enums import DiagramType, JobStatus
+from app.services.llm_service import llm_service, EditRejected
+from app.services.history_writer import history_writer
 from app.db.mongodb import mongodb
+from app.core.fast_json import FastJSONResponse
+from app.core.cancellation import run_until_disconnected, ClientDisconnected, CLIENT_CLOSED_REQUEST
+from app.core.metrics import metrics
+from app.core.config import settings
+from app.core.deadline import Deadline, DeadlineExceeded, stage, mongo_timeout
+from app.core.circuit_breaker import CircuitOpenError
+from app.core.profiling import SamplingProfiler
+from app.api.deps import get_optional_user_id, get_current_user_id, profiling_requested, request_deadline
+from app.services.job_queue import job_queue
+from app.services.prompt_similarity import best_match, index_fields
+from bson import ObjectId
 from datetime import datetime
+from typing import Dict, Optional
+import asyncio
 import logging
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/diagrams", tags=["diagrams"])
 
+def _save_profile(
+    profiler: SamplingProfiler,
+    deadline: Deadline,
+    request: DiagramRequest,
+    user_id: str,
+    reused: bool = False
+) -> Optional[str]:
+    """Store a finished generation profile, returning its id (None if it could not be stored)."""
+    try:
+        return mongodb.save_profile({
+            "user_id": ObjectId(user_id),
+            "path": "/diagrams/generate",
+            "prompt": request.prompt,
+            "diagram_type": request.diagram_type.value,
+            "provider": llm_service.provider,
+            "reused": reused,
+            "created_at": datetime.utcnow(),
+            "duration_ms": round(profiler.duration * 1000, 1),
+            "stages_ms": deadline.timings_ms(),
+            "sample_interval_ms": settings.PROFILE_SAMPLE_INTERVAL_MS,
+            "samples": profiler.samples,
+            "call_tree": profiler.call_tree()
+        })
+    except Exception as e:
+        logger.error("Failed to store profile: %s", e)
+        return None
+
+def _generate_headers(
+    profiler: Optional[SamplingProfiler],
+    deadline: Deadline,
+    request: DiagramRequest,
+    user_id: Optional[str],
+    reused: bool = False
+) -> Dict[str, str]:
+    """Server-Timing, plus the stored profile's id when the request was profiled."""
+    headers = {"Server-Timing": deadline.server_timing()}
+    if profiler:
+        profiler.stop()
+        profile_id = _save_profile(profiler, deadline, request, user_id, reused)
+        if profile_id:
+            headers["X-Profile-Id"] = profile_id
+    return headers
+
+def _near_duplicate(request: DiagramRequest, user_id: Optional[str]) -> Optional[Dict]:
+    """The owner's closest earlier diagram of the same type, if its prompt is similar enough."""
+    if settings.DUPLICATE_MODE not in ("offer", "auto"):
+        return None
+    fields = index_fields(request.prompt)
+    if not fields:
+        return None
+    try:
+        with mongo_timeout("duplicate_lookup"):
+            candidates = mongodb.find_similar_prompts(
+                fields["prompt_bands"], request.diagram_type.value, user_id, settings.DUPLICATE_MAX_CANDIDATES
+            )
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        # The lookup is an optimization; generate normally without it
+        logger.warning("Near-duplicate lookup failed: %s", e)
+        return None
+    
+    match, score = best_match(request.prompt, fields["prompt_minhash"], candidates)
+    hit = match is not None and score >= settings.DUPLICATE_THRESHOLD
+    metrics.increment("duplicate_lookups", outcome="hit" if hit else "miss", diagram_type=request.diagram_type.value)
+    if not hit:
+        return None
+    return {
+        "id": str(match["_id"]),
+        "prompt": match["prompt"],
+        "similarity": round(score, 3),
+        "created_at": match["created_at"],
+        "mermaid_code": match["mermaid_code"]
+    }
+
 @router.post("/generate", response_model=DiagramResponse)
-async def generate_diagram(request: DiagramRequest):
+async def generate_diagram(
+    request: DiagramRequest,
+    http_request: Request,
+    user_id: Optional[str] = Depends(get_optional_user_id),
+    deadline: Deadline = Depends(request_deadline(settings.DEADLINE_GENERATE_SECONDS)),
+    profile: bool = Depends(profiling_requested)
+):
     """
     Generate a Mermaid diagram from natural language description.
     
     Supports 10 diagram types:
     - flowchart, sequence, er, class, state, mindmap, gantt, pie, journey, gitGraph
+    
+    If the client disconnects before generation finishes, the provider request
+    is cancelled and nothing is written to history.
+    
+    Every stage runs against one request deadline (`X-Request-Timeout` header,
+    in seconds); running out returns 504 with the time spent per stage.
+    
+    While the provider's circuit is open the request fails with 503 at once.
+    If history cannot be written the diagram is still returned and the write
+    is retried in the background.
+    
+    Logged-in callers can send `X-Profile: 1` (or `?profile=1`) to run the
+    request under a sampling profiler. The profile is stored and its id
+    returned in the `X-Profile-Id` header; see `GET /diagrams/profiles/{id}`.
+    
+    If the caller generated a diagram of the same type from a near-duplicate
+    prompt before, it is returned in `similar` (`DUPLICATE_MODE=offer`), or
+    returned instead of generating, with `reused` set (`DUPLICATE_MODE=auto`,
+    unless the request sets `allow_reuse` to false).
     """
+    profiler = None
+    if profile:
+        profiler = SamplingProfiler(settings.PROFILE_SAMPLE_INTERVAL_MS / 1000)
+        profiler.start()
+    
     try:
+        with stage("duplicate_lookup"):
+            similar = _near_duplicate(request, user_id)
+        if similar:
+            mermaid_code = similar.pop("mermaid_code")
+            if settings.DUPLICATE_MODE == "auto" and request.allow_reuse:
+                metrics.increment("duplicates_reused", diagram_type=request.diagram_type.value)
+                return FastJSONResponse({
+                    "id": similar["id"],
+                    "mermaid_code": mermaid_code,
+                    "diagram_type": request.diagram_type.value,
+                    "prompt": similar["prompt"],
+                    "created_at": similar["created_at"],
+                    "reused": True,
+                    "similar": similar
+                }, headers=_generate_headers(profiler, deadline, request, user_id, reused=True))
+        
         # Generate diagram using LLM Service
-        mermaid_code = await llm_service.generate_diagram(
-            request.prompt,
-            request.diagram_type
+        result = await run_until_disconnected(
+            http_request,
+            llm_service.generate(request.prompt, request.diagram_type)
         )
+        mermaid_code = result.mermaid_code
         
-        # Save to database
-        diagram_id = mongodb.save_diagram(
-            request.prompt,
-            mermaid_code,
-            request.diagram_type.value
-        )
+        # Save to database (deferred if MongoDB is unavailable)
+        with stage("history_write"), mongo_timeout("history_write"):
+            diagram_id = history_writer.save(
+                request.prompt,
+                mermaid_code,
+                request.diagram_type.value,
+                user_id=user_id,
+                provider=result.provider,
+                usage=result.usage
+            )
         
-        return DiagramResponse(
-            id=diagram_id,
-            mermaid_code=mermaid_code,
-            diagram_type=request.diagram_type.value,
-            prompt=request.prompt,
-            created_at=datetime.utcnow()
+        headers = _generate_headers(profiler, deadline, request, user_id)
+        
+        # Same shape as DiagramResponse, encoded without a validation round trip
+        return FastJSONResponse({
+            "id": diagram_id,
+            "mermaid_code": mermaid_code,
+            "diagram_type": request.diagram_type.value,
+            "prompt": request.prompt,
+            "created_at": datetime.utcnow(),
+            "reused": False,
+            "similar": similar
+        }, headers=headers)
+        
+    except (DeadlineExceeded, CircuitOpenError):
+        raise
+    except ClientDisconnected:
+        metrics.increment("generations_cancelled", reason="client_disconnect", diagram_type=request.diagram_type.value)
+        logger.info("Client disconnected, cancelled diagram generation")
+        return Response(status_code=CLIENT_CLOSED_REQUEST)
+    except Exception as e:
+        logger.error("Failed to generate diagram: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if profiler:
+            profiler.stop()
+
+@router.get("/profiles/{profile_id}")
+async def get_profile(profile_id: str, user_id: str = Depends(get_current_user_id)):
+    """Get a stored generation profile: per-stage wall times and the sampled call tree."""
+    profile = mongodb.get_profile(profile_id, user_id=user_id)
+    if not profile:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FastJSONResponse(profile)
+
+@router.post("/{diagram_id}/edit", response_model=DiagramEditResponse)
+async def edit_diagram(
+    diagram_id: str,
+    request: DiagramEditRequest,
+    http_request: Request,
+    user_id: Optional[str] = Depends(get_optional_user_id),
+    deadline: Deadline = Depends(request_deadline(settings.DEADLINE_GENERATE_SECONDS))
+):
+    """
+    Change an existing diagram with an instruction instead of regenerating it.
+    
+    The model gets the current code and the instruction in a compact prompt
+    and answers with a patch or the full new code. The result is saved as a
+    new history entry linked to the one edited (`parent_id`, `revision`);
+    the original is left unchanged. Returns 422 if the model's answer cannot
+    be applied or is not valid.
+    """
+    with stage("history_read"), mongo_timeout("history_read"):
+        parent = mongodb.get_diagram_by_id(diagram_id, user_id=user_id)
+    if not parent:
+        raise HTTPException(status_code=404, detail="Diagram not found")
+    diagram_type = DiagramType(parent["diagram_type"])
+    
+    try:
+        result = await run_until_disconnected(
+            http_request,
+            llm_service.edit(parent["mermaid_code"], request.instruction, diagram_type, parent["prompt"])
         )
+        with stage("history_write"), mongo_timeout("history_write"):
+            # Edits keep the chain's root prompt, so later edits are measured against it
+            new_id = history_writer.save(
+                parent["prompt"],
+                result.mermaid_code,
+                diagram_type.value,
+                user_id=user_id,
+                provider=result.provider,
+                usage=result.usage,
+                parent=parent,
+                instruction=request.instruction
+            )
         
+        return FastJSONResponse({
+            "id": new_id,
+            "mermaid_code": result.mermaid_code,
+            "diagram_type": diagram_type.value,
+            "prompt": parent["prompt"],
+            "instruction": request.instruction,
+            "created_at": datetime.utcnow(),
+            "parent_id": parent["id"],
+            "revision": parent["revision"] + 1,
+            "edit_mode": result.usage["edit_mode"],
+            "total_tokens": result.usage["total_tokens"],
+            "tokens_saved": result.usage["tokens_saved"]
+        }, headers={"Server-Timing": deadline.server_timing()})
+    
+    except (DeadlineExceeded, CircuitOpenError):
+        raise
+    except EditRejected as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except ClientDisconnected:
+        metrics.increment("generations_cancelled", reason="client_disconnect", diagram_type=diagram_type.value)
+        logger.info("Client disconnected, cancelled diagram edit")
+        return Response(status_code=CLIENT_CLOSED_REQUEST)
     except Exception as e:
-        logger.error(f"Failed to generate diagram: {e}")
+        logger.error("Failed to edit diagram: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
+
+def _job_response(job: Dict) -> DiagramJobResponse:
+    result = None
+    if job["status"] == JobStatus.SUCCEEDED.value:
+        result = DiagramResponse(
+            id=job["diagram_id"],
+            mermaid_code=job["mermaid_code"],
+            diagram_type=job["diagram_type"],
+            prompt=job["prompt"],
+            created_at=job["updated_at"]
+        )
+    
+    return DiagramJobResponse(
+        id=str(job["_id"]),
+        status=job["status"],
+        diagram_type=job["diagram_type"],
+        prompt=job["prompt"],
+        result=result,
+        error=job.get("error") if job["status"] == JobStatus.FAILED.value else None,
+        attempts=job.get("attempts", 0),
+        created_at=job["created_at"],
+        updated_at=job["updated_at"]
+    )
+
+@router.post("/jobs", response_model=DiagramJobResponse, status_code=status.HTTP_202_ACCEPTED)
+async def create_generation_job(request: DiagramRequest, user_id: Optional[str] = Depends(get_optional_user_id)):
+    """
+    Queue a diagram generation and return immediately.
+    
+    Poll `GET /diagrams/jobs/{id}` (optionally with `wait`) for the result.
+    """
+    try:
+        job = job_queue.enqueue(request.prompt, request.diagram_type.value, user_id=user_id)
+        return _job_response(job)
+    except Exception as e:
+        logger.error("Failed to queue generation job: %s", e)
+        raise HTTPException(status_code=500, detail="Failed to queue generation job")
+
+@router.get("/jobs/{job_id}", response_model=DiagramJobResponse)
+async def get_generation_job(
+    job_id: str,
+    wait: int = Query(default=0, ge=0, le=30, description="Seconds to wait for the job to finish (long polling)"),
+    user_id: Optional[str] = Depends(get_optional_user_id)
+):
+    """Get the state of a generation job, optionally waiting up to `wait` seconds for it to finish."""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + wait
+    
+    while True:
+        job = job_queue.get(job_id, user_id=user_id)
+        if not job:
+            raise HTTPException(status_code=404, detail="Job not found")
+        
+        finished = job["status"] in (JobStatus.SUCCEEDED.value, JobStatus.FAILED.value)
+        if finished or loop.time() >= deadline:
+            return _job_response(job)
+        
+        await asyncio.sleep(min(0.5, max(0.0, deadline - loop.time())))
@@ -1,10 +1,22 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from app.models.diagram import HealthResponse, DiagramTypeInfo
-from app.models.history import StatsResponse
+from app.models.history import RouteStatsResponse, StatsResponse, TimeseriesResponse, UsageStatsResponse
 from app.models.enums import DiagramType
+from app.services.activity_rollups import activity_rollups, bucket_start
 from app.services.llm_service import llm_service
+from app.services.model_routes import model_router
+from app.services.speculation import adaptive_sampler
+from app.services.diagram_registry import diagram_registry
 from app.db.mongodb import mongodb
-from datetime import datetime
+from app.services.history_writer import history_writer
+from app.core.http_cache import STATIC_CACHE_CONTROL, etag_matches, not_modified, cache_headers
+from app.api.deps import get_optional_user_id
+from app.core.metrics import metrics
+from app.services.shared_state import shared_state
+from app.core.circuit_breaker import breaker_states, OPEN
+from app.core.config import settings
+from datetime import datetime, timedelta, timezone
+from typing import Literal, Optional
 
 router = APIRouter(tags=["utilities"])
 
@@ -13,50 +25,39 @@ async def health_check():
     """Check the health of backend services."""
     mongodb_status = "healthy" if mongodb.check_health() else "unhealthy"
     llm_status = "healthy" if await llm_service.check_health() else "unhealthy"
+    breakers = breaker_states()
     
     overall_status = "healthy" if mongodb_status == "healthy" and llm_status == "healthy" else "degraded"
+    if OPEN in breakers.values() or history_writer.pending_count:
+        overall_status = "degraded"
     
     return HealthResponse(
         status=overall_status,
         mongodb=mongodb_status,
         ollama=llm_status, # Keeping key name for compatibility or should I change it? Model says ollama.
+        circuit_breakers=breakers,
+        pending_history_writes=history_writer.pending_count,
         timestamp=datetime.utcnow()
     )
 
 @router.get("/diagram-types", response_model=list[DiagramTypeInfo])
-async def get_diagram_types():
+async def get_diagram_types(request: Request):
     """Get list of all supported diagram types."""
-    types = []
+    # Payload is built and serialized once at startup by the registry
+    etag = diagram_registry.diagram_types_etag
+    if etag_matches(request, etag):
+        return not_modified(etag, STATIC_CACHE_CONTROL)
     
-    example_prompts = {
-        DiagramType.FLOWCHART: "Create a login flow with authentication and error handling",
-        DiagramType.SEQUENCE: "Show the interaction between user, frontend, backend, and database for a login request",
-        DiagramType.ER_DIAGRAM: "Design a database schema for a blog with users, posts, and comments",
-        DiagramType.CLASS_DIAGRAM: "Create a class diagram for an e-commerce system with Product, Cart, and Order classes",
-        DiagramType.STATE_DIAGRAM: "Model the states of an order: pending, processing, shipped, delivered, cancelled",
-        DiagramType.MINDMAP: "Create a mindmap for planning a web application project",
-        DiagramType.GANTT: "Create a project timeline for building a mobile app over 3 months",
-        DiagramType.PIE_CHART: "Show the distribution of programming languages used in a project",
-        DiagramType.USER_JOURNEY: "Map the user journey for online shopping from browsing to checkout",
-        DiagramType.GIT_GRAPH: "Show a git workflow with main, develop, and feature branches",
-        DiagramType.TIKZ: "Create a high-quality ER diagram for a library system using tikz-er2",
-    }
-    
-    for diagram_type in DiagramType:
-        types.append(DiagramTypeInfo(
-            type=diagram_type.value,
-            name=diagram_type.value.replace('_', ' ').title(),
-            description=DiagramType.get_description(diagram_type),
-            mermaid_prefix=DiagramType.get_mermaid_prefix(diagram_type),
-            example_prompt=example_prompts.get(diagram_type, "")
-        ))
-    
-    return types
+    return Response(
+        content=diagram_registry.diagram_types_payload,
+        media_type="application/json",
+        headers=cache_headers(etag, STATIC_CACHE_CONTROL)
+    )
 
 @router.get("/stats", response_model=StatsResponse)
-async def get_stats():
-    """Get usage statistics."""
-    stats = mongodb.get_stats()
+async def get_stats(user_id: Optional[str] = Depends(get_optional_user_id)):
+    """Get the caller's usage statistics."""
+    stats = mongodb.get_stats(user_id=user_id)
     
     return StatsResponse(
         total_diagrams=stats["total_diagrams"],
@@ -64,3 +65,114 @@ async def get_stats():
         most_popular_type=stats["most_popular_type"],
         recent_activity=stats["recent_activity"]
     )
+
+# Range returned when the client gives no start
+_DEFAULT_SPANS = {
+    "minute": timedelta(hours=1),
+    "hour": timedelta(days=1),
+    "day": timedelta(days=30),
+}
+
+_BUCKET_SECONDS = {"minute": 60, "hour": 3600, "day": 86400}
+
+def _as_utc(value: datetime) -> datetime:
+    """Rollup buckets are naive UTC; convert aware datetimes to match."""
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+@router.get("/stats/timeseries", response_model=TimeseriesResponse)
+async def get_stats_timeseries(
+    granularity: Literal["minute", "hour", "day"] = Query(default="hour"),
+    start: Optional[datetime] = Query(default=None, description="Range start (UTC), default depends on granularity"),
+    end: Optional[datetime] = Query(default=None, description="Range end (UTC), default now"),
+    diagram_type: Optional[DiagramType] = Query(default=None),
+    provider: Optional[str] = Query(default=None, description="LLM provider, e.g. groq or ollama")
+):
+    """
+    Generations per bucket over a time range, from pre-aggregated rollups.
+    
+    Minute buckets are kept for `ROLLUP_MINUTE_RETENTION_HOURS` and hour
+    buckets for `ROLLUP_HOUR_RETENTION_DAYS`; use a coarser granularity for
+    older ranges.
+    """
+    end = _as_utc(end) if end else datetime.utcnow()
+    start = _as_utc(start) if start else end - _DEFAULT_SPANS[granularity]
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    
+    buckets = (end - bucket_start(start, granularity)).total_seconds() / _BUCKET_SECONDS[granularity]
+    if buckets > settings.ROLLUP_MAX_POINTS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Range spans {int(buckets)} {granularity} buckets (max {settings.ROLLUP_MAX_POINTS}); use a coarser granularity"
+        )
+    
+    points = activity_rollups.timeseries(
+        granularity,
+        start,
+        end,
+        diagram_type=diagram_type.value if diagram_type else None,
+        provider=provider
+    )
+    return TimeseriesResponse(granularity=granularity, start=start, end=end, points=points)
+
+@router.get("/stats/usage", response_model=UsageStatsResponse)
+async def get_usage_stats(
+    group_by: Literal["diagram_type", "model", "provider"] = Query(default="diagram_type"),
+    start: Optional[datetime] = Query(default=None, description="Only generations at or after (UTC)"),
+    end: Optional[datetime] = Query(default=None, description="Only generations before (UTC)"),
+    user_id: Optional[str] = Depends(get_optional_user_id)
+):
+    """
+    The caller's token usage, speed and cost, grouped by diagram type, model or provider.
+    
+    Prompt tokens include the diagram type's template; `avg_template_overhead_tokens`
+    estimates that share.
+    """
+    groups = mongodb.get_usage_stats(
+        group_by,
+        user_id=user_id,
+        start=_as_utc(start) if start else None,
+        end=_as_utc(end) if end else None
+    )
+    return UsageStatsResponse(group_by=group_by, groups=groups)
+
+@router.get("/stats/routes", response_model=RouteStatsResponse)
+async def get_route_stats(
+    diagram_type: Optional[DiagramType] = Query(default=None),
+    start: Optional[datetime] = Query(default=None, description="Only generations at or after (UTC)"),
+    end: Optional[datetime] = Query(default=None, description="Only generations before (UTC)")
+):
+    """
+    Latency, validation rate and cost of every provider/model each diagram type has used.
+    
+    Set `MODEL_ROUTE_CANDIDATES` and `MODEL_ROUTE_EXPLORE_RATE` to collect
+    numbers for models that are not routed yet, then move the cheapest one
+    whose validation rate is good enough into `MODEL_ROUTES`.
+    """
+    routes = mongodb.get_route_stats(
+        start=_as_utc(start) if start else None,
+        end=_as_utc(end) if end else None,
+        diagram_type=diagram_type.value if diagram_type else None
+    )
+    for route in routes:
+        current = model_router.routes.get(DiagramType(route["diagram_type"])) or llm_service.default_route()
+        route["primary"] = (route["provider"], route["model"]) == (current.provider, current.model)
+    return RouteStatsResponse(
+        explore_rate=model_router.explore_rate,
+        speculation=adaptive_sampler.snapshot(),
+        routes=routes
+    )
+
+@router.get("/metrics")
+async def get_metrics(scope: Literal["process", "cluster"] = "process"):
+    """
+    Get counters and timing summaries (e.g. Ollama cold loads).
+
+    `process` covers the worker that answers; `cluster` adds up all workers
+    (shared totals as of their last flush, plus this worker's latest changes).
+    """
+    if scope == "cluster":
+        return shared_state.metrics_snapshot()
+    return metrics.snapshot()
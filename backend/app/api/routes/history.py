@@ -1,7 +1,22 @@
-from fastapi import APIRouter, HTTPException, Query
-from app.models.history import HistoryResponse, HistoryItem
+from fastapi import APIRouter, Depends, File, HTTPException, Query, Request, Response, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from app.models.history import HistoryResponse, HistoryItem, HistorySearchResponse, HistoryImportResponse
 from app.db.mongodb import mongodb
-from typing import Optional
+from app.api.deps import get_optional_user_id, get_current_user_id
+from app.services import history_transfer
+from app.core import fast_json
+from app.core.http_cache import (
+    IMMUTABLE_CACHE_CONTROL, REVALIDATE_CACHE_CONTROL,
+    strong_etag, weak_etag, etag_matches, not_modified, cache_headers
+)
+from app.core.circuit_breaker import CircuitOpenError
+from pymongo.errors import ExecutionTimeout
+from bson import ObjectId
+from datetime import datetime
+from typing import Literal, Optional, Tuple
+import base64
+import json
 import logging
 
 logger = logging.getLogger(__name__)
@@ -10,75 +25,194 @@ router = APIRouter(prefix="/history", tags=["history"])
 
 @router.get("", response_model=HistoryResponse)
 async def get_history(
+    request: Request,
     limit: int = Query(default=10, ge=1, le=100),
-    diagram_type: Optional[str] = Query(default=None)
+    diagram_type: Optional[str] = Query(default=None),
+    user_id: Optional[str] = Depends(get_optional_user_id)
 ):
     """
-    Get diagram generation history.
+    Get the caller's diagram generation history.
     
     - **limit**: Number of items to return (1-100)
     - **diagram_type**: Optional filter by diagram type
+
+    Pages carry a weak ETag keyed on the newest entry, so a revalidation
+    only costs a single index lookup when nothing new was generated.
     """
     try:
-        history_data = mongodb.get_history(limit=limit, diagram_type=diagram_type)
-        
-        history_items = [
-            HistoryItem(
-                id=item["id"],
-                prompt=item["prompt"],
-                diagram_type=item["diagram_type"],
-                mermaid_code=item["mermaid_code"],
-                created_at=item["created_at"]
-            )
-            for item in history_data
-        ]
-        
-        return HistoryResponse(
-            history=history_items,
-            total=len(history_items),
-            limit=limit,
-            diagram_type_filter=diagram_type
+        headers = {}
+        latest = mongodb.get_latest_entry_marker(diagram_type=diagram_type, user_id=user_id)
+        if latest:
+            etag = weak_etag(latest["created_at"], latest["id"], str(limit), diagram_type or "", user_id or "")
+            if etag_matches(request, etag):
+                return not_modified(etag, REVALIDATE_CACHE_CONTROL)
+            headers = cache_headers(etag, REVALIDATE_CACHE_CONTROL)
+
+        # Fast path: encode Mongo documents straight to JSON bytes. The
+        # response_model above is kept for the OpenAPI schema only.
+        docs = mongodb.iter_history(limit=limit, diagram_type=diagram_type, user_id=user_id)
+        return Response(
+            content=fast_json.history_page(docs, limit, diagram_type),
+            media_type="application/json",
+            headers=headers
         )
         
+    except CircuitOpenError:
+        raise
     except Exception as e:
         logger.error(f"Failed to get history: {e}")
         raise HTTPException(status_code=500, detail="Failed to retrieve history")
 
+def _encode_search_cursor(score: float, diagram_id: str) -> str:
+    raw = json.dumps({"s": score, "id": diagram_id}, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+def _decode_search_cursor(cursor: str) -> Tuple[float, str]:
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        score, diagram_id = float(data["s"]), str(data["id"])
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid search cursor")
+    if not ObjectId.is_valid(diagram_id):
+        raise HTTPException(status_code=400, detail="Invalid search cursor")
+    return score, diagram_id
+
+@router.get("/search", response_model=HistorySearchResponse)
+async def search_history(
+    q: str = Query(..., min_length=1, max_length=200),
+    diagram_type: Optional[str] = Query(default=None),
+    limit: int = Query(default=20, ge=1, le=100),
+    cursor: Optional[str] = Query(default=None),
+    user_id: Optional[str] = Depends(get_optional_user_id)
+):
+    """
+    Full-text search over the caller's diagram history.
+    
+    - **q**: Words to match against prompts and diagram identifiers (node labels, entity and class names)
+    - **diagram_type**: Optional filter by diagram type
+    - **limit**: Number of results per page (1-100)
+    - **cursor**: `next_cursor` from the previous page
+    """
+    after = _decode_search_cursor(cursor) if cursor else None
+    
+    try:
+        docs = mongodb.search_history(q, diagram_type=diagram_type, limit=limit, after=after, user_id=user_id)
+    except ExecutionTimeout:
+        raise HTTPException(status_code=504, detail="Search took too long, try a more specific query")
+    except CircuitOpenError:
+        raise
+    except Exception as e:
+        logger.error("Failed to search history: %s", e)
+        raise HTTPException(status_code=500, detail="Failed to search history")
+    
+    next_cursor = None
+    if len(docs) == limit:
+        last = docs[-1]
+        next_cursor = _encode_search_cursor(last["score"], str(last["_id"]))
+    
+    return Response(
+        content=fast_json.search_page(docs, q, diagram_type, next_cursor),
+        media_type="application/json"
+    )
+
+@router.get("/export")
+async def export_history(
+    format: Literal["ndjson", "zip"] = Query(default="ndjson"),
+    diagram_type: Optional[str] = Query(default=None),
+    start: Optional[datetime] = Query(default=None, description="Created at or after (ISO 8601)"),
+    end: Optional[datetime] = Query(default=None, description="Created before (ISO 8601)"),
+    user_id: Optional[str] = Depends(get_optional_user_id)
+):
+    """
+    Stream the caller's history as NDJSON or as a zip of `.mmd`/`.tex` files.
+    
+    Documents are read from a MongoDB cursor in batches and written out as
+    they arrive, so memory use does not depend on the export size.
+    """
+    query = history_transfer.build_export_query(user_id, diagram_type, start, end)
+    
+    if format == "zip":
+        return StreamingResponse(
+            history_transfer.stream_zip(query),
+            media_type="application/zip",
+            headers={"Content-Disposition": 'attachment; filename="history.zip"'}
+        )
+    return StreamingResponse(
+        history_transfer.stream_ndjson(query),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="history.ndjson"'}
+    )
+
+@router.post("/import", response_model=HistoryImportResponse)
+async def import_history(
+    file: UploadFile = File(..., description="NDJSON produced by /history/export"),
+    user_id: str = Depends(get_current_user_id)
+):
+    """Bulk-import NDJSON history into the caller's account, skipping entries that already exist."""
+    try:
+        return await run_in_threadpool(history_transfer.import_ndjson, file.file, user_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid NDJSON: {e}")
+    except CircuitOpenError:
+        raise
+    except Exception as e:
+        logger.error("Failed to import history: %s", e)
+        raise HTTPException(status_code=500, detail="Failed to import history")
+
 @router.get("/{diagram_id}", response_model=HistoryItem)
-async def get_diagram(diagram_id: str):
-    """Get a specific diagram by ID."""
+async def get_diagram(
+    diagram_id: str,
+    request: Request,
+    response: Response,
+    user_id: Optional[str] = Depends(get_optional_user_id)
+):
+    """
+    Get a specific diagram by ID.
+
+    Diagrams never change after creation, so the strong ETag is derived from
+    the id alone and `If-None-Match` is answered without touching MongoDB.
+    """
+    etag = strong_etag("diagram", diagram_id, user_id or "")
+    if etag_matches(request, etag):
+        return not_modified(etag, IMMUTABLE_CACHE_CONTROL)
+
     try:
-        diagram = mongodb.get_diagram_by_id(diagram_id)
+        diagram = mongodb.get_diagram_by_id(diagram_id, user_id=user_id)
         
         if not diagram:
             raise HTTPException(status_code=404, detail="Diagram not found")
         
+        response.headers["ETag"] = etag
+        response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
         return HistoryItem(
             id=diagram["id"],
             prompt=diagram["prompt"],
             diagram_type=diagram["diagram_type"],
             mermaid_code=diagram["mermaid_code"],
-            created_at=diagram["created_at"]
+            created_at=diagram["created_at"],
+            parent_id=diagram["parent_id"],
+            revision=diagram["revision"],
+            instruction=diagram["instruction"]
         )
         
-    except HTTPException:
+    except (HTTPException, CircuitOpenError):
         raise
     except Exception as e:
         logger.error(f"Failed to get diagram: {e}")
         raise HTTPException(status_code=500, detail="Failed to retrieve diagram")
 
 @router.delete("/{diagram_id}")
-async def delete_diagram(diagram_id: str):
+async def delete_diagram(diagram_id: str, user_id: Optional[str] = Depends(get_optional_user_id)):
     """Delete a diagram by ID."""
     try:
-        success = mongodb.delete_diagram(diagram_id)
+        success = mongodb.delete_diagram(diagram_id, user_id=user_id)
         
         if not success:
             raise HTTPException(status_code=404, detail="Diagram not found")
         
         return {"message": "Diagram deleted successfully", "id": diagram_id}
         
-    except HTTPException:
+    except (HTTPException, CircuitOpenError):
         raise
     except Exception as e:
         logger.error(f"Failed to delete diagram: {e}")
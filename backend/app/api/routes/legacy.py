@@ -0,0 +1,55 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from app.services.llm_service import llm_service
+from app.services.history_writer import history_writer
+from app.db.mongodb import mongodb
+from app.models.enums import DiagramType
+from app.core.config import settings
+from app.core.circuit_breaker import CircuitOpenError
+from app.core.deadline import Deadline, DeadlineExceeded, stage, mongo_timeout
+from app.api.deps import request_deadline
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Routes of the original single-file backend, kept (unprefixed) for old clients.
+# They share the services, connection pools and single history write of the
+# versioned API.
+router = APIRouter(tags=["legacy"])
+
+@router.post("/generate", deprecated=True)
+async def legacy_generate(
+    prompt: str,
+    deadline: Deadline = Depends(request_deadline(settings.DEADLINE_GENERATE_SECONDS))
+):
+    """Generate a flowchart. Use `POST /api/v1/diagrams/generate` instead."""
+    if not prompt.strip():
+        raise HTTPException(status_code=400, detail="Prompt cannot be empty")
+
+    try:
+        result = await llm_service.generate(prompt, DiagramType.FLOWCHART)
+        with stage("history_write"), mongo_timeout("history_write"):
+            history_writer.save(
+                prompt, result.mermaid_code, DiagramType.FLOWCHART.value,
+                provider=result.provider, usage=result.usage
+            )
+        return {"mermaid_code": result.mermaid_code}
+    except (DeadlineExceeded, CircuitOpenError):
+        raise
+    except Exception as e:
+        logger.error("Legacy generate failed: %s", e)
+        raise HTTPException(status_code=500, detail=f"Internal error: {str(e)}")
+
+@router.get("/history", deprecated=True)
+async def legacy_history(limit: int = Query(default=10, ge=1, le=100)):
+    """Recent anonymous history. Use `GET /api/v1/history` instead."""
+    docs = mongodb.iter_history(limit=limit)
+    return {
+        "history": [
+            {
+                "prompt": doc["prompt"],
+                "mermaid_code": doc["mermaid_code"],
+                "created_at": doc["created_at"].isoformat()
+            }
+            for doc in docs
+        ]
+    }
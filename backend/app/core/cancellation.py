@@ -0,0 +1,32 @@
+import asyncio
+from typing import Awaitable, TypeVar
+from fastapi import Request
+
+T = TypeVar("T")
+
+# Non-standard status (nginx convention) recorded when the client went away
+CLIENT_CLOSED_REQUEST = 499
+
+class ClientDisconnected(Exception):
+    """Raised when the client disconnects before the work finished."""
+
+async def run_until_disconnected(request: Request, awaitable: Awaitable[T], poll_interval: float = 0.5) -> T:
+    """
+    Await `awaitable` while watching the client connection.
+
+    If the client disconnects first, the work is cancelled (which also aborts
+    any in-flight upstream HTTP request) and `ClientDisconnected` is raised.
+    """
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=poll_interval)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+                raise ClientDisconnected()
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
@@ -0,0 +1,140 @@
+import threading
+import time
+import logging
+from typing import Callable, Dict, Optional
+from app.core.config import settings
+from app.core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a dependency whose circuit is open."""
+
+    def __init__(self, breaker: "CircuitBreaker"):
+        super().__init__(f"{breaker.name} is unavailable (circuit open)")
+        self.breaker = breaker
+        self.retry_after = max(1, int(breaker.seconds_until_retry()))
+
+class CircuitBreaker:
+    """
+    Closed/open/half-open circuit breaker around one dependency.
+
+    After `failure_threshold` consecutive failures the circuit opens and calls
+    fail immediately with `CircuitOpenError`. Once `recovery_timeout` seconds
+    have passed it goes half-open and lets a limited number of trial calls
+    through: a success closes it again, a failure re-opens it.
+
+    Use it as a context manager (`with breaker:` or `async with breaker:`)
+    around the call. `is_failure` decides which exceptions count against the
+    dependency; anything else (e.g. a duplicate key) counts as a success.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: Optional[int] = None,
+        recovery_timeout: Optional[float] = None,
+        half_open_max_calls: int = 1,
+        is_failure: Optional[Callable[[BaseException], bool]] = None
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold or settings.CIRCUIT_FAILURE_THRESHOLD
+        self.recovery_timeout = recovery_timeout or settings.CIRCUIT_RECOVERY_SECONDS
+        self.half_open_max_calls = half_open_max_calls
+        self.is_failure = is_failure or (lambda exc: isinstance(exc, Exception))
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._half_open_calls = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+            self._state = HALF_OPEN
+            self._half_open_calls = 0
+        return self._state
+
+    def seconds_until_retry(self) -> float:
+        return max(0.0, self.recovery_timeout - (time.monotonic() - self._opened_at))
+
+    def before_call(self):
+        """Reserve a call, or raise `CircuitOpenError` if the dependency should not be called."""
+        with self._lock:
+            state = self._current_state()
+            if state == OPEN:
+                raise CircuitOpenError(self)
+            if state == HALF_OPEN:
+                if self._half_open_calls >= self.half_open_max_calls:
+                    raise CircuitOpenError(self)
+                self._half_open_calls += 1
+
+    def record_success(self):
+        with self._lock:
+            if self._state != CLOSED:
+                logger.info("Circuit %s closed", self.name)
+            self._state = CLOSED
+            self._failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            state = self._current_state()
+            self._failures += 1
+            if state == HALF_OPEN or self._failures >= self.failure_threshold:
+                if state != OPEN:
+                    logger.warning("Circuit %s opened after %s failures", self.name, self._failures)
+                    metrics.increment("circuit_opened", breaker=self.name)
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+
+    def _on_exit(self, exc: Optional[BaseException]):
+        if exc is not None and self.is_failure(exc):
+            self.record_failure()
+        elif exc is None or isinstance(exc, Exception):
+            self.record_success()
+        else:
+            # Cancelled: no verdict on the dependency, release a half-open slot
+            with self._lock:
+                if self._state == HALF_OPEN:
+                    self._half_open_calls = max(0, self._half_open_calls - 1)
+
+    def __enter__(self):
+        self.before_call()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._on_exit(exc)
+        return False
+
+    async def __aenter__(self):
+        self.before_call()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self._on_exit(exc)
+        return False
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_registry_lock = threading.Lock()
+
+def get_breaker(name: str, **kwargs) -> CircuitBreaker:
+    """Get or create the named breaker (options only apply on creation)."""
+    with _registry_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = _breakers[name] = CircuitBreaker(name, **kwargs)
+        return breaker
+
+def breaker_states() -> Dict[str, str]:
+    """Current state of every registered breaker, for `/health`."""
+    with _registry_lock:
+        breakers = list(_breakers.values())
+    return {breaker.name: breaker.state for breaker in breakers}
@@ -1,5 +1,5 @@
 from pydantic import BaseSettings
-from typing import List
+from typing import Any, Dict, List
 import os
 
 class Settings(BaseSettings):
@@ -13,6 +13,17 @@ class Settings(BaseSettings):
     OLLAMA_URL: str = "http://localhost:11434/api/generate"
     OLLAMA_MODEL: str = "llama3.1"
     OLLAMA_TIMEOUT: int = 240
+    # How long Ollama keeps the model in memory after a request
+    OLLAMA_KEEP_ALIVE: str = "30m"
+    # Warm-up and keep-warm load OLLAMA_MODEL (if Ollama is the default) and
+    # every Ollama model in MODEL_ROUTES
+    OLLAMA_WARMUP_ON_STARTUP: bool = True
+    # Keep-warm ping interval during traffic hours (0 disables)
+    OLLAMA_KEEPWARM_INTERVAL_SECONDS: int = 240
+    # Traffic hours as "start-end" in UTC, end exclusive (e.g. "8-20", or "22-6" across midnight)
+    OLLAMA_KEEPWARM_HOURS: str = "0-24"
+    # A response whose model load took longer than this counts as a cold load
+    OLLAMA_COLD_LOAD_THRESHOLD_MS: int = 1000
 
     # Groq Configuration
     GROQ_API_KEY: str = ""
@@ -21,6 +32,113 @@ class Settings(BaseSettings):
     # LLM Provider (ollama or groq)
     LLM_PROVIDER: str = "groq"
     
+    # Request deadlines: clients may ask for a shorter budget with the
+    # X-Request-Timeout header (seconds), capped at DEADLINE_MAX_SECONDS
+    DEADLINE_GENERATE_SECONDS: float = 250
+    DEADLINE_MAX_SECONDS: float = 300
+    
+    # History search: upper bound on a single search query
+    SEARCH_MAX_TIME_MS: int = 2000
+    
+    # History retention: entries older than the window are archived to disk.
+    # 0 keeps entries forever; HISTORY_RETENTION_BY_TYPE is JSON, e.g. {"pie": 30}
+    HISTORY_RETENTION_DAYS: int = 0
+    HISTORY_RETENTION_BY_TYPE: Dict[str, int] = {}
+    HISTORY_ARCHIVE_DIR: str = "archive"
+    HISTORY_ARCHIVE_BATCH_SIZE: int = 1000
+    # Seconds between scheduled retention sweeps (0 disables the scheduler)
+    HISTORY_SWEEP_INTERVAL_SECONDS: int = 0
+    # Days restored entries are kept before the sweep may remove them again
+    HISTORY_RESTORE_HOLD_DAYS: int = 30
+    
+    # Asynchronous generation jobs
+    JOB_WORKERS: int = 2
+    JOB_POLL_INTERVAL_SECONDS: float = 1.0
+    # A running job whose lease expires (e.g. its worker died) is picked up again
+    JOB_LEASE_SECONDS: int = 300
+    JOB_MAX_ATTEMPTS: int = 3
+    JOB_RESULT_TTL_HOURS: int = 24
+    
+    # Production server (gunicorn.conf.py): WEB_WORKERS processes (0 = one per
+    # CPU core), each restarted after WEB_MAX_REQUESTS requests (0 = never).
+    # Workers add their metrics to shared totals every SHARED_METRICS_FLUSH_SECONDS
+    # (0 = /metrics?scope=cluster only sees what was flushed at shutdown)
+    WEB_WORKERS: int = 0
+    WEB_BIND: str = "0.0.0.0:8000"
+    WEB_GRACEFUL_TIMEOUT: int = 30
+    WEB_MAX_REQUESTS: int = 0
+    SHARED_METRICS_FLUSH_SECONDS: float = 10.0
+    
+    # Circuit breakers: consecutive failures before a dependency is cut off,
+    # and seconds before a trial call is let through again
+    CIRCUIT_FAILURE_THRESHOLD: int = 5
+    CIRCUIT_RECOVERY_SECONDS: float = 30
+    # History writes buffered in memory while MongoDB is unavailable
+    HISTORY_PENDING_WRITES_MAX: int = 1000
+    HISTORY_FLUSH_INTERVAL_SECONDS: float = 5
+    
+    # Prices in USD per million tokens, by model, for cost accounting (JSON)
+    MODEL_PRICES: Dict[str, Dict[str, float]] = {
+        "llama-3.3-70b-versatile": {"input": 0.59, "output": 0.79}
+    }
+    
+    # Activity rollups: minute and hour buckets expire after these windows
+    # (0 keeps them); day buckets are kept forever
+    ROLLUP_MINUTE_RETENTION_HOURS: int = 48
+    ROLLUP_HOUR_RETENTION_DAYS: int = 90
+    # Most buckets a single /stats/timeseries request may return
+    ROLLUP_MAX_POINTS: int = 2000
+    
+    # Per diagram type provider/model routes (JSON), e.g.
+    # {"pie": {"provider": "groq", "model": "llama-3.1-8b-instant", "timeout": 10, "max_tokens": 512}}
+    # Types without a route use LLM_PROVIDER. MODEL_ROUTE_EXPLORE_RATE of
+    # generations go to a random MODEL_ROUTE_CANDIDATES entry instead, to
+    # compare routes at /stats/routes
+    MODEL_ROUTES: Dict[str, Dict[str, Any]] = {}
+    MODEL_ROUTE_CANDIDATES: Dict[str, List[Dict[str, Any]]] = {}
+    MODEL_ROUTE_EXPLORE_RATE: float = 0.0
+    
+    # Speculative generation for the listed diagram types: up to
+    # SPECULATIVE_MAX_SAMPLES concurrent samples at SPECULATIVE_TEMPERATURES,
+    # first valid output wins. The number of samples adapts to each type's
+    # observed validation failure rate (starting from the prior)
+    SPECULATIVE_TYPES: List[str] = []
+    SPECULATIVE_MAX_SAMPLES: int = 3
+    SPECULATIVE_TEMPERATURES: List[float] = [0.2, 0.6, 0.9]
+    SPECULATIVE_TARGET_SUCCESS: float = 0.95
+    SPECULATIVE_PRIOR_FAILURE_RATE: float = 0.2
+    
+    # Near-duplicate prompts: "offer" returns the closest earlier diagram of the
+    # same type and owner as `similar`, "auto" returns it instead of generating,
+    # "off" disables the lookup. Similarity is estimated Jaccard over prompt words
+    DUPLICATE_MODE: str = "offer"
+    DUPLICATE_THRESHOLD: float = 0.8
+    DUPLICATE_MAX_CANDIDATES: int = 50
+    
+    # Answer fully structured pie, gantt and "A -> B -> C" flowchart prompts
+    # with a rule-based generator instead of the LLM
+    FAST_PATH_ENABLED: bool = True
+    
+    # Provider traffic: "record" saves every response with its latency under
+    # LLM_TRAFFIC_DIR, "replay" serves them back offline with the latency
+    # multiplied by LLM_REPLAY_LATENCY_SCALE (0 = no delay)
+    LLM_TRAFFIC_MODE: str = "off"
+    LLM_TRAFFIC_DIR: str = "llm_traffic"
+    LLM_REPLAY_LATENCY_SCALE: float = 1.0
+    
+    # On-demand profiling of single generations (X-Profile header or ?profile=1, login required)
+    PROFILING_ENABLED: bool = True
+    PROFILE_SAMPLE_INTERVAL_MS: float = 5
+    PROFILE_TTL_DAYS: int = 7
+    
+    # Logging: records are queued and written by a background thread.
+    # LOG_FORMAT is "json" or "text"; INFO lines from LOG_SAMPLED_LOGGERS are
+    # kept for LOG_INFO_SAMPLE_RATE of requests (warnings and errors always)
+    LOG_LEVEL: str = "INFO"
+    LOG_FORMAT: str = "json"
+    LOG_INFO_SAMPLE_RATE: float = 1.0
+    LOG_SAMPLED_LOGGERS: List[str] = ["httpx", "app.db.mongodb", "app.services.llm_service"]
+    
     # API Configuration
     API_V1_PREFIX: str = "/api/v1"
     PROJECT_NAME: str = "DiagramCraft AI Backend"
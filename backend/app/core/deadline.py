@@ -0,0 +1,111 @@
+import time
+import pymongo
+from pymongo.errors import PyMongoError
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+class DeadlineExceeded(Exception):
+    """Raised when a request runs out of its time budget."""
+
+    def __init__(self, stage: str, deadline: "Deadline"):
+        super().__init__(f"Request deadline of {deadline.budget:.1f}s exceeded during {stage}")
+        self.stage = stage
+        self.deadline = deadline
+
+class Deadline:
+    """
+    Time budget for one request.
+
+    Each pipeline stage asks for the remaining budget instead of using its
+    own fixed timeout, and records how long it took.
+    """
+
+    def __init__(self, budget_seconds: float):
+        self.budget = budget_seconds
+        self.started = time.monotonic()
+        self.expires = self.started + budget_seconds
+        self.stages: Dict[str, float] = {}
+
+    def remaining(self) -> float:
+        return self.expires - time.monotonic()
+
+    def check(self, stage: str):
+        """Raise `DeadlineExceeded` if the budget is already spent."""
+        if self.remaining() <= 0:
+            raise DeadlineExceeded(stage, self)
+
+    def timeout(self, stage: str, default: float) -> float:
+        """Timeout for a stage: its own default, capped at the remaining budget."""
+        self.check(stage)
+        return min(default, self.remaining())
+
+    @contextmanager
+    def stage(self, name: str):
+        """Record the wall time spent in a stage (accumulates if entered again)."""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + (time.monotonic() - start)
+
+    def timings_ms(self) -> Dict[str, float]:
+        return {name: round(seconds * 1000, 1) for name, seconds in self.stages.items()}
+
+    def server_timing(self) -> str:
+        """Render stage timings as a `Server-Timing` header value."""
+        return ", ".join(f"{name};dur={ms}" for name, ms in self.timings_ms().items())
+
+_current_deadline: ContextVar[Optional[Deadline]] = ContextVar("current_deadline", default=None)
+
+# Set for concurrent sub-tasks whose caller times them as one stage
+_stages_muted: ContextVar[bool] = ContextVar("stages_muted", default=False)
+
+def start_deadline(budget_seconds: float) -> Deadline:
+    """Start a deadline for the current request or job."""
+    deadline = Deadline(budget_seconds)
+    _current_deadline.set(deadline)
+    return deadline
+
+def current_deadline() -> Optional[Deadline]:
+    return _current_deadline.get()
+
+def stage(name: str):
+    """Time a stage against the current deadline, if there is one."""
+    deadline = current_deadline()
+    return deadline.stage(name) if deadline and not _stages_muted.get() else nullcontext()
+
+@contextmanager
+def muted_stages():
+    """Skip stage timing in the block and in tasks created in it; the budget still applies."""
+    token = _stages_muted.set(True)
+    try:
+        yield
+    finally:
+        _stages_muted.reset(token)
+
+def stage_timeout(stage_name: str, default: float) -> float:
+    """Timeout for a stage under the current deadline, or `default` without one."""
+    deadline = current_deadline()
+    return deadline.timeout(stage_name, default) if deadline else default
+
+@contextmanager
+def mongo_timeout(stage_name: str):
+    """
+    Bound MongoDB operations by the remaining budget (no-op without a deadline).
+
+    Driver timeouts inside the block are reported as `DeadlineExceeded`.
+    """
+    deadline = current_deadline()
+    if deadline is None:
+        yield
+        return
+
+    deadline.check(stage_name)
+    try:
+        with pymongo.timeout(deadline.remaining()):
+            yield
+    except PyMongoError as e:
+        if e.timeout:
+            raise DeadlineExceeded(stage_name, deadline) from e
+        raise
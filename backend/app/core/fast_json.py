@@ -0,0 +1,62 @@
+import orjson
+from bson import ObjectId
+from typing import Any, Dict, Iterable, Optional
+from fastapi import Response
+
+def _default(obj: Any) -> Any:
+    """Serialize BSON types that orjson does not know about."""
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+def dumps(obj: Any) -> bytes:
+    """Serialize to JSON bytes with orjson (datetimes are emitted in ISO 8601)."""
+    return orjson.dumps(obj, default=_default)
+
+def history_item(doc: Dict) -> Dict:
+    """Map a raw history document onto the `HistoryItem` wire shape."""
+    return {
+        "id": str(doc["_id"]),
+        "prompt": doc["prompt"],
+        "diagram_type": doc.get("diagram_type", "flowchart"),
+        "mermaid_code": doc["mermaid_code"],
+        "created_at": doc["created_at"]
+    }
+
+def history_page(docs: Iterable[Dict], limit: int, diagram_type: Optional[str]) -> bytes:
+    """
+    Encode a `HistoryResponse` page straight from MongoDB documents.
+
+    Skips the intermediate dicts and pydantic models of the regular path;
+    the field layout matches `HistoryResponse` exactly.
+    """
+    items = [history_item(doc) for doc in docs]
+    return dumps({
+        "history": items,
+        "total": len(items),
+        "limit": limit,
+        "diagram_type_filter": diagram_type
+    })
+
+def search_page(docs: Iterable[Dict], query: str, diagram_type: Optional[str], next_cursor: Optional[str]) -> bytes:
+    """Encode a `HistorySearchResponse` page straight from aggregation results."""
+    results = []
+    for doc in docs:
+        item = history_item(doc)
+        item["score"] = doc["score"]
+        results.append(item)
+    return dumps({
+        "results": results,
+        "query": query,
+        "diagram_type_filter": diagram_type,
+        "next_cursor": next_cursor
+    })
+
+class FastJSONResponse(Response):
+    """JSON response rendered with orjson."""
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, bytes):
+            return content
+        return dumps(content)
@@ -0,0 +1,45 @@
+import hashlib
+from datetime import datetime
+from typing import Optional
+from fastapi import Request, Response
+
+# Cache-Control policies for conditional GET endpoints
+IMMUTABLE_CACHE_CONTROL = "private, max-age=31536000, immutable"
+STATIC_CACHE_CONTROL = "public, max-age=3600, must-revalidate"
+REVALIDATE_CACHE_CONTROL = "private, no-cache"
+
+def strong_etag(*parts: str) -> str:
+    """Build a strong ETag from a stable content identity (id or content hash)."""
+    digest = hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()[:32]
+    return f'"{digest}"'
+
+def weak_etag(newest: Optional[datetime], *parts: str) -> str:
+    """Build a weak ETag for a list page keyed on its newest `created_at`."""
+    marker = newest.isoformat() if newest else "empty"
+    digest = hashlib.sha256("\x1f".join((marker,) + parts).encode("utf-8")).hexdigest()[:32]
+    return f'W/"{digest}"'
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Check `If-None-Match` against an ETag using weak comparison (RFC 9110 13.1.2)."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+def cache_headers(etag: str, cache_control: str) -> dict:
+    """Headers attached to both 200 and 304 responses."""
+    return {"ETag": etag, "Cache-Control": cache_control}
+
+def not_modified(etag: str, cache_control: str) -> Response:
+    """Build an empty 304 response carrying the validator headers."""
+    return Response(status_code=304, headers=cache_headers(etag, cache_control))
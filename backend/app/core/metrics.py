@@ -0,0 +1,81 @@
+import threading
+from collections import defaultdict
+from typing import Dict, Tuple
+
+def _key(name: str, labels: Dict[str, str]) -> str:
+    if not labels:
+        return name
+    rendered = ",".join(f"{k}={labels[k]}" for k in sorted(labels))
+    return f"{name}{{{rendered}}}"
+
+def _add_observation(summaries: Dict[str, Dict[str, float]], key: str, count: float, total: float, largest: float):
+    summary = summaries.get(key)
+    if summary is None:
+        summary = summaries[key] = {"count": 0, "sum": 0.0, "max": 0.0}
+    summary["count"] += count
+    summary["sum"] += total
+    summary["max"] = max(summary["max"], largest)
+
+class Metrics:
+    """
+    In-process counters and timing summaries, exposed at `/metrics`.
+
+    Changes since the last `drain` are also kept apart, so a multi-worker
+    deployment can add them to the shared totals (see `SharedState`).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = defaultdict(float)
+        self._summaries: Dict[str, Dict[str, float]] = {}
+        self._pending_counters: Dict[str, float] = defaultdict(float)
+        self._pending_summaries: Dict[str, Dict[str, float]] = {}
+
+    def increment(self, name: str, value: float = 1, **labels):
+        """Add to a counter."""
+        key = _key(name, labels)
+        with self._lock:
+            self._counters[key] += value
+            self._pending_counters[key] += value
+
+    def observe(self, name: str, value: float, **labels):
+        """Record one observation (e.g. a duration in ms) in a count/sum/max summary."""
+        key = _key(name, labels)
+        with self._lock:
+            _add_observation(self._summaries, key, 1, value, value)
+            _add_observation(self._pending_summaries, key, 1, value, value)
+
+    def drain(self) -> Tuple[Dict[str, float], Dict[str, Dict[str, float]]]:
+        """Take the counter and summary changes since the last drain."""
+        with self._lock:
+            counters, summaries = dict(self._pending_counters), self._pending_summaries
+            self._pending_counters = defaultdict(float)
+            self._pending_summaries = {}
+        return counters, summaries
+
+    def restore(self, counters: Dict[str, float], summaries: Dict[str, Dict[str, float]]):
+        """Put drained changes back, e.g. after they could not be shared."""
+        with self._lock:
+            for key, value in counters.items():
+                self._pending_counters[key] += value
+            for key, summary in summaries.items():
+                _add_observation(self._pending_summaries, key, summary["count"], summary["sum"], summary["max"])
+
+    def pending(self) -> Tuple[Dict[str, float], Dict[str, Dict[str, float]]]:
+        """Changes not drained yet (a copy)."""
+        with self._lock:
+            return dict(self._pending_counters), {key: dict(value) for key, value in self._pending_summaries.items()}
+
+    def counter(self, name: str, **labels) -> float:
+        with self._lock:
+            return self._counters.get(_key(name, labels), 0)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                "counters": dict(self._counters),
+                "summaries": {key: dict(value) for key, value in self._summaries.items()}
+            }
+
+# Singleton instance
+metrics = Metrics()
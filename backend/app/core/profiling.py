@@ -0,0 +1,99 @@
+import os
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+# Frames are labelled "function (file:first line)" so every sample of a
+# function lands on the same node regardless of the line it was on
+_Frame = Tuple[str, str, int]
+
+def _label(frame_key: _Frame) -> str:
+    name, filename, firstlineno = frame_key
+    return f"{name} ({os.path.basename(filename)}:{firstlineno})"
+
+class SamplingProfiler:
+    """
+    Statistical profiler for one thread.
+
+    A daemon thread wakes every `interval` seconds, reads the target thread's
+    current stack from `sys._current_frames()` and counts it. The profiled
+    code is not instrumented, so the cost is the sampler's wake-ups; nothing
+    runs at all unless a profiler is started.
+
+    The generation path runs on the event loop thread, so samples taken while
+    the request is awaiting (e.g. the provider) show whatever else the loop
+    was running. Use the stage timings for wall time per stage and the call
+    tree for where CPU time went.
+    """
+
+    def __init__(self, interval: float, max_depth: int = 64):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.samples = 0
+        self.started = 0.0
+        self.duration = 0.0
+        self._stacks: Dict[Tuple[_Frame, ...], int] = {}
+        self._target: Optional[int] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, thread_id: Optional[int] = None):
+        """Start sampling `thread_id` (the calling thread by default)."""
+        self._target = thread_id or threading.get_ident()
+        self.started = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop sampling (safe to call more than once)."""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self.duration = time.monotonic() - self.started
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None and len(stack) < self.max_depth:
+                code = frame.f_code
+                stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+                frame = frame.f_back
+            key = tuple(reversed(stack))
+            self._stacks[key] = self._stacks.get(key, 0) + 1
+            self.samples += 1
+
+    def collapsed(self) -> Dict[str, int]:
+        """Stacks in collapsed ("a;b;c": count) form, as used by flame graph tools."""
+        return {";".join(_label(frame) for frame in stack): count for stack, count in self._stacks.items()}
+
+    def call_tree(self, min_fraction: float = 0.005) -> Dict:
+        """
+        Samples merged into a call tree of {"frame", "samples", "children"} nodes.
+
+        Subtrees with less than `min_fraction` of all samples are pruned.
+        """
+        root = {"frame": "<root>", "samples": 0, "children": {}}
+        for stack, count in self._stacks.items():
+            node = root
+            node["samples"] += count
+            for frame in stack:
+                node = node["children"].setdefault(frame, {"frame": _label(frame), "samples": 0, "children": {}})
+                node["samples"] += count
+
+        threshold = max(1, int(self.samples * min_fraction))
+
+        def finish(node: Dict) -> Dict:
+            children: List[Dict] = sorted(
+                (finish(child) for child in node["children"].values() if child["samples"] >= threshold),
+                key=lambda child: child["samples"],
+                reverse=True
+            )
+            return {"frame": node["frame"], "samples": node["samples"], "children": children}
+
+        return finish(root)
@@ -31,3 +31,7 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     to_encode.update({"exp": expire})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
+
+def decode_access_token(token: str) -> dict:
+    """Decode and verify a JWT access token. Raises JWTError if invalid or expired."""
+    return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
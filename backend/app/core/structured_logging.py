@@ -0,0 +1,168 @@
+import atexit
+import logging
+import queue
+import random
+import re
+import sys
+import time
+import uuid
+import zlib
+from contextvars import ContextVar
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
+from typing import Iterable, Optional
+import orjson
+from app.core.deadline import current_deadline
+
+# Id of the request (or job) being handled, attached to every log record
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+_REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9._:-]{1,64}$")
+
+# Attributes every LogRecord has; anything else was passed with `extra=`
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "request_id"}
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] %(message)s"
+
+def get_request_id() -> Optional[str]:
+    return request_id_var.get()
+
+class RequestIdFilter(logging.Filter):
+    """Stamp records with the current request id (runs in the caller, where the contextvar is visible)."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep only a fraction of INFO-and-below records from high-volume loggers.
+
+    Records of one request are kept or dropped together (by hashing the
+    request id), so a sampled request still has a complete trail. Warnings
+    and errors always pass.
+    """
+
+    def __init__(self, rate: float, loggers: Iterable[str]):
+        super().__init__()
+        self.threshold = int(max(0.0, min(1.0, rate)) * 0xFFFFFFFF)
+        self.loggers = tuple(loggers)
+
+    def _sampled_logger(self, name: str) -> bool:
+        return any(name == prefix or name.startswith(prefix + ".") for prefix in self.loggers)
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.INFO or not self._sampled_logger(record.name):
+            return True
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            return zlib.crc32(request_id.encode()) <= self.threshold
+        return random.random() * 0xFFFFFFFF <= self.threshold
+
+class LazyQueueHandler(QueueHandler):
+    """
+    QueueHandler that hands records to the listener thread unformatted.
+
+    The stock handler renders the message and traceback in the calling thread;
+    here `msg`/`args` and `exc_info` are queued as they are and only rendered
+    by the listener's formatter. Log arguments should therefore be values that
+    are not mutated after the call (strings, numbers, ids), as usual for %-style
+    logging.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line with the request id and any `extra=` fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.utcfromtimestamp(record.created).isoformat(timespec="milliseconds") + "Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", None)
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return orjson.dumps(entry, default=str).decode()
+
+def setup_logging(level: str, fmt: str, sample_rate: float, sampled_loggers: Iterable[str]) -> QueueListener:
+    """
+    Route all logging through a queue drained by a background thread.
+
+    Callers (including the event loop) only enqueue records; formatting and
+    stream I/O happen in the listener thread.
+    """
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(JSONFormatter() if fmt == "json" else logging.Formatter(TEXT_FORMAT))
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = LazyQueueHandler(log_queue)
+    # Filters run in the calling thread, before the record is queued
+    queue_handler.addFilter(RequestIdFilter())
+    if sample_rate < 1.0:
+        queue_handler.addFilter(SamplingFilter(sample_rate, sampled_loggers))
+
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    root.setLevel(level)
+
+    listener = QueueListener(log_queue, handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+access_logger = logging.getLogger("app.access")
+
+class RequestContextMiddleware:
+    """
+    ASGI middleware that assigns each request an id and logs one access line.
+
+    The id comes from a well-formed `X-Request-ID` header or is generated,
+    and is echoed back in the response. The access line carries the status,
+    duration and, for endpoints with a deadline, the per-stage timings.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        header = dict(scope["headers"]).get(b"x-request-id", b"").decode("latin-1")
+        request_id = header if _REQUEST_ID_PATTERN.match(header) else uuid.uuid4().hex
+        token = request_id_var.set(request_id)
+        started = time.monotonic()
+        status_code = 500
+
+        async def send_with_request_id(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(b"x-request-id", request_id.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            extra = {
+                "method": scope["method"],
+                "path": scope["path"],
+                "status": status_code,
+                "duration_ms": round((time.monotonic() - started) * 1000, 1)
+            }
+            deadline = current_deadline()
+            if deadline is not None:
+                extra["stages_ms"] = deadline.timings_ms()
+            access_logger.info("%s %s %s", scope["method"], scope["path"], status_code, extra=extra)
+            request_id_var.reset(token)
@@ -1,12 +1,43 @@
-from pymongo import MongoClient, DESCENDING
-from pymongo.errors import ConnectionFailure
+from pymongo import MongoClient, DESCENDING, TEXT
+from pymongo.errors import BulkWriteError, ConnectionFailure, DuplicateKeyError, PyMongoError
+from bson import ObjectId
 from datetime import datetime, timedelta
-from typing import List, Optional, Dict
+from typing import List, Optional, Dict, Tuple
 import logging
 from app.core.config import settings
+from app.core.circuit_breaker import CircuitOpenError, get_breaker
+from app.core.deadline import DeadlineExceeded
+from app.services.mermaid_identifiers import build_search_terms
+from app.services.prompt_similarity import index_fields
 
 logger = logging.getLogger(__name__)
 
+DUPLICATE_KEY_ERROR = 11000
+
+# Fields returned by history listings
+HISTORY_PROJECTION = {"prompt": 1, "mermaid_code": 1, "diagram_type": 1, "created_at": 1}
+
+def owner_filter(user_id: Optional[str]) -> Dict:
+    """
+    Query fragment scoping history to one owner.
+
+    Anonymous requests (user_id None) see unowned entries, which also matches
+    legacy rows that were never backfilled with a `user_id`.
+    """
+    return {"user_id": ObjectId(user_id) if user_id else None}
+
+# Grouping keys accepted by `get_usage_stats`
+USAGE_GROUP_FIELDS = {
+    "diagram_type": "$diagram_type",
+    "model": "$usage.model",
+    "provider": "$usage.provider",
+    "user": "$user_id"
+}
+
+def _is_outage(exc: BaseException) -> bool:
+    """Connection-level errors count against the MongoDB breaker; query errors do not."""
+    return isinstance(exc, ConnectionFailure)
+
 class MongoDB:
     """MongoDB connection and operations."""
     
@@ -15,6 +46,13 @@ class MongoDB:
         self.db = None
         self.history_collection = None
         self.users_collection = None
+        self.jobs_collection = None
+        self.profiles_collection = None
+        self.rollups_collection = None
+        self.shared_state_collection = None
+        # Once open, operations fail immediately instead of each waiting out
+        # server selection; methods that degrade to empty results do so at once
+        self.breaker = get_breaker("mongodb", is_failure=_is_outage)
         self.connect()
     
     def connect(self):
@@ -26,44 +64,145 @@ class MongoDB:
             self.db = self.client[settings.MONGODB_DB_NAME]
             self.history_collection = self.db.history
             self.users_collection = self.db.users
+            self.jobs_collection = self.db.jobs
+            self.profiles_collection = self.db.profiles
+            self.rollups_collection = self.db.activity_rollups
+            # Leases and metric totals shared by the worker processes
+            self.shared_state_collection = self.db.shared_state
             
             # Create indexes for better performance
             self.history_collection.create_index([("created_at", DESCENDING)])
             self.history_collection.create_index([("diagram_type", 1)])
+            # Per-owner listings, stats and type filters
+            self.history_collection.create_index([("user_id", 1), ("created_at", DESCENDING)])
+            self.history_collection.create_index([("user_id", 1), ("diagram_type", 1), ("created_at", DESCENDING)])
+            # Near-duplicate prompt lookup (multikey over LSH band keys)
+            self.history_collection.create_index([("user_id", 1), ("diagram_type", 1), ("prompt_bands", 1)])
+            self._create_text_index()
             self.users_collection.create_index([("email", 1)], unique=True)
+            # Job claiming scans queued/expired jobs oldest first; finished jobs expire via TTL
+            self.jobs_collection.create_index([("status", 1), ("created_at", 1)])
+            self.jobs_collection.create_index([("expires_at", 1)], expireAfterSeconds=0)
+            self.profiles_collection.create_index([("expires_at", 1)], expireAfterSeconds=0)
+            # One bucket per (granularity, start); fine-grained buckets expire via TTL
+            self.rollups_collection.create_index([("granularity", 1), ("bucket", 1)], unique=True)
+            self.rollups_collection.create_index([("expires_at", 1)], expireAfterSeconds=0)
             
             logger.info("Successfully connected to MongoDB")
         except ConnectionFailure as e:
             logger.error(f"Failed to connect to MongoDB: {e}")
             raise
     
-    def save_diagram(self, prompt: str, mermaid_code: str, diagram_type: str) -> str:
-        """Save a generated diagram to the database."""
+    def _create_text_index(self):
+        """Create the owner-partitioned text index, replacing the earlier global one."""
+        if "history_text_search" in self.history_collection.index_information():
+            self.history_collection.drop_index("history_text_search")
+        # Only one text index is allowed per collection. The user_id prefix
+        # keeps every search inside a single owner's partition.
+        self.history_collection.create_index(
+            [("user_id", 1), ("prompt", TEXT), ("search_terms", TEXT)],
+            weights={"prompt": 3, "search_terms": 1},
+            name="history_text_search_by_user"
+        )
+    
+    @staticmethod
+    def build_history_entry(
+        prompt: str,
+        mermaid_code: str,
+        diagram_type: str,
+        user_id: Optional[str] = None,
+        provider: Optional[str] = None,
+        usage: Optional[Dict] = None,
+        parent: Optional[Dict] = None,
+        entry_id: Optional[ObjectId] = None,
+        instruction: Optional[str] = None
+    ) -> Dict:
+        """
+        Build a history document with its `_id` assigned up front (`entry_id`, or a new one).
+
+        Edits pass the `parent` entry (as returned by `get_diagram_by_id`) and
+        their `instruction`; the new document links to the parent, gets the
+        next revision number and keeps the root prompt of the chain in `prompt`.
+        """
+        entry = {
+            "_id": entry_id or ObjectId(),
+            "user_id": ObjectId(user_id) if user_id else None,
+            "prompt": prompt,
+            "mermaid_code": mermaid_code,
+            "diagram_type": diagram_type,
+            "search_terms": build_search_terms(mermaid_code),
+            "created_at": datetime.utcnow()
+        }
+        if provider:
+            entry["provider"] = provider
+        if usage:
+            entry["usage"] = usage
+        if parent:
+            entry["parent_id"] = ObjectId(parent["id"])
+            entry["revision"] = parent.get("revision", 1) + 1
+            entry["instruction"] = instruction
+        else:
+            # Edit instructions are not prompts for a whole diagram; only index generations
+            entry.update(index_fields(prompt))
+        return entry
+    
+    def insert_history_entry(self, entry: Dict) -> str:
+        """Insert a document built by `build_history_entry`."""
         try:
-            entry = {
-                "prompt": prompt,
-                "mermaid_code": mermaid_code,
-                "diagram_type": diagram_type,
-                "created_at": datetime.utcnow()
-            }
-            result = self.history_collection.insert_one(entry)
-            logger.info(f"Saved diagram with ID: {result.inserted_id}")
+            with self.breaker:
+                result = self.history_collection.insert_one(entry)
+            logger.info("Saved diagram with ID: %s", result.inserted_id)
             return str(result.inserted_id)
+        except DuplicateKeyError:
+            # Entries with a fixed id may already exist; the caller decides
+            raise
         except Exception as e:
-            logger.error(f"Failed to save diagram: {e}")
+            logger.error("Failed to save diagram: %s", e)
             raise
     
-    def get_history(self, limit: int = 10, diagram_type: Optional[str] = None) -> List[Dict]:
-        """Retrieve diagram history with optional filtering."""
+    def save_diagram(self, prompt: str, mermaid_code: str, diagram_type: str, user_id: Optional[str] = None) -> str:
+        """Save a generated diagram to the database."""
+        return self.insert_history_entry(self.build_history_entry(prompt, mermaid_code, diagram_type, user_id))
+    
+    def insert_history_batch(self, docs: List[Dict]) -> int:
+        """Bulk-insert history documents, skipping ones whose _id already exists. Returns the count inserted."""
         try:
-            query = {}
-            if diagram_type:
-                query["diagram_type"] = diagram_type
-            
-            cursor = self.history_collection.find(query).sort("created_at", DESCENDING).limit(limit)
+            with self.breaker:
+                return len(self.history_collection.insert_many(docs, ordered=False).inserted_ids)
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            if any(err.get("code") != DUPLICATE_KEY_ERROR for err in errors):
+                raise
+            return e.details.get("nInserted", 0)
+    
+    def iter_history(
+        self,
+        limit: int = 10,
+        diagram_type: Optional[str] = None,
+        user_id: Optional[str] = None
+    ) -> List[Dict]:
+        """Return one owner's raw history documents, newest first, fetched in a single batch."""
+        query = owner_filter(user_id)
+        if diagram_type:
+            query["diagram_type"] = diagram_type
+
+        with self.breaker:
+            return list(self.history_collection.find(
+                query, projection=HISTORY_PROJECTION
+            ).sort("created_at", DESCENDING).limit(limit).batch_size(limit))
+
+    def get_history(
+        self,
+        limit: int = 10,
+        diagram_type: Optional[str] = None,
+        user_id: Optional[str] = None
+    ) -> List[Dict]:
+        """Retrieve one owner's diagram history with optional filtering."""
+        try:
+            docs = self.iter_history(limit=limit, diagram_type=diagram_type, user_id=user_id)
             
             history = []
-            for doc in cursor:
+            for doc in docs:
                 history.append({
                     "id": str(doc["_id"]),
                     "prompt": doc["prompt"],
@@ -73,15 +212,96 @@ class MongoDB:
                 })
             
             return history
+        except (CircuitOpenError, DeadlineExceeded):
+            raise
         except Exception as e:
             logger.error(f"Failed to retrieve history: {e}")
             return []
     
-    def get_diagram_by_id(self, diagram_id: str) -> Optional[Dict]:
-        """Get a specific diagram by ID."""
+    def search_history(
+        self,
+        query: str,
+        diagram_type: Optional[str] = None,
+        limit: int = 20,
+        after: Optional[Tuple[float, str]] = None,
+        user_id: Optional[str] = None
+    ) -> List[Dict]:
+        """
+        Ranked full-text search over prompts and extracted diagram identifiers.
+
+        Results are ordered by (text score, _id) descending. `after` is the
+        (score, id) of the last result of the previous page, which makes paging
+        a keyset seek instead of a skip. Raises `ExecutionTimeout` when the
+        query exceeds `SEARCH_MAX_TIME_MS`.
+
+        The text score only exists once a document has matched, so every page
+        still scores all matches of the query; the keyset condition and the
+        bounded sort run on the bare scores, and only the returned page is
+        projected.
+        """
+        match = owner_filter(user_id)
+        match["$text"] = {"$search": query}
+        if diagram_type:
+            match["diagram_type"] = diagram_type
+
+        pipeline = [
+            {"$match": match},
+            {"$addFields": {"score": {"$meta": "textScore"}}},
+        ]
+        if after:
+            last_score, last_id = after
+            pipeline.append({"$match": {"$or": [
+                {"score": {"$lt": last_score}},
+                {"score": last_score, "_id": {"$lt": ObjectId(last_id)}}
+            ]}})
+        # $sort followed by $limit runs as a bounded top-k sort
+        pipeline.append({"$sort": {"score": -1, "_id": -1}})
+        pipeline.append({"$limit": limit})
+        pipeline.append({"$project": dict(HISTORY_PROJECTION, score=1)})
+
+        with self.breaker:
+            return list(self.history_collection.aggregate(pipeline, maxTimeMS=settings.SEARCH_MAX_TIME_MS))
+
+    def get_latest_entry_marker(
+        self,
+        diagram_type: Optional[str] = None,
+        user_id: Optional[str] = None
+    ) -> Optional[Dict]:
+        """
+        Get the id and `created_at` of an owner's newest history entry.
+
+        The (user_id, [diagram_type,] created_at) index finds the entry with a
+        bounded scan; the one document is then fetched, since `_id` is not in
+        the index and `user_id: None` also matches entries without the field.
+        """
+        try:
+            query = owner_filter(user_id)
+            if diagram_type:
+                query["diagram_type"] = diagram_type
+
+            with self.breaker:
+                doc = self.history_collection.find_one(
+                    query,
+                    projection={"created_at": 1},
+                    sort=[("created_at", DESCENDING)]
+                )
+
+            if doc:
+                return {"id": str(doc["_id"]), "created_at": doc["created_at"]}
+            return None
+        except (CircuitOpenError, DeadlineExceeded):
+            raise
+        except Exception as e:
+            logger.error("Failed to get latest history entry: %s", e)
+            return None
+
+    def get_diagram_by_id(self, diagram_id: str, user_id: Optional[str] = None) -> Optional[Dict]:
+        """Get a specific diagram by ID, if it belongs to the owner."""
         try:
-            from bson import ObjectId
-            doc = self.history_collection.find_one({"_id": ObjectId(diagram_id)})
+            query = owner_filter(user_id)
+            query["_id"] = ObjectId(diagram_id)
+            with self.breaker:
+                doc = self.history_collection.find_one(query)
             
             if doc:
                 return {
@@ -89,48 +309,102 @@ class MongoDB:
                     "prompt": doc["prompt"],
                     "mermaid_code": doc["mermaid_code"],
                     "diagram_type": doc.get("diagram_type", "flowchart"),
-                    "created_at": doc["created_at"]
+                    "created_at": doc["created_at"],
+                    "parent_id": str(doc["parent_id"]) if doc.get("parent_id") else None,
+                    "revision": doc.get("revision", 1),
+                    "instruction": doc.get("instruction")
                 }
             return None
+        except (CircuitOpenError, DeadlineExceeded):
+            raise
+        except PyMongoError as e:
+            # A timeout is reported by mongo_timeout as DeadlineExceeded, not as a missing diagram
+            if e.timeout:
+                raise
+            logger.error(f"Failed to get diagram: {e}")
+            return None
         except Exception as e:
             logger.error(f"Failed to get diagram: {e}")
             return None
     
-    def delete_diagram(self, diagram_id: str) -> bool:
-        """Delete a diagram by ID."""
+    def find_similar_prompts(
+        self,
+        prompt_bands: List[str],
+        diagram_type: str,
+        user_id: Optional[str] = None,
+        limit: int = 50
+    ) -> List[Dict]:
+        """Owner's entries of a type sharing at least one LSH band with a prompt, newest first."""
+        query = owner_filter(user_id)
+        query["diagram_type"] = diagram_type
+        query["prompt_bands"] = {"$in": prompt_bands}
+        with self.breaker:
+            return list(
+                self.history_collection.find(
+                    query,
+                    projection={"prompt": 1, "mermaid_code": 1, "created_at": 1, "prompt_minhash": 1}
+                ).sort("created_at", DESCENDING).limit(limit)
+            )
+    
+    def delete_diagram(self, diagram_id: str, user_id: Optional[str] = None) -> bool:
+        """Delete a diagram by ID, if it belongs to the owner."""
         try:
-            from bson import ObjectId
-            result = self.history_collection.delete_one({"_id": ObjectId(diagram_id)})
+            query = owner_filter(user_id)
+            query["_id"] = ObjectId(diagram_id)
+            with self.breaker:
+                result = self.history_collection.delete_one(query)
             return result.deleted_count > 0
+        except (CircuitOpenError, DeadlineExceeded):
+            raise
         except Exception as e:
             logger.error(f"Failed to delete diagram: {e}")
             return False
     
-    def get_stats(self) -> Dict:
-        """Get usage statistics."""
+    def get_stats(self, user_id: Optional[str] = None) -> Dict:
+        """
+        Get usage statistics for one owner.
+
+        Every query is answered from the (user_id, ...) compound indexes, so
+        the cost depends only on this owner's row count.
+        """
         try:
-            total = self.history_collection.count_documents({})
-            
-            # Count by type
-            pipeline = [
-                {"$group": {"_id": "$diagram_type", "count": {"$sum": 1}}},
-                {"$sort": {"count": -1}}
-            ]
-            by_type = {item["_id"]: item["count"] for item in self.history_collection.aggregate(pipeline)}
+            owner = owner_filter(user_id)
+            with self.breaker:
+                total = self.history_collection.count_documents(owner, hint=[("user_id", 1), ("created_at", DESCENDING)])
+                
+                # Count by type: only indexed fields are read, so for a logged-in owner this is a
+                # covered scan. Anonymous callers match `user_id: None`, which also matches entries
+                # without the field, so those documents are fetched
+                pipeline = [
+                    {"$match": owner},
+                    {"$group": {"_id": "$diagram_type", "count": {"$sum": 1}}},
+                    {"$sort": {"count": -1}}
+                ]
+                by_type = {
+                    item["_id"]: item["count"]
+                    for item in self.history_collection.aggregate(
+                        pipeline, hint=[("user_id", 1), ("diagram_type", 1), ("created_at", DESCENDING)]
+                    )
+                }
+                
+                # Recent activity (last 24 hours)
+                yesterday = datetime.utcnow() - timedelta(days=1)
+                recent = self.history_collection.count_documents(
+                    dict(owner, created_at={"$gte": yesterday}),
+                    hint=[("user_id", 1), ("created_at", DESCENDING)]
+                )
             
             # Most popular type
             most_popular = max(by_type, key=by_type.get) if by_type else "flowchart"
             
-            # Recent activity (last 24 hours)
-            yesterday = datetime.utcnow() - timedelta(days=1)
-            recent = self.history_collection.count_documents({"created_at": {"$gte": yesterday}})
-            
             return {
                 "total_diagrams": total,
                 "by_type": by_type,
                 "most_popular_type": most_popular,
                 "recent_activity": recent
             }
+        except (CircuitOpenError, DeadlineExceeded):
+            raise
         except Exception as e:
             logger.error(f"Failed to get stats: {e}")
             return {
@@ -140,11 +414,127 @@ class MongoDB:
                 "recent_activity": 0
             }
 
+    def get_usage_stats(
+        self,
+        group_by: str,
+        user_id: Optional[str] = None,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        all_owners: bool = False
+    ) -> List[Dict]:
+        """
+        Token and cost totals of generations, grouped by `USAGE_GROUP_FIELDS` key.
+
+        Scoped to one owner unless `all_owners` (maintenance scripts only).
+        Entries saved before usage was recorded are ignored.
+        """
+        match = {} if all_owners else owner_filter(user_id)
+        match["usage"] = {"$exists": True}
+        if start or end:
+            match["created_at"] = {}
+            if start:
+                match["created_at"]["$gte"] = start
+            if end:
+                match["created_at"]["$lt"] = end
+
+        pipeline = [
+            {"$match": match},
+            {"$group": {
+                "_id": USAGE_GROUP_FIELDS[group_by],
+                "generations": {"$sum": 1},
+                "prompt_tokens": {"$sum": "$usage.prompt_tokens"},
+                "completion_tokens": {"$sum": "$usage.completion_tokens"},
+                "total_tokens": {"$sum": "$usage.total_tokens"},
+                "avg_template_overhead_tokens": {"$avg": "$usage.template_overhead_tokens"},
+                "avg_tokens_per_second": {"$avg": "$usage.tokens_per_second"},
+                "avg_duration_ms": {"$avg": "$usage.duration_ms"},
+                "cost_usd": {"$sum": "$usage.cost_usd"}
+            }},
+            {"$sort": {"total_tokens": -1}}
+        ]
+        with self.breaker:
+            groups = list(self.history_collection.aggregate(pipeline))
+
+        for group in groups:
+            key = group.pop("_id")
+            group["key"] = str(key) if key is not None else None
+        return groups
+
+    def get_route_stats(
+        self,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        diagram_type: Optional[str] = None
+    ) -> List[Dict]:
+        """
+        Latency, validation rate and cost per (diagram type, provider, model) route, across all owners.
+
+        Only generations saved since routes were tracked (with `usage.valid`) count.
+        """
+        match: Dict = {"usage.valid": {"$exists": True}}
+        if diagram_type:
+            match["diagram_type"] = diagram_type
+        if start or end:
+            match["created_at"] = {}
+            if start:
+                match["created_at"]["$gte"] = start
+            if end:
+                match["created_at"]["$lt"] = end
+
+        pipeline = [
+            {"$match": match},
+            {"$group": {
+                "_id": {"diagram_type": "$diagram_type", "provider": "$usage.provider", "model": "$usage.model"},
+                "generations": {"$sum": 1},
+                "valid": {"$sum": {"$cond": ["$usage.valid", 1, 0]}},
+                "explored": {"$sum": {"$cond": ["$usage.explored", 1, 0]}},
+                "avg_duration_ms": {"$avg": "$usage.duration_ms"},
+                "max_duration_ms": {"$max": "$usage.duration_ms"},
+                "avg_completion_tokens": {"$avg": "$usage.completion_tokens"},
+                "cost_usd": {"$sum": "$usage.cost_usd"}
+            }},
+            {"$sort": {"_id.diagram_type": 1, "avg_duration_ms": 1}}
+        ]
+        with self.breaker:
+            groups = list(self.history_collection.aggregate(pipeline))
+
+        for group in groups:
+            group.update(group.pop("_id"))
+            group["valid_rate"] = round(group.pop("valid") / group["generations"], 3)
+            for field in ("avg_duration_ms", "avg_completion_tokens"):
+                if group[field] is not None:
+                    group[field] = round(group[field], 1)
+        return groups
+
+    # Profile Operations
+    def save_profile(self, profile: Dict) -> str:
+        """Store a request profile; it expires after `PROFILE_TTL_DAYS`."""
+        profile["expires_at"] = datetime.utcnow() + timedelta(days=settings.PROFILE_TTL_DAYS)
+        with self.breaker:
+            return str(self.profiles_collection.insert_one(profile).inserted_id)
+
+    def get_profile(self, profile_id: str, user_id: Optional[str] = None) -> Optional[Dict]:
+        """Get a stored profile, if it belongs to the owner."""
+        try:
+            query = owner_filter(user_id)
+            query["_id"] = ObjectId(profile_id)
+            with self.breaker:
+                doc = self.profiles_collection.find_one(query, projection={"user_id": 0, "expires_at": 0})
+            if doc:
+                doc["id"] = str(doc.pop("_id"))
+            return doc
+        except (CircuitOpenError, DeadlineExceeded):
+            raise
+        except Exception as e:
+            logger.error("Failed to get profile: %s", e)
+            return None
+
     # User Operations
     def create_user(self, user_data: dict) -> str:
         """Create a new user."""
         try:
-            result = self.users_collection.insert_one(user_data)
+            with self.breaker:
+                result = self.users_collection.insert_one(user_data)
             return str(result.inserted_id)
         except Exception as e:
             logger.error(f"Failed to create user: {e}")
@@ -153,18 +543,22 @@ class MongoDB:
     def get_user_by_email(self, email: str) -> Optional[dict]:
         """Get user by email."""
         try:
-            user = self.users_collection.find_one({"email": email})
+            with self.breaker:
+                user = self.users_collection.find_one({"email": email})
             if user:
                 user["id"] = str(user["_id"])
             return user
+        except (CircuitOpenError, DeadlineExceeded):
+            raise
         except Exception as e:
             logger.error(f"Failed to get user by email: {e}")
             return None
     
     def check_health(self) -> bool:
-        """Check if MongoDB is accessible."""
+        """Check if MongoDB is accessible (bypasses the breaker, but a successful ping closes it)."""
         try:
             self.client.admin.command('ping')
+            self.breaker.record_success()
             return True
         except:
             return False
@@ -0,0 +1,10 @@
+from bson import json_util
+from typing import Dict
+
+def encode_document(doc: Dict) -> bytes:
+    """Encode a MongoDB document as one NDJSON line (Extended JSON, keeps ObjectIds and dates)."""
+    return json_util.dumps(doc).encode("utf-8") + b"\n"
+
+def decode_line(line: bytes) -> Dict:
+    """Decode one NDJSON line produced by `encode_document`."""
+    return json_util.loads(line)
@@ -1,14 +1,26 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from app.core.config import settings
-from app.api.routes import diagrams, history, health, auth
+from app.core.deadline import DeadlineExceeded
+from app.core.circuit_breaker import CircuitOpenError
+from app.core.structured_logging import setup_logging, RequestContextMiddleware
+from app.api.routes import diagrams, history, health, auth, legacy
+from app.services.archival import history_archiver
+from app.services.history_writer import history_writer
+from app.services.job_queue import job_worker_pool
+from app.services.llm_service import llm_service
+from app.services.shared_state import shared_state
+import asyncio
 import logging
 from contextlib import asynccontextmanager
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+# Configure logging (non-blocking: handlers run in a listener thread)
+setup_logging(
+    settings.LOG_LEVEL,
+    settings.LOG_FORMAT,
+    settings.LOG_INFO_SAMPLE_RATE,
+    settings.LOG_SAMPLED_LOGGERS
 )
 
 logger = logging.getLogger(__name__)
@@ -19,9 +31,46 @@ async def lifespan(app: FastAPI):
     # Startup
     logger.info(f"Starting {settings.PROJECT_NAME} v{settings.VERSION}")
     logger.info(f"API available at {settings.API_V1_PREFIX}")
+    
+    if settings.JOB_WORKERS > 0:
+        job_worker_pool.start(settings.JOB_WORKERS)
+    
+    background_tasks = []
+    if llm_service.ollama_models():
+        if settings.OLLAMA_WARMUP_ON_STARTUP:
+            background_tasks.append(asyncio.create_task(llm_service.warm_up()))
+        if settings.OLLAMA_KEEPWARM_INTERVAL_SECONDS > 0:
+            background_tasks.append(asyncio.create_task(
+                llm_service.keep_warm(settings.OLLAMA_KEEPWARM_INTERVAL_SECONDS)
+            ))
+    background_tasks.append(asyncio.create_task(
+        history_writer.run_periodically(settings.HISTORY_FLUSH_INTERVAL_SECONDS)
+    ))
+    if settings.HISTORY_SWEEP_INTERVAL_SECONDS > 0:
+        background_tasks.append(asyncio.create_task(
+            history_archiver.run_periodically(settings.HISTORY_SWEEP_INTERVAL_SECONDS)
+        ))
+    if settings.SHARED_METRICS_FLUSH_SECONDS > 0:
+        background_tasks.append(asyncio.create_task(
+            shared_state.share_metrics_periodically(settings.SHARED_METRICS_FLUSH_SECONDS)
+        ))
+    
     yield
     # Shutdown
     logger.info("Shutting down application")
+    for task in background_tasks:
+        task.cancel()
+    await job_worker_pool.stop()
+    await llm_service.aclose()
+    if history_writer.pending_count:
+        # Last chance for history writes deferred during an outage
+        await asyncio.to_thread(history_writer.flush)
+        if history_writer.pending_count:
+            logger.error("Discarding %s unsaved history entries", history_writer.pending_count)
+    # Hand this worker's metrics and leases over before it exits
+    await asyncio.to_thread(shared_state.flush_metrics)
+    for lease in ("history_sweep", "ollama_keep_warm"):
+        await asyncio.to_thread(shared_state.release_lease, lease)
 
 # Create FastAPI app
 app = FastAPI(
@@ -38,13 +87,39 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Request-ID", "X-Profile-Id", "Server-Timing"],
 )
 
+# Request ids and access log (outermost, so CORS responses are logged too)
+app.add_middleware(RequestContextMiddleware)
+
+@app.exception_handler(DeadlineExceeded)
+async def deadline_exceeded_handler(request: Request, exc: DeadlineExceeded):
+    """Report an exhausted request deadline as 504 with per-stage timings."""
+    timings = exc.deadline.timings_ms()
+    logger.warning("%s: %s (stages: %s)", request.url.path, exc, timings)
+    return JSONResponse(
+        status_code=504,
+        content={"detail": str(exc), "stage": exc.stage, "timings_ms": timings},
+        headers={"Server-Timing": exc.deadline.server_timing()}
+    )
+
+@app.exception_handler(CircuitOpenError)
+async def circuit_open_handler(request: Request, exc: CircuitOpenError):
+    """Fail fast with 503 while a dependency's circuit is open."""
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc), "dependency": exc.breaker.name},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
 # Include routers
 app.include_router(diagrams.router, prefix=settings.API_V1_PREFIX)
 app.include_router(history.router, prefix=settings.API_V1_PREFIX)
 app.include_router(health.router, prefix=settings.API_V1_PREFIX)
 app.include_router(auth.router, prefix=settings.API_V1_PREFIX)
+# Unprefixed routes of the original backend (main.py)
+app.include_router(legacy.router)
 
 if __name__ == "__main__":
     import uvicorn
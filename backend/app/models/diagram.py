@@ -1,12 +1,13 @@
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import Dict, Optional
 from datetime import datetime
-from app.models.enums import DiagramType
+from app.models.enums import DiagramType, JobStatus
 
 class DiagramRequest(BaseModel):
     """Request model for diagram generation."""
     prompt: str = Field(..., min_length=1, max_length=2000, description="Natural language description of the diagram")
     diagram_type: DiagramType = Field(default=DiagramType.FLOWCHART, description="Type of diagram to generate")
+    allow_reuse: bool = Field(default=True, description="Allow returning an earlier diagram for a near-duplicate prompt (DUPLICATE_MODE=auto)")
     
     class Config:
         json_schema_extra = {
@@ -16,6 +17,13 @@ class DiagramRequest(BaseModel):
             }
         }
 
+class SimilarDiagram(BaseModel):
+    """An earlier diagram whose prompt is a near-duplicate of the request's."""
+    id: str = Field(..., description="History entry id")
+    prompt: str = Field(..., description="Its prompt")
+    similarity: float = Field(..., description="Estimated similarity of the prompts (0-1)")
+    created_at: datetime = Field(..., description="When it was generated")
+
 class DiagramResponse(BaseModel):
     """Response model for generated diagram."""
     id: str = Field(..., description="Unique identifier for the diagram")
@@ -23,6 +31,8 @@ class DiagramResponse(BaseModel):
     diagram_type: str = Field(..., description="Type of diagram generated")
     prompt: str = Field(..., description="Original prompt used")
     created_at: datetime = Field(..., description="Timestamp of creation")
+    reused: bool = Field(False, description="True if this is an earlier diagram returned for a near-duplicate prompt")
+    similar: Optional[SimilarDiagram] = Field(None, description="Closest earlier diagram above DUPLICATE_THRESHOLD, if any")
     
     class Config:
         json_schema_extra = {
@@ -35,6 +45,38 @@ class DiagramResponse(BaseModel):
             }
         }
 
+class DiagramEditRequest(BaseModel):
+    """Request model for editing an existing diagram."""
+    instruction: str = Field(..., min_length=1, max_length=2000, description="Change to make, e.g. 'rename Login to Sign in'")
+    
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "instruction": "Add a 'Forgot password' step after Login"
+            }
+        }
+
+class DiagramEditResponse(DiagramResponse):
+    """Response model for an edit, stored as a new revision of its parent."""
+    parent_id: str = Field(..., description="Entry that was edited")
+    instruction: str = Field(..., description="Edit instruction applied; `prompt` is the root prompt of the chain")
+    revision: int = Field(..., description="Revision number of the new entry")
+    edit_mode: str = Field(..., description="'patch' if the model sent changed lines, 'full' if it sent the whole diagram")
+    total_tokens: int = Field(..., description="Tokens the edit took")
+    tokens_saved: int = Field(..., description="Estimated tokens saved against regenerating from scratch")
+
+class DiagramJobResponse(BaseModel):
+    """State of an asynchronous generation job."""
+    id: str = Field(..., description="Job identifier")
+    status: JobStatus = Field(..., description="Current job state")
+    diagram_type: str = Field(..., description="Type of diagram requested")
+    prompt: str = Field(..., description="Original prompt used")
+    result: Optional[DiagramResponse] = Field(None, description="Generated diagram once the job succeeded")
+    error: Optional[str] = Field(None, description="Failure reason once the job failed")
+    attempts: int = Field(0, description="Number of times a worker picked up the job")
+    created_at: datetime = Field(..., description="Timestamp the job was submitted")
+    updated_at: datetime = Field(..., description="Timestamp of the last state change")
+
 class DiagramTypeInfo(BaseModel):
     """Information about a diagram type."""
     type: str = Field(..., description="Diagram type identifier")
@@ -48,4 +90,6 @@ class HealthResponse(BaseModel):
     status: str = Field(..., description="Overall health status")
     mongodb: str = Field(..., description="MongoDB connection status")
     ollama: str = Field(..., description="Ollama service status")
+    circuit_breakers: Dict[str, str] = Field(default={}, description="State of each dependency's circuit breaker")
+    pending_history_writes: int = Field(default=0, description="History entries waiting for MongoDB to recover")
     timestamp: datetime = Field(..., description="Health check timestamp")
@@ -17,35 +17,19 @@ class DiagramType(str, Enum):
     @classmethod
     def get_description(cls, diagram_type: str) -> str:
         """Get human-readable description for each diagram type."""
-        descriptions = {
-            cls.FLOWCHART: "Flowcharts and process diagrams",
-            cls.SEQUENCE: "Sequence diagrams for interactions",
-            cls.ER_DIAGRAM: "Entity Relationship diagrams for databases",
-            cls.CLASS_DIAGRAM: "Class diagrams for OOP structures",
-            cls.STATE_DIAGRAM: "State diagrams for state machines",
-            cls.MINDMAP: "Mindmaps for brainstorming and organization",
-            cls.GANTT: "Gantt charts for project timelines",
-            cls.PIE_CHART: "Pie charts for data visualization",
-            cls.USER_JOURNEY: "User journey maps for UX flows",
-            cls.GIT_GRAPH: "Git workflow and branching diagrams",
-            cls.TIKZ: "Professional LaTeX/TikZ diagrams (for Overleaf)",
-        }
-        return descriptions.get(diagram_type, "Unknown diagram type")
+        from app.services.diagram_registry import diagram_registry
+        spec = diagram_registry.lookup(diagram_type)
+        return spec.description if spec else "Unknown diagram type"
 
     @classmethod
     def get_mermaid_prefix(cls, diagram_type: str) -> str:
         """Get the Mermaid syntax prefix for each diagram type."""
-        prefixes = {
-            cls.FLOWCHART: "graph TD",
-            cls.SEQUENCE: "sequenceDiagram",
-            cls.ER_DIAGRAM: "erDiagram",
-            cls.CLASS_DIAGRAM: "classDiagram",
-            cls.STATE_DIAGRAM: "stateDiagram-v2",
-            cls.MINDMAP: "mindmap",
-            cls.GANTT: "gantt",
-            cls.PIE_CHART: "pie",
-            cls.USER_JOURNEY: "journey",
-            cls.GIT_GRAPH: "gitGraph",
-            cls.TIKZ: "\\documentclass{standalone}",
-        }
-        return prefixes.get(diagram_type, "graph TD")
+        from app.services.diagram_registry import diagram_registry
+        return diagram_registry.get(diagram_type).mermaid_prefix
+
+class JobStatus(str, Enum):
+    """Lifecycle states of an asynchronous generation job."""
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
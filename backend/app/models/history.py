@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import List
+from typing import Dict, List
 from datetime import datetime
 
 class HistoryItem(BaseModel):
@@ -9,6 +9,9 @@ class HistoryItem(BaseModel):
     diagram_type: str = Field(..., description="Type of diagram")
     mermaid_code: str = Field(..., description="Generated Mermaid code")
     created_at: datetime = Field(..., description="Creation timestamp")
+    parent_id: str | None = Field(None, description="Entry this one is an edit of")
+    revision: int = Field(1, description="1 for generated diagrams, +1 for every edit")
+    instruction: str | None = Field(None, description="Edit instruction, for edits (`prompt` is then the root prompt)")
 
 class HistoryResponse(BaseModel):
     """Response model for history endpoint."""
@@ -17,9 +20,81 @@ class HistoryResponse(BaseModel):
     limit: int = Field(..., description="Limit applied")
     diagram_type_filter: str | None = Field(None, description="Filter applied by diagram type")
 
+class HistorySearchItem(HistoryItem):
+    """History item matched by a search query."""
+    score: float = Field(..., description="Text relevance score")
+
+class HistorySearchResponse(BaseModel):
+    """Response model for history search."""
+    results: List[HistorySearchItem] = Field(..., description="Matches ordered by relevance")
+    query: str = Field(..., description="Search query")
+    diagram_type_filter: str | None = Field(None, description="Filter applied by diagram type")
+    next_cursor: str | None = Field(None, description="Cursor for the next page, if there is one")
+
+class HistoryImportResponse(BaseModel):
+    """Result of a history import."""
+    inserted: int = Field(..., description="Entries inserted")
+    skipped: int = Field(..., description="Entries skipped because they already exist")
+
 class StatsResponse(BaseModel):
     """Statistics response."""
     total_diagrams: int = Field(..., description="Total diagrams generated")
     by_type: dict = Field(..., description="Count by diagram type")
     most_popular_type: str = Field(..., description="Most used diagram type")
     recent_activity: int = Field(..., description="Diagrams generated in last 24h")
+
+class TimeseriesPoint(BaseModel):
+    """Generation counts for one time bucket."""
+    bucket: datetime = Field(..., description="Bucket start (UTC)")
+    total: int = Field(..., description="Generations in the bucket (after filters)")
+    by_type: Dict[str, int] = Field(..., description="Count by diagram type")
+    by_provider: Dict[str, int] = Field(..., description="Count by LLM provider")
+
+class TimeseriesResponse(BaseModel):
+    """Activity time series."""
+    granularity: str = Field(..., description="Bucket size: minute, hour or day")
+    start: datetime = Field(..., description="Range start (inclusive)")
+    end: datetime = Field(..., description="Range end (exclusive)")
+    points: List[TimeseriesPoint] = Field(..., description="One point per bucket, oldest first")
+
+class UsageGroup(BaseModel):
+    """Token and cost totals for one group of generations."""
+    key: str | None = Field(None, description="Group value (diagram type, model or provider)")
+    generations: int = Field(..., description="Generations with usage recorded")
+    prompt_tokens: int = Field(..., description="Prompt tokens, including template overhead")
+    completion_tokens: int = Field(..., description="Completion tokens")
+    total_tokens: int = Field(..., description="Prompt plus completion tokens")
+    avg_template_overhead_tokens: float | None = Field(None, description="Estimated prompt tokens added by the template")
+    avg_tokens_per_second: float | None = Field(None, description="Average generation speed")
+    avg_duration_ms: float | None = Field(None, description="Average provider call time")
+    cost_usd: float = Field(..., description="Cost of priced models (see MODEL_PRICES)")
+
+class RouteStats(BaseModel):
+    """Outcome of the generations of one diagram type on one provider/model."""
+    diagram_type: str = Field(..., description="Diagram type")
+    provider: str | None = Field(None, description="LLM provider")
+    model: str | None = Field(None, description="Model")
+    primary: bool = Field(..., description="Whether this is the type's current route")
+    generations: int = Field(..., description="Generations on this route")
+    explored: int = Field(..., description="Generations sent here by route exploration")
+    valid_rate: float = Field(..., description="Share of outputs that validated (the rest fell back)")
+    avg_duration_ms: float | None = Field(None, description="Average provider call time")
+    max_duration_ms: float | None = Field(None, description="Slowest provider call")
+    avg_completion_tokens: float | None = Field(None, description="Average completion size")
+    cost_usd: float = Field(..., description="Cost of priced models (see MODEL_PRICES)")
+
+class SpeculationState(BaseModel):
+    """Adaptive sampling state of one speculative diagram type."""
+    failure_rate: float = Field(..., description="Smoothed share of samples that failed validation")
+    samples: int = Field(..., description="Concurrent samples currently requested")
+
+class RouteStatsResponse(BaseModel):
+    """Per-route comparison for choosing `MODEL_ROUTES`."""
+    explore_rate: float = Field(..., description="Share of generations sent to candidate routes")
+    speculation: Dict[str, SpeculationState] = Field(default_factory=dict, description="Failure rate and current sample count of each SPECULATIVE_TYPES entry")
+    routes: List[RouteStats] = Field(..., description="Routes by diagram type, fastest first")
+
+class UsageStatsResponse(BaseModel):
+    """Usage accounting grouped by one dimension."""
+    group_by: str = Field(..., description="Grouping dimension")
+    groups: List[UsageGroup] = Field(..., description="Groups, most tokens first")
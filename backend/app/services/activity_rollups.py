@@ -0,0 +1,160 @@
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+from pymongo import UpdateOne
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.db.mongodb import mongodb
+
+logger = logging.getLogger(__name__)
+
+GRANULARITIES = ("minute", "hour", "day")
+
+_STEPS = {
+    "minute": timedelta(minutes=1),
+    "hour": timedelta(hours=1),
+    "day": timedelta(days=1),
+}
+
+def bucket_start(at: datetime, granularity: str) -> datetime:
+    """Truncate a timestamp to the start of its bucket."""
+    at = at.replace(second=0, microsecond=0)
+    if granularity in ("hour", "day"):
+        at = at.replace(minute=0)
+    if granularity == "day":
+        at = at.replace(hour=0)
+    return at
+
+def _retention(granularity: str) -> Optional[timedelta]:
+    """How long buckets of a granularity are kept (None = forever)."""
+    if granularity == "minute" and settings.ROLLUP_MINUTE_RETENTION_HOURS > 0:
+        return timedelta(hours=settings.ROLLUP_MINUTE_RETENTION_HOURS)
+    if granularity == "hour" and settings.ROLLUP_HOUR_RETENTION_DAYS > 0:
+        return timedelta(days=settings.ROLLUP_HOUR_RETENTION_DAYS)
+    return None
+
+class ActivityRollups:
+    """
+    Generation counts pre-aggregated into minute, hour and day buckets.
+
+    Every generation increments one document per granularity in
+    `activity_rollups` ({granularity, bucket, total, counts.<provider>.<type>}),
+    in a single bulk write. Old fine-grained buckets expire through a TTL
+    index while the coarser ones remain, so long ranges are served from hour
+    or day buckets and a range is always one indexed read.
+    """
+
+    def _upsert(self, at: datetime, counts: Dict[Tuple[str, str], int], replace: bool = False) -> List[UpdateOne]:
+        operations = []
+        total = sum(counts.values())
+        for granularity in GRANULARITIES:
+            bucket = bucket_start(at, granularity)
+            retention = _retention(granularity)
+            on_insert = {"expires_at": bucket + retention} if retention else {}
+            if replace:
+                nested: Dict[str, Dict[str, int]] = defaultdict(dict)
+                for (provider, diagram_type), n in counts.items():
+                    nested[provider][diagram_type] = n
+                update = {"$set": dict(on_insert, counts=dict(nested), total=total)}
+            else:
+                fields = {f"counts.{provider}.{diagram_type}": n for (provider, diagram_type), n in counts.items()}
+                fields["total"] = total
+                update = {"$inc": fields}
+                if on_insert:
+                    update["$setOnInsert"] = on_insert
+            operations.append(UpdateOne({"granularity": granularity, "bucket": bucket}, update, upsert=True))
+        return operations
+
+    def record(self, diagram_type: str, provider: str, at: Optional[datetime] = None):
+        """Count one generation. Failures are logged, never raised to the caller."""
+        try:
+            with mongodb.breaker:
+                mongodb.rollups_collection.bulk_write(
+                    self._upsert(at or datetime.utcnow(), {(provider, diagram_type): 1}),
+                    ordered=False
+                )
+        except Exception as e:
+            metrics.increment("rollup_write_failures")
+            logger.warning("Failed to update activity rollups: %s", e)
+
+    def timeseries(
+        self,
+        granularity: str,
+        start: datetime,
+        end: datetime,
+        diagram_type: Optional[str] = None,
+        provider: Optional[str] = None
+    ) -> List[Dict]:
+        """
+        Counts per bucket in [start, end), with empty buckets filled in.
+
+        Each point has `total` (after filters), `by_type` and `by_provider`.
+        """
+        first = bucket_start(start, granularity)
+        with mongodb.breaker:
+            docs = {
+                doc["bucket"]: doc
+                for doc in mongodb.rollups_collection.find(
+                    {"granularity": granularity, "bucket": {"$gte": first, "$lt": end}},
+                    projection={"_id": 0, "bucket": 1, "counts": 1}
+                ).sort("bucket", 1)
+            }
+
+        points = []
+        bucket = first
+        step = _STEPS[granularity]
+        while bucket < end:
+            by_type: Dict[str, int] = defaultdict(int)
+            by_provider: Dict[str, int] = defaultdict(int)
+            counts = docs.get(bucket, {}).get("counts", {})
+            for provider_name, types in counts.items():
+                if provider and provider_name != provider:
+                    continue
+                for type_name, n in types.items():
+                    if diagram_type and type_name != diagram_type:
+                        continue
+                    by_type[type_name] += n
+                    by_provider[provider_name] += n
+            points.append({
+                "bucket": bucket,
+                "total": sum(by_type.values()),
+                "by_type": dict(by_type),
+                "by_provider": dict(by_provider)
+            })
+            bucket += step
+        return points
+
+    def rebuild(self, entries: Iterable[Dict], batch_size: int = 500) -> int:
+        """
+        Recompute buckets from history documents ({diagram_type, created_at, provider?}).
+
+        Buckets that receive data are overwritten; the minute tier is only
+        rebuilt within its retention window. Returns the number of buckets written.
+        """
+        minute_retention = _retention("minute")
+        minute_cutoff = datetime.utcnow() - minute_retention if minute_retention else datetime.min
+        per_minute: Dict[datetime, Dict[Tuple[str, str], int]] = defaultdict(lambda: defaultdict(int))
+        per_hour: Dict[datetime, Dict[Tuple[str, str], int]] = defaultdict(lambda: defaultdict(int))
+        per_day: Dict[datetime, Dict[Tuple[str, str], int]] = defaultdict(lambda: defaultdict(int))
+        for entry in entries:
+            key = (entry.get("provider") or "unknown", entry.get("diagram_type") or "flowchart")
+            at = entry["created_at"]
+            if at >= minute_cutoff:
+                per_minute[bucket_start(at, "minute")][key] += 1
+            per_hour[bucket_start(at, "hour")][key] += 1
+            per_day[bucket_start(at, "day")][key] += 1
+
+        operations = []
+        for granularity, buckets in (("minute", per_minute), ("hour", per_hour), ("day", per_day)):
+            for bucket, counts in buckets.items():
+                # _upsert emits all tiers; keep only the one being rebuilt
+                operation = self._upsert(bucket, counts, replace=True)[GRANULARITIES.index(granularity)]
+                operations.append(operation)
+
+        for i in range(0, len(operations), batch_size):
+            mongodb.rollups_collection.bulk_write(operations[i:i + batch_size], ordered=False)
+        return len(operations)
+
+# Singleton instance
+activity_rollups = ActivityRollups()
@@ -0,0 +1,151 @@
+import asyncio
+import gzip
+import logging
+import os
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterator, List, Optional
+from app.core.config import settings
+from app.db.mongodb import mongodb
+from app.db.ndjson import encode_document, decode_line
+from app.services.shared_state import shared_state
+
+logger = logging.getLogger(__name__)
+
+class HistoryArchiver:
+    """
+    Moves history entries past their retention window to compressed archives.
+
+    Archives are gzip NDJSON files partitioned by creation date:
+    `<HISTORY_ARCHIVE_DIR>/YYYY/MM/history-YYYY-MM-DD.ndjson.gz`. Documents are
+    streamed in batches of `HISTORY_ARCHIVE_BATCH_SIZE`, and each batch is
+    deleted from MongoDB only after it has been written to disk.
+
+    Restored entries carry `restored_at` and are left alone by the sweep for
+    `HISTORY_RESTORE_HOLD_DAYS`. When they do expire again they are deleted
+    without being written a second time, since their archive lines still exist.
+    """
+
+    def __init__(self, archive_dir: Optional[str] = None, batch_size: Optional[int] = None):
+        self.archive_dir = archive_dir or settings.HISTORY_ARCHIVE_DIR
+        self.batch_size = batch_size or settings.HISTORY_ARCHIVE_BATCH_SIZE
+
+    def retention_queries(self, now: Optional[datetime] = None) -> List[Dict]:
+        """Build one query per retention window: each overridden type, then everything else."""
+        now = now or datetime.utcnow()
+        overrides = settings.HISTORY_RETENTION_BY_TYPE
+        # Matches entries never restored, and ones whose hold has run out
+        not_held = {"$not": {"$gte": now - timedelta(days=settings.HISTORY_RESTORE_HOLD_DAYS)}}
+        queries = []
+
+        for diagram_type, days in overrides.items():
+            if days > 0:
+                queries.append({
+                    "diagram_type": diagram_type,
+                    "created_at": {"$lt": now - timedelta(days=days)},
+                    "restored_at": not_held
+                })
+
+        if settings.HISTORY_RETENTION_DAYS > 0:
+            query = {
+                "created_at": {"$lt": now - timedelta(days=settings.HISTORY_RETENTION_DAYS)},
+                "restored_at": not_held
+            }
+            if overrides:
+                query["diagram_type"] = {"$nin": list(overrides)}
+            queries.append(query)
+
+        return queries
+
+    def partition_path(self, day: date) -> str:
+        """Path of the archive file holding entries created on `day`."""
+        return os.path.join(
+            self.archive_dir, f"{day:%Y}", f"{day:%m}", f"history-{day:%Y-%m-%d}.ndjson.gz"
+        )
+
+    def _write_batch(self, docs: List[Dict]):
+        """Append a batch to its date partitions. Each append adds a gzip member."""
+        if not docs:
+            return
+        by_day: Dict[date, List[bytes]] = {}
+        for doc in docs:
+            by_day.setdefault(doc["created_at"].date(), []).append(encode_document(doc))
+
+        for day, lines in by_day.items():
+            path = self.partition_path(day)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with gzip.open(path, "ab") as f:
+                f.writelines(lines)
+
+    def sweep(self, now: Optional[datetime] = None) -> int:
+        """Archive and delete every entry past its retention window. Returns the count moved."""
+        archived = 0
+        for query in self.retention_queries(now):
+            while True:
+                batch = list(
+                    mongodb.history_collection.find(query)
+                    .sort("created_at", 1)
+                    .limit(self.batch_size)
+                )
+                if not batch:
+                    break
+
+                self._write_batch([doc for doc in batch if "restored_at" not in doc])
+                ids = [doc["_id"] for doc in batch]
+                mongodb.history_collection.delete_many({"_id": {"$in": ids}})
+                archived += len(batch)
+
+        if archived:
+            logger.info("Archived %s history entries to %s", archived, self.archive_dir)
+        return archived
+
+    def iter_archived(self, start: date, end: date) -> Iterator[Dict]:
+        """Stream archived documents created between `start` and `end` (inclusive)."""
+        day = start
+        while day <= end:
+            path = self.partition_path(day)
+            if os.path.exists(path):
+                with gzip.open(path, "rb") as f:
+                    for line in f:
+                        if line.strip():
+                            yield decode_line(line)
+            day += timedelta(days=1)
+
+    def restore(self, start: date, end: date) -> int:
+        """
+        Re-import archived entries for a date range, skipping ones already present.
+
+        Restored entries are marked with `restored_at`, which keeps the sweep
+        off them for `HISTORY_RESTORE_HOLD_DAYS`.
+        """
+        restored_at = datetime.utcnow()
+        restored = 0
+        batch = []
+        for doc in self.iter_archived(start, end):
+            doc["restored_at"] = restored_at
+            batch.append(doc)
+            if len(batch) >= self.batch_size:
+                restored += mongodb.insert_history_batch(batch)
+                batch = []
+        if batch:
+            restored += mongodb.insert_history_batch(batch)
+
+        logger.info("Restored %s history entries from %s to %s", restored, start, end)
+        return restored
+
+    async def run_periodically(self, interval_seconds: int):
+        """
+        Run `sweep` every `interval_seconds` in a worker thread until cancelled.
+
+        With several worker processes only the holder of the "history_sweep"
+        lease sweeps; if MongoDB cannot be asked, nobody does.
+        """
+        while True:
+            try:
+                if await asyncio.to_thread(shared_state.acquire_lease, "history_sweep", 2 * interval_seconds):
+                    await asyncio.to_thread(self.sweep)
+            except Exception as e:
+                logger.error("History retention sweep failed: %s", e)
+            await asyncio.sleep(interval_seconds)
+
+# Singleton instance
+history_archiver = HistoryArchiver()
@@ -0,0 +1,189 @@
+import json
+import re
+from typing import Callable, Dict, Optional, Pattern, Tuple
+from app.models.enums import DiagramType
+from app.models.diagram import DiagramTypeInfo
+from app.services.prompt_templates import PromptTemplates
+from app.core.http_cache import strong_etag
+
+# Static per-type tables. They are only read while the registry is built.
+_DESCRIPTIONS = {
+    DiagramType.FLOWCHART: "Flowcharts and process diagrams",
+    DiagramType.SEQUENCE: "Sequence diagrams for interactions",
+    DiagramType.ER_DIAGRAM: "Entity Relationship diagrams for databases",
+    DiagramType.CLASS_DIAGRAM: "Class diagrams for OOP structures",
+    DiagramType.STATE_DIAGRAM: "State diagrams for state machines",
+    DiagramType.MINDMAP: "Mindmaps for brainstorming and organization",
+    DiagramType.GANTT: "Gantt charts for project timelines",
+    DiagramType.PIE_CHART: "Pie charts for data visualization",
+    DiagramType.USER_JOURNEY: "User journey maps for UX flows",
+    DiagramType.GIT_GRAPH: "Git workflow and branching diagrams",
+    DiagramType.TIKZ: "Professional LaTeX/TikZ diagrams (for Overleaf)",
+}
+
+# Leading `---` block with diagram config such as `title:` (Mermaid 9.4+)
+_FRONTMATTER = re.compile(r"\A\s*---[ \t]*\n.*?\n---[ \t]*(?:\n|\Z)", re.DOTALL)
+
+def strip_frontmatter(code: str) -> str:
+    """The code without its frontmatter block, if it has one."""
+    return _FRONTMATTER.sub("", code, count=1)
+
+_MERMAID_PREFIXES = {
+    DiagramType.FLOWCHART: "graph TD",
+    DiagramType.SEQUENCE: "sequenceDiagram",
+    DiagramType.ER_DIAGRAM: "erDiagram",
+    DiagramType.CLASS_DIAGRAM: "classDiagram",
+    DiagramType.STATE_DIAGRAM: "stateDiagram-v2",
+    DiagramType.MINDMAP: "mindmap",
+    DiagramType.GANTT: "gantt",
+    DiagramType.PIE_CHART: "pie",
+    DiagramType.USER_JOURNEY: "journey",
+    DiagramType.GIT_GRAPH: "gitGraph",
+    DiagramType.TIKZ: "\\documentclass{standalone}",
+}
+
+_EXAMPLE_PROMPTS = {
+    DiagramType.FLOWCHART: "Create a login flow with authentication and error handling",
+    DiagramType.SEQUENCE: "Show the interaction between user, frontend, backend, and database for a login request",
+    DiagramType.ER_DIAGRAM: "Design a database schema for a blog with users, posts, and comments",
+    DiagramType.CLASS_DIAGRAM: "Create a class diagram for an e-commerce system with Product, Cart, and Order classes",
+    DiagramType.STATE_DIAGRAM: "Model the states of an order: pending, processing, shipped, delivered, cancelled",
+    DiagramType.MINDMAP: "Create a mindmap for planning a web application project",
+    DiagramType.GANTT: "Create a project timeline for building a mobile app over 3 months",
+    DiagramType.PIE_CHART: "Show the distribution of programming languages used in a project",
+    DiagramType.USER_JOURNEY: "Map the user journey for online shopping from browsing to checkout",
+    DiagramType.GIT_GRAPH: "Show a git workflow with main, develop, and feature branches",
+    DiagramType.TIKZ: "Create a high-quality ER diagram for a library system using tikz-er2",
+}
+
+_TEMPLATES = {
+    DiagramType.FLOWCHART: PromptTemplates._flowchart_template,
+    DiagramType.SEQUENCE: PromptTemplates._sequence_template,
+    DiagramType.ER_DIAGRAM: PromptTemplates._er_diagram_template,
+    DiagramType.CLASS_DIAGRAM: PromptTemplates._class_diagram_template,
+    DiagramType.STATE_DIAGRAM: PromptTemplates._state_diagram_template,
+    DiagramType.MINDMAP: PromptTemplates._mindmap_template,
+    DiagramType.GANTT: PromptTemplates._gantt_template,
+    DiagramType.PIE_CHART: PromptTemplates._pie_chart_template,
+    DiagramType.USER_JOURNEY: PromptTemplates._user_journey_template,
+    DiagramType.GIT_GRAPH: PromptTemplates._git_graph_template,
+    DiagramType.TIKZ: PromptTemplates._tikz_template,
+}
+
+# Regex used by the cleaner to find the first line of the diagram
+_CLEAN_PATTERNS = {
+    DiagramType.FLOWCHART: r"^(graph|flowchart)\s+(TD|LR|TB|BT|RL)",
+    DiagramType.SEQUENCE: r"^sequenceDiagram",
+    DiagramType.ER_DIAGRAM: r"^(erDiagram|graph|flowchart)",
+    DiagramType.CLASS_DIAGRAM: r"^classDiagram",
+    DiagramType.STATE_DIAGRAM: r"^stateDiagram(-v2)?",
+    DiagramType.MINDMAP: r"^mindmap",
+    DiagramType.GANTT: r"^gantt",
+    DiagramType.PIE_CHART: r"^pie",
+    DiagramType.USER_JOURNEY: r"^journey",
+    DiagramType.GIT_GRAPH: r"^gitGraph",
+    DiagramType.TIKZ: r"^\\documentclass",
+}
+
+# Prefixes accepted by validation
+_VALID_PREFIXES = {
+    DiagramType.FLOWCHART: ("graph", "flowchart"),
+    DiagramType.SEQUENCE: ("sequenceDiagram",),
+    DiagramType.ER_DIAGRAM: ("erDiagram", "graph", "flowchart"),
+    DiagramType.CLASS_DIAGRAM: ("classDiagram",),
+    DiagramType.STATE_DIAGRAM: ("stateDiagram",),
+    DiagramType.MINDMAP: ("mindmap",),
+    DiagramType.GANTT: ("gantt",),
+    DiagramType.PIE_CHART: ("pie",),
+    DiagramType.USER_JOURNEY: ("journey",),
+    DiagramType.GIT_GRAPH: ("gitGraph",),
+    DiagramType.TIKZ: ("\\documentclass",),
+}
+
+class DiagramTypeSpec:
+    """Everything the backend needs to know about one diagram type."""
+
+    __slots__ = (
+        "diagram_type", "name", "description", "mermaid_prefix",
+        "example_prompt", "template", "clean_pattern", "valid_prefixes"
+    )
+
+    def __init__(
+        self,
+        diagram_type: DiagramType,
+        template: Callable[[str], str],
+        clean_pattern: Pattern,
+        valid_prefixes: Tuple[str, ...]
+    ):
+        self.diagram_type = diagram_type
+        self.name = diagram_type.value.replace('_', ' ').title()
+        self.description = _DESCRIPTIONS.get(diagram_type, "Unknown diagram type")
+        self.mermaid_prefix = _MERMAID_PREFIXES.get(diagram_type, "graph TD")
+        self.example_prompt = _EXAMPLE_PROMPTS.get(diagram_type, "")
+        self.template = template
+        self.clean_pattern = clean_pattern
+        self.valid_prefixes = valid_prefixes
+
+class DiagramRegistry:
+    """
+    Startup-time registry of diagram type specs.
+
+    The specs and the `/diagram-types` payload are built once, and the payload
+    is kept pre-serialized so the endpoint can return the bytes directly.
+    """
+
+    def __init__(self):
+        self._specs: Dict[DiagramType, DiagramTypeSpec] = {}
+        self.diagram_types_payload: bytes = b""
+        self.diagram_types_etag: str = ""
+        self.build()
+
+    def build(self):
+        """Build the per-type specs and the serialized `/diagram-types` payload."""
+        specs = {}
+        for diagram_type in DiagramType:
+            specs[diagram_type] = DiagramTypeSpec(
+                diagram_type,
+                template=_TEMPLATES.get(diagram_type, PromptTemplates._flowchart_template),
+                clean_pattern=re.compile(_CLEAN_PATTERNS.get(diagram_type, r"^graph"), re.IGNORECASE),
+                valid_prefixes=_VALID_PREFIXES.get(diagram_type, ("graph",))
+            )
+        self._specs = specs
+
+        types = [
+            DiagramTypeInfo(
+                type=spec.diagram_type.value,
+                name=spec.name,
+                description=spec.description,
+                mermaid_prefix=spec.mermaid_prefix,
+                example_prompt=spec.example_prompt
+            ).dict()
+            for spec in specs.values()
+        ]
+        self.diagram_types_payload = json.dumps(types, separators=(",", ":")).encode("utf-8")
+        self.diagram_types_etag = strong_etag(self.diagram_types_payload.decode("utf-8"))
+
+    def lookup(self, diagram_type) -> Optional[DiagramTypeSpec]:
+        """Get the spec for a diagram type, or None if the type is unknown."""
+        spec = self._specs.get(diagram_type)
+        if spec is None:
+            try:
+                spec = self._specs.get(DiagramType(diagram_type))
+            except ValueError:
+                return None
+        return spec
+
+    def get(self, diagram_type) -> DiagramTypeSpec:
+        """Get the spec for a diagram type, defaulting to flowchart for unknown values."""
+        return self.lookup(diagram_type) or self._specs[DiagramType.FLOWCHART]
+
+    def detect(self, code: str) -> DiagramType:
+        """Infer the diagram type from the code's declaration line (flowchart if none matches)."""
+        first_line = next((line.strip() for line in strip_frontmatter(code).splitlines() if line.strip()), "")
+        for spec in self._specs.values():
+            if spec.clean_pattern.match(first_line):
+                return spec.diagram_type
+        return DiagramType.FLOWCHART
+
+# Singleton instance
+diagram_registry = DiagramRegistry()
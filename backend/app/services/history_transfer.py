@@ -0,0 +1,170 @@
+import io
+import logging
+import zipfile
+from datetime import datetime
+from typing import BinaryIO, Dict, Iterable, Iterator, Optional
+from bson import ObjectId
+from app.db.mongodb import mongodb, owner_filter
+from app.db.ndjson import encode_document, decode_line
+from app.models.enums import DiagramType
+from app.services.mermaid_identifiers import build_search_terms
+from app.services.prompt_similarity import index_fields
+
+logger = logging.getLogger(__name__)
+
+EXPORT_BATCH_SIZE = 1000
+IMPORT_CHUNK_SIZE = 1000
+# Flush threshold for streamed output
+CHUNK_BYTES = 64 * 1024
+
+# Fields an imported entry must have, with their types
+REQUIRED_FIELDS = {"_id": ObjectId, "prompt": str, "mermaid_code": str, "diagram_type": str, "created_at": datetime}
+# Further fields kept from trusted (CLI) transfers between environments
+TRANSFER_FIELDS = {"provider": str, "usage": dict, "parent_id": ObjectId, "revision": int, "instruction": str}
+DIAGRAM_TYPES = frozenset(t.value for t in DiagramType)
+
+def build_export_query(
+    user_id: Optional[str] = None,
+    diagram_type: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    all_owners: bool = False
+) -> Dict:
+    """Build the history query for an export. `all_owners` is only used by the CLI."""
+    query = {} if all_owners else owner_filter(user_id)
+    if diagram_type:
+        query["diagram_type"] = diagram_type
+    if start or end:
+        query["created_at"] = {}
+        if start:
+            query["created_at"]["$gte"] = start
+        if end:
+            query["created_at"]["$lt"] = end
+    return query
+
+def _export_cursor(query: Dict):
+    return mongodb.history_collection.find(query).sort("created_at", 1).batch_size(EXPORT_BATCH_SIZE)
+
+def stream_ndjson(query: Dict) -> Iterator[bytes]:
+    """Stream matching documents as NDJSON chunks straight from the cursor."""
+    buffer = bytearray()
+    for doc in _export_cursor(query):
+        buffer += encode_document(doc)
+        if len(buffer) >= CHUNK_BYTES:
+            yield bytes(buffer)
+            buffer.clear()
+    if buffer:
+        yield bytes(buffer)
+
+class _ZipChunkWriter(io.RawIOBase):
+    """Write-only, unseekable sink that hands written bytes back to the generator."""
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.buffer += data
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+def stream_zip(query: Dict) -> Iterator[bytes]:
+    """
+    Stream matching documents as a zip of `.mmd` (or `.tex` for TikZ) files.
+
+    Entries are written with data descriptors so nothing is buffered beyond the
+    current entry. The zip central directory still keeps one small record per
+    entry until the end, so NDJSON is the better format for very large exports.
+    """
+    sink = _ZipChunkWriter()
+    with zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for doc in _export_cursor(query):
+            diagram_type = doc.get("diagram_type", "flowchart")
+            extension = "tex" if diagram_type == DiagramType.TIKZ.value else "mmd"
+            info = zipfile.ZipInfo(
+                f"{diagram_type}/{doc['_id']}.{extension}",
+                date_time=doc["created_at"].timetuple()[:6]
+            )
+            info.compress_type = zipfile.ZIP_DEFLATED
+            archive.writestr(info, doc.get("mermaid_code", ""))
+            if len(sink.buffer) >= CHUNK_BYTES:
+                yield sink.drain()
+    yield sink.drain()
+
+def _history_entry(doc, line_number: int, owner: Optional[ObjectId], keep_owner: bool) -> Dict:
+    """
+    Check one decoded line against the history schema and rebuild it from known fields.
+
+    Derived fields (search terms, prompt signature) are recomputed rather than
+    trusted. Raises ValueError for anything that is not a valid history entry.
+    """
+    if not isinstance(doc, dict):
+        raise ValueError(f"line {line_number}: expected an object")
+    entry = {}
+    for field, field_type in REQUIRED_FIELDS.items():
+        if not isinstance(doc.get(field), field_type):
+            raise ValueError(f"line {line_number}: missing or invalid {field!r}")
+        entry[field] = doc[field]
+    if entry["diagram_type"] not in DIAGRAM_TYPES:
+        raise ValueError(f"line {line_number}: unknown diagram type {entry['diagram_type']!r}")
+
+    if keep_owner:
+        stored_owner = doc.get("user_id")
+        if stored_owner is not None and not isinstance(stored_owner, ObjectId):
+            raise ValueError(f"line {line_number}: invalid 'user_id'")
+        entry["user_id"] = stored_owner
+        entry.update({
+            field: doc[field] for field, field_type in TRANSFER_FIELDS.items()
+            if isinstance(doc.get(field), field_type)
+        })
+    else:
+        entry["user_id"] = owner
+
+    entry["search_terms"] = build_search_terms(entry["mermaid_code"])
+    if "parent_id" not in entry:
+        entry.update(index_fields(entry["prompt"]))
+    return entry
+
+def import_ndjson(lines: Iterable[bytes], user_id: Optional[str] = None, keep_owner: bool = False) -> Dict:
+    """
+    Bulk-load NDJSON history in chunks with `insert_many`, skipping existing _ids.
+
+    Imported entries are assigned to `user_id` unless `keep_owner` is set
+    (CLI only), in which case the owner, provider, usage and revision links
+    stored in the file are kept. Raises ValueError at the first invalid line;
+    chunks before it stay imported, and importing the file again skips them.
+    """
+    owner = owner_filter(user_id)["user_id"]
+    inserted = 0
+    total = 0
+    chunk = []
+    for line_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            doc = decode_line(line)
+        except Exception as e:
+            # Malformed JSON, or Extended JSON with bad values (e.g. an invalid $oid)
+            raise ValueError(f"line {line_number}: {e}")
+        chunk.append(_history_entry(doc, line_number, owner, keep_owner))
+        total += 1
+        if len(chunk) >= IMPORT_CHUNK_SIZE:
+            inserted += mongodb.insert_history_batch(chunk)
+            chunk = []
+    if chunk:
+        inserted += mongodb.insert_history_batch(chunk)
+
+    logger.info("Imported %s of %s history entries", inserted, total)
+    return {"inserted": inserted, "skipped": total - inserted}
+
+def export_to_file(query: Dict, fmt: str, out: BinaryIO) -> None:
+    """Write an export to an open binary file (used by the CLI)."""
+    stream = stream_zip(query) if fmt == "zip" else stream_ndjson(query)
+    for chunk in stream:
+        out.write(chunk)
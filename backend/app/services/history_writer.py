@@ -0,0 +1,144 @@
+import asyncio
+import logging
+import threading
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+from bson import ObjectId
+from pymongo.errors import ConnectionFailure, DuplicateKeyError
+from app.core.config import settings
+from app.core.circuit_breaker import CircuitOpenError, OPEN
+from app.core.metrics import metrics
+from app.db.mongodb import mongodb
+from app.services.activity_rollups import activity_rollups
+
+logger = logging.getLogger(__name__)
+
+class HistoryWriter:
+    """
+    Persists generated diagrams without making generation depend on MongoDB.
+
+    Entries get their id before the write, so when MongoDB is down (or its
+    circuit is open) the diagram can still be returned and the entry is kept
+    in a bounded in-memory buffer until `flush` can write it. The buffer lives
+    in this process only: entries still pending at exit are lost, and the
+    oldest ones are dropped when it is full.
+    """
+
+    def __init__(self, max_pending: int):
+        self._pending: Deque[Dict] = deque()
+        self._max_pending = max_pending
+        self._lock = threading.Lock()
+
+    @property
+    def pending_count(self) -> int:
+        return len(self._pending)
+
+    def save(
+        self,
+        prompt: str,
+        mermaid_code: str,
+        diagram_type: str,
+        user_id: Optional[str] = None,
+        provider: Optional[str] = None,
+        usage: Optional[Dict] = None,
+        parent: Optional[Dict] = None,
+        entry_id: Optional[ObjectId] = None,
+        instruction: Optional[str] = None
+    ) -> str:
+        """
+        Save a history entry, deferring it if MongoDB is unavailable. Returns the entry id.
+
+        Generations (calls that pass the `provider`) are also counted in the
+        activity rollups. `usage` is the provider's token accounting for it.
+        Edits pass the `parent` entry they revise, its root `prompt` and the
+        edit's `instruction`. A fixed `entry_id` makes
+        the save idempotent: a second save with the same id is skipped.
+        """
+        entry = mongodb.build_history_entry(prompt, mermaid_code, diagram_type, user_id, provider, usage, parent, entry_id, instruction)
+        try:
+            mongodb.insert_history_entry(entry)
+        except DuplicateKeyError:
+            if entry_id is None:
+                raise
+            logger.info("History entry %s already saved", entry_id)
+            return str(entry_id)
+        except (CircuitOpenError, ConnectionFailure) as e:
+            self._defer(entry)
+            logger.warning("History write for %s deferred: %s", entry["_id"], e)
+        if provider:
+            activity_rollups.record(diagram_type, provider, entry["created_at"])
+        return str(entry["_id"])
+
+    def _defer(self, entry: Dict):
+        with self._lock:
+            if len(self._pending) >= self._max_pending:
+                dropped = self._pending.popleft()
+                metrics.increment("history_writes_dropped")
+                logger.error("Pending history buffer full, dropped entry %s", dropped['_id'])
+            self._pending.append(entry)
+        metrics.increment("history_writes_deferred")
+
+    def flush(self, batch_size: int = 500) -> int:
+        """
+        Write buffered entries. Returns the number flushed; stops early while MongoDB is down.
+
+        A batch that fails for another reason is retried one entry at a time,
+        and entries that still fail (e.g. too large to store) are dropped.
+        """
+        flushed = 0
+        while self._pending and mongodb.breaker.state != OPEN:
+            with self._lock:
+                batch = [self._pending.popleft() for _ in range(min(batch_size, len(self._pending)))]
+            try:
+                # Entries that made it in before a failure are skipped as duplicates
+                mongodb.insert_history_batch(batch)
+            except (CircuitOpenError, ConnectionFailure) as e:
+                self._requeue(batch)
+                logger.warning("Flushing %d pending history entries failed: %s", len(batch), e)
+                break
+            except Exception as e:
+                logger.warning("Flushing %d pending history entries failed, writing them one by one: %s", len(batch), e)
+                written, outage = self._flush_individually(batch)
+                flushed += written
+                if outage:
+                    break
+                continue
+            flushed += len(batch)
+
+        if flushed:
+            metrics.increment("history_writes_flushed", flushed)
+            logger.info("Flushed %s pending history entries", flushed)
+        return flushed
+
+    def _requeue(self, entries: List[Dict]):
+        with self._lock:
+            self._pending.extendleft(reversed(entries))
+
+    def _flush_individually(self, batch: List[Dict]) -> Tuple[int, bool]:
+        """Write a failed batch entry by entry. Returns the count written and whether MongoDB went down."""
+        written = 0
+        for i, entry in enumerate(batch):
+            try:
+                mongodb.insert_history_batch([entry])
+            except (CircuitOpenError, ConnectionFailure):
+                self._requeue(batch[i:])
+                return written, True
+            except Exception as e:
+                metrics.increment("history_writes_failed")
+                logger.error("Dropped pending history entry %s: %s", entry["_id"], e)
+                continue
+            written += 1
+        return written, False
+
+    async def run_periodically(self, interval_seconds: float):
+        """Flush buffered entries every `interval_seconds` (runs until cancelled)."""
+        while True:
+            await asyncio.sleep(interval_seconds)
+            if self._pending:
+                try:
+                    await asyncio.to_thread(self.flush)
+                except Exception as e:
+                    logger.error("Pending history flush failed: %s", e)
+
+# Singleton instance
+history_writer = HistoryWriter(settings.HISTORY_PENDING_WRITES_MAX)
@@ -0,0 +1,255 @@
+import asyncio
+import logging
+import os
+import socket
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from bson import ObjectId
+from pymongo import ReturnDocument
+from app.core.config import settings
+from app.core.deadline import start_deadline, mongo_timeout
+from app.core.circuit_breaker import CircuitOpenError
+from app.core.structured_logging import request_id_var
+from app.db.mongodb import mongodb
+from app.models.enums import DiagramType, JobStatus
+from app.services.history_writer import history_writer
+from app.services.llm_service import llm_service, GenerationResult
+
+logger = logging.getLogger(__name__)
+
+# How often idle workers look for jobs abandoned at their last attempt
+REAP_INTERVAL_SECONDS = 60
+
+class JobQueue:
+    """
+    Generation jobs persisted in the MongoDB `jobs` collection.
+
+    Any worker process can claim a job. A claim takes a lease, and a job whose
+    lease expires (because its worker died or restarted) is claimed again
+    until `JOB_MAX_ATTEMPTS` is reached; after that `reap` marks it failed.
+    A job's history entry reuses the job's id, so a worker that outlived its
+    lease cannot save the diagram a second time.
+    """
+
+    def enqueue(self, prompt: str, diagram_type: str, user_id: Optional[str] = None) -> Dict:
+        """Persist a new queued job and return it."""
+        now = datetime.utcnow()
+        job = {
+            "status": JobStatus.QUEUED.value,
+            "prompt": prompt,
+            "diagram_type": diagram_type,
+            "user_id": ObjectId(user_id) if user_id else None,
+            "attempts": 0,
+            "created_at": now,
+            "updated_at": now
+        }
+        job["_id"] = mongodb.jobs_collection.insert_one(job).inserted_id
+        return job
+
+    def get(self, job_id: str, user_id: Optional[str] = None) -> Optional[Dict]:
+        """Get a job by id if it belongs to the caller."""
+        try:
+            return mongodb.jobs_collection.find_one({
+                "_id": ObjectId(job_id),
+                "user_id": ObjectId(user_id) if user_id else None
+            })
+        except Exception as e:
+            logger.error("Failed to get job: %s", e)
+            return None
+
+    def claim(self, worker_id: str, skip_types: Optional[List[str]] = None) -> Optional[Dict]:
+        """
+        Atomically take the oldest queued job, or a running job whose lease expired.
+
+        Jobs of `skip_types` (e.g. ones whose provider is cut off) are left for later.
+        """
+        now = datetime.utcnow()
+        query = {
+            "$or": [
+                {"status": JobStatus.QUEUED.value},
+                {"status": JobStatus.RUNNING.value, "lease_expires_at": {"$lt": now}}
+            ],
+            "attempts": {"$lt": settings.JOB_MAX_ATTEMPTS}
+        }
+        if skip_types:
+            query["diagram_type"] = {"$nin": list(skip_types)}
+        with mongodb.breaker:
+            return mongodb.jobs_collection.find_one_and_update(
+                query,
+                {
+                    "$set": {
+                        "status": JobStatus.RUNNING.value,
+                        "worker_id": worker_id,
+                        "lease_expires_at": now + timedelta(seconds=settings.JOB_LEASE_SECONDS),
+                        "updated_at": now
+                    },
+                    "$inc": {"attempts": 1}
+                },
+                sort=[("created_at", 1)],
+                return_document=ReturnDocument.AFTER
+            )
+
+    def reap(self) -> int:
+        """Fail jobs whose lease expired during their last attempt. Returns the count failed."""
+        now = datetime.utcnow()
+        with mongodb.breaker:
+            result = mongodb.jobs_collection.update_many(
+                {
+                    "status": JobStatus.RUNNING.value,
+                    "lease_expires_at": {"$lt": now},
+                    "attempts": {"$gte": settings.JOB_MAX_ATTEMPTS}
+                },
+                {
+                    "$set": {
+                        "status": JobStatus.FAILED.value,
+                        "error": "Worker stopped during the last attempt",
+                        "updated_at": now,
+                        "expires_at": now + timedelta(hours=settings.JOB_RESULT_TTL_HOURS)
+                    },
+                    "$unset": {"lease_expires_at": ""}
+                }
+            )
+        if result.modified_count:
+            logger.warning("Failed %s jobs abandoned at their last attempt", result.modified_count)
+        return result.modified_count
+
+    def _finish(self, job_id, worker_id: str, fields: Dict):
+        now = datetime.utcnow()
+        fields.update({
+            "updated_at": now,
+            "expires_at": now + timedelta(hours=settings.JOB_RESULT_TTL_HOURS)
+        })
+        # Only the current lease holder may finish the job
+        mongodb.jobs_collection.update_one(
+            {"_id": job_id, "worker_id": worker_id, "status": JobStatus.RUNNING.value},
+            {"$set": fields, "$unset": {"lease_expires_at": ""}}
+        )
+
+    def complete(self, job_id, worker_id: str, diagram_id: str, mermaid_code: str):
+        self._finish(job_id, worker_id, {
+            "status": JobStatus.SUCCEEDED.value,
+            "diagram_id": diagram_id,
+            "mermaid_code": mermaid_code
+        })
+
+    def release(self, job_id, worker_id: str):
+        """Put a claimed job back in the queue without counting the attempt."""
+        mongodb.jobs_collection.update_one(
+            {"_id": job_id, "worker_id": worker_id, "status": JobStatus.RUNNING.value},
+            {
+                "$set": {"status": JobStatus.QUEUED.value, "updated_at": datetime.utcnow()},
+                "$inc": {"attempts": -1},
+                "$unset": {"lease_expires_at": "", "worker_id": ""}
+            }
+        )
+
+    def fail(self, job_id, worker_id: str, error: str, final: bool):
+        """Record a failure. Non-final failures are re-queued for another attempt."""
+        if final:
+            self._finish(job_id, worker_id, {"status": JobStatus.FAILED.value, "error": error})
+        else:
+            mongodb.jobs_collection.update_one(
+                {"_id": job_id, "worker_id": worker_id},
+                {
+                    "$set": {"status": JobStatus.QUEUED.value, "error": error, "updated_at": datetime.utcnow()},
+                    "$unset": {"lease_expires_at": "", "worker_id": ""}
+                }
+            )
+
+class JobWorkerPool:
+    """Pool of asyncio workers that process queued jobs through `LLMService`."""
+
+    def __init__(self, queue: JobQueue):
+        self.queue = queue
+        self.worker_prefix = f"{socket.gethostname()}:{os.getpid()}"
+        self._tasks: List[asyncio.Task] = []
+        self._next_reap = 0.0
+
+    def start(self, workers: int):
+        for i in range(workers):
+            self._tasks.append(asyncio.create_task(self._run(f"{self.worker_prefix}:{i}")))
+        logger.info("Started %s generation job workers", workers)
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _run(self, worker_id: str):
+        while True:
+            # Leave jobs queued while their provider is cut off instead of burning their attempts
+            blocked = llm_service.blocked_types()
+            if len(blocked) == len(DiagramType):
+                await asyncio.sleep(settings.JOB_POLL_INTERVAL_SECONDS)
+                continue
+            
+            try:
+                job = await asyncio.to_thread(self.queue.claim, worker_id, blocked)
+            except CircuitOpenError:
+                job = None
+            except Exception as e:
+                logger.error("Failed to claim job: %s", e)
+                job = None
+
+            if job is None:
+                await self._reap_if_due()
+                await asyncio.sleep(settings.JOB_POLL_INTERVAL_SECONDS)
+                continue
+
+            await self._process(job, worker_id)
+            request_id_var.set(None)
+
+    async def _reap_if_due(self):
+        """Let one idle worker per `REAP_INTERVAL_SECONDS` fail abandoned jobs."""
+        now = asyncio.get_running_loop().time()
+        if now < self._next_reap:
+            return
+        self._next_reap = now + REAP_INTERVAL_SECONDS
+        try:
+            await asyncio.to_thread(self.queue.reap)
+        except CircuitOpenError:
+            pass
+        except Exception as e:
+            logger.error("Failed to reap abandoned jobs: %s", e)
+
+    @staticmethod
+    def _save_result(job_id: ObjectId, prompt: str, result: GenerationResult, diagram_type: str, user_id: Optional[str]) -> str:
+        with mongo_timeout("history_write"):
+            return history_writer.save(
+                prompt, result.mermaid_code, diagram_type, user_id,
+                provider=result.provider, usage=result.usage, entry_id=job_id
+            )
+
+    async def _process(self, job: Dict, worker_id: str):
+        # The job must finish within its lease, or another worker may take it over
+        start_deadline(settings.JOB_LEASE_SECONDS)
+        request_id_var.set(f"job-{job['_id']}")
+        try:
+            diagram_type = DiagramType(job["diagram_type"])
+            user_id = str(job["user_id"]) if job.get("user_id") else None
+            result = await llm_service.generate(job["prompt"], diagram_type)
+            diagram_id = await asyncio.to_thread(
+                self._save_result, job["_id"], job["prompt"], result, diagram_type.value, user_id
+            )
+            await asyncio.to_thread(self.queue.complete, job["_id"], worker_id, diagram_id, result.mermaid_code)
+            logger.info("Job %s succeeded", job["_id"])
+        except asyncio.CancelledError:
+            # Shutting down: the lease expires and another worker picks the job up
+            raise
+        except CircuitOpenError as e:
+            # The provider was cut off after the claim (or an explored route hit another one)
+            logger.warning("Job %s returned to the queue: %s", job["_id"], e)
+            try:
+                await asyncio.to_thread(self.queue.release, job["_id"], worker_id)
+            except Exception as release_error:
+                logger.error("Failed to return job %s to the queue: %s", job['_id'], release_error)
+            await asyncio.sleep(settings.JOB_POLL_INTERVAL_SECONDS)
+        except Exception as e:
+            final = job.get("attempts", 1) >= settings.JOB_MAX_ATTEMPTS
+            logger.error("Job %s failed (attempt %s): %s", job['_id'], job.get('attempts'), e)
+            await asyncio.to_thread(self.queue.fail, job["_id"], worker_id, str(e), final)
+
+# Singleton instances
+job_queue = JobQueue()
+job_worker_pool = JobWorkerPool(job_queue)
@@ -1,12 +1,55 @@
-import requests
+import httpx
+import asyncio
 import logging
-from typing import Optional
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
 from app.models.enums import DiagramType
 from app.services.prompt_templates import PromptTemplates
+from app.services.diagram_registry import diagram_registry, strip_frontmatter
 from app.core.config import settings
+from app.core.metrics import metrics
+from app.core.deadline import DeadlineExceeded, current_deadline, muted_stages, stage, stage_timeout
+from app.core.circuit_breaker import CircuitBreaker, CircuitOpenError, OPEN, get_breaker
+from app.services.usage import build_usage, estimate_cost, groq_usage, ollama_usage
+from app.services.speculation import adaptive_sampler
+from app.services.rule_based import rule_based_generator
+from app.services.model_routes import ModelRoute, model_router
+from app.services.llm_traffic import llm_traffic
 
 logger = logging.getLogger(__name__)
 
+# Provider name recorded for diagrams built by the rule-based fast path
+RULES_PROVIDER = "rules"
+
+# Provider error bodies can be large; only this much is logged and returned
+MAX_ERROR_BODY_CHARS = 500
+
+def _is_provider_failure(exc: BaseException) -> bool:
+    """Errors that say the provider is unhealthy (not bad input or our own deadline)."""
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code >= 500 or exc.response.status_code == 429
+    if isinstance(exc, httpx.TimeoutException):
+        deadline = current_deadline()
+        return not (deadline and deadline.remaining() <= 0)
+    return isinstance(exc, httpx.TransportError)
+
+# Token estimate for text the provider has not counted
+CHARS_PER_TOKEN = 4
+
+class EditRejected(Exception):
+    """The model's reply to an edit could not be applied or did not validate."""
+
+class GenerationResult:
+    """Cleaned Mermaid code plus the provider that produced it and its token usage."""
+
+    __slots__ = ("mermaid_code", "usage", "provider")
+
+    def __init__(self, mermaid_code: str, usage: Optional[Dict] = None, provider: Optional[str] = None):
+        self.mermaid_code = mermaid_code
+        self.usage = usage
+        self.provider = provider
+
 class LLMService:
     """Service for interacting with LLM providers (Groq, Ollama)."""
     
@@ -17,43 +60,393 @@ class LLMService:
         self.ollama_url = settings.OLLAMA_URL.replace('/api/generate', '/api/chat')
         self.ollama_model = settings.OLLAMA_MODEL
         self.ollama_timeout = settings.OLLAMA_TIMEOUT
+        self.ollama_keep_alive = settings.OLLAMA_KEEP_ALIVE
         
         # Groq Config
         self.groq_url = "https://api.groq.com/openai/v1/chat/completions"
         self.groq_api_key = settings.GROQ_API_KEY
         self.groq_model = settings.GROQ_MODEL
+        
+        # Shared async connection pool, created on first use. Awaiting requests
+        # on it means a cancelled generation also aborts the upstream request.
+        self._client: Optional[httpx.AsyncClient] = None
+    
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient()
+        return self._client
+    
+    async def aclose(self):
+        """Close the shared HTTP connection pool."""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+    
+    @staticmethod
+    def provider_breaker(provider: str) -> CircuitBreaker:
+        """Circuit breaker guarding calls to one provider."""
+        return get_breaker(f"llm:{provider}", is_failure=_is_provider_failure)
+    
+    @property
+    def breaker(self) -> CircuitBreaker:
+        """Circuit breaker of the configured provider."""
+        return self.provider_breaker(self.provider)
+    
+    def blocked_types(self) -> List[str]:
+        """Diagram types whose provider (per `MODEL_ROUTES`, else `LLM_PROVIDER`) has an open circuit."""
+        return [
+            diagram_type.value for diagram_type in DiagramType
+            if self.provider_breaker((model_router.routes.get(diagram_type) or self.default_route()).provider).state == OPEN
+        ]
+    
+    def ollama_models(self) -> List[str]:
+        """Ollama models that serve traffic: `OLLAMA_MODEL` if Ollama is the default, plus routed ones."""
+        models = [self.ollama_model] if self.provider == "ollama" else []
+        for route in model_router.routes.values():
+            if route.provider == "ollama" and route.model not in models:
+                models.append(route.model)
+        return models
+    
+    async def _post_json(
+        self,
+        provider: str,
+        url: str,
+        payload: Dict,
+        timeout: float,
+        headers: Optional[Dict] = None
+    ) -> Dict:
+        """
+        POST a JSON payload to a provider and return the decoded JSON response.
+        
+        Raises `CircuitOpenError` without calling the provider while its
+        circuit is open. With `LLM_TRAFFIC_MODE` set, responses are recorded
+        to or replayed from local files (see `LLMTraffic`).
+        """
+        try:
+            async with self.provider_breaker(provider):
+                with stage("provider"):
+                    if llm_traffic.replaying:
+                        return await llm_traffic.replay(provider, payload, timeout)
+                    started = time.monotonic()
+                    response = await self._get_client().post(url, json=payload, headers=headers, timeout=timeout)
+                    latency = time.monotonic() - started
+                response.raise_for_status()
+        except httpx.TimeoutException:
+            # Distinguish running out of request budget from a slow provider
+            deadline = current_deadline()
+            if deadline and deadline.remaining() <= 0:
+                raise DeadlineExceeded("provider", deadline)
+            raise
+        result = response.json()
+        if llm_traffic.recording:
+            await llm_traffic.record(provider, url, payload, result, latency)
+        return result
     
     async def generate_diagram(self, prompt: str, diagram_type: DiagramType) -> str:
         """
         Generate Mermaid diagram code using the configured LLM provider.
         """
+        return (await self.generate(prompt, diagram_type)).mermaid_code
+    
+    async def generate(self, prompt: str, diagram_type: DiagramType) -> GenerationResult:
+        """
+        Generate Mermaid diagram code and report the tokens it took.
+        
+        Prompts the rule-based generator can parse completely are answered
+        without calling the provider (see `RuleBasedGenerator`).
+        """
+        if settings.FAST_PATH_ENABLED and rule_based_generator.supports(diagram_type):
+            result = self._generate_with_rules(prompt, diagram_type)
+            if result:
+                return result
+        
+        route, explored = model_router.resolve(diagram_type)
+        route = route or self.default_route()
         try:
-            if self.provider == "groq":
-                mermaid_code = await self._generate_with_groq(prompt, diagram_type)
-            else:
-                mermaid_code = await self._generate_with_ollama(prompt, diagram_type)
+            with stage("template"):
+                llm_prompt = PromptTemplates.get_template(diagram_type, prompt)
             
-            # Clean up the response
-            mermaid_code = self._clean_mermaid_code(mermaid_code, diagram_type)
-            
-            # Validate the code
-            if not self._validate_mermaid_code(mermaid_code, diagram_type):
-                logger.warning(f"Generated code failed validation, attempting fallback")
+            samples = adaptive_sampler.samples_for(diagram_type)
+            if samples > 1:
+                mermaid_code, usage, valid = await self._speculate(llm_prompt, len(prompt), route, diagram_type, samples)
+            else:
+                mermaid_code, usage, valid = await self._sample(llm_prompt, len(prompt), route, diagram_type)
+            if not valid:
+                logger.warning("Generated %s code failed validation, attempting fallback", diagram_type.value)
                 mermaid_code = self._generate_fallback(prompt, diagram_type)
+            self._record_route(usage, diagram_type, valid, explored)
             
-            logger.info(f"Successfully generated {diagram_type} diagram using {self.provider}")
-            return mermaid_code
+            logger.info("Generated %s diagram using %r", diagram_type.value, route)
+            return GenerationResult(mermaid_code, usage, provider=route.provider)
             
+        except (DeadlineExceeded, CircuitOpenError):
+            raise
         except Exception as e:
-            logger.error(f"Failed to generate diagram: {str(e)}")
+            logger.error("Failed to generate diagram: %s", e)
             raise Exception(f"Failed to generate diagram: {str(e)}")
 
-    async def _generate_with_groq(self, prompt: str, diagram_type: DiagramType) -> str:
+    async def _sample(
+        self,
+        llm_prompt: str,
+        user_chars: int,
+        route: ModelRoute,
+        diagram_type: DiagramType
+    ) -> Tuple[str, Dict, bool]:
+        """One provider call, cleaned and validated: (code, usage, valid)."""
+        mermaid_code, usage = await self._complete(llm_prompt, user_chars, route)
+        self._record_usage(usage, diagram_type)
+        
+        # Clean up the response
+        with stage("clean"):
+            mermaid_code = self._clean_mermaid_code(mermaid_code, diagram_type)
+        
+        # Validate the code
+        with stage("validate"):
+            valid = self._validate_mermaid_code(mermaid_code, diagram_type)
+        adaptive_sampler.record(diagram_type, valid)
+        return mermaid_code, usage, valid
+    
+    async def _speculate(
+        self,
+        llm_prompt: str,
+        user_chars: int,
+        route: ModelRoute,
+        diagram_type: DiagramType,
+        samples: int
+    ) -> Tuple[str, Dict, bool]:
+        """
+        Request `samples` completions concurrently at different temperatures.
+        
+        The first one that validates wins and the others are cancelled at
+        once. If none validates, the first to finish is returned (and the
+        caller falls back); if all fail, the first error is raised. The
+        winner's usage is extended with the tokens of the other completed
+        samples, plus the prompt tokens of the cancelled ones (their
+        completion tokens are unknown), so cost stays accurate. The race is
+        timed as the single "speculate" stage.
+        """
+        temperatures = adaptive_sampler.temperatures(samples)
+        completed: List[Tuple[int, Tuple[str, Dict, bool]]] = []
+        errors: List[BaseException] = []
+        winner = None
+        # One stage for the whole race: the samples' own stages would add up K times
+        with stage("speculate"):
+            with muted_stages():
+                tasks = [
+                    asyncio.ensure_future(self._sample(
+                        llm_prompt,
+                        user_chars,
+                        ModelRoute(route.provider, route.model, route.timeout, route.max_tokens, temperature),
+                        diagram_type
+                    ))
+                    for temperature in temperatures
+                ]
+            try:
+                pending = set(tasks)
+                while pending and winner is None:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        if task.exception() is not None:
+                            errors.append(task.exception())
+                            continue
+                        completed.append((tasks.index(task), task.result()))
+                        if winner is None and task.result()[2]:
+                            winner = completed[-1]
+            finally:
+                for task in tasks:
+                    if not task.done():
+                        task.cancel()
+                # Let the cancelled samples finish unwinding (closing their connections)
+                await asyncio.gather(*tasks, return_exceptions=True)
+        
+        if not completed:
+            raise errors[0]
+        index, (mermaid_code, usage, valid) = winner or completed[0]
+        
+        usage = dict(usage)
+        cancelled = samples - len(completed) - len(errors)
+        for other_index, (_, other_usage, _) in completed:
+            if other_index != index:
+                usage["prompt_tokens"] += other_usage["prompt_tokens"]
+                usage["completion_tokens"] += other_usage["completion_tokens"]
+        usage["prompt_tokens"] += cancelled * usage["prompt_tokens"] // max(1, len(completed))
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        usage["cost_usd"] = estimate_cost(usage["model"], usage["prompt_tokens"], usage["completion_tokens"])
+        usage["speculative"] = {
+            "samples": samples,
+            "completed": len(completed),
+            "failed": len(errors),
+            "cancelled": cancelled,
+            "winner_temperature": temperatures[index]
+        }
+        
+        labels = {"diagram_type": diagram_type.value}
+        metrics.increment("speculative_generations", samples=str(samples), **labels)
+        metrics.increment("speculative_cancelled", cancelled, **labels)
+        if winner is None:
+            metrics.increment("speculative_all_invalid", **labels)
+        return mermaid_code, usage, valid
+    
+    async def edit(
+        self,
+        mermaid_code: str,
+        instruction: str,
+        diagram_type: DiagramType,
+        original_prompt: str
+    ) -> GenerationResult:
+        """
+        Apply an instruction to existing diagram code with a compact edit prompt.
+        
+        The model may reply with a line patch or with the full new code; either
+        way the result must validate, or `EditRejected` is raised. The usage
+        record has `edit_mode` ("patch" or "full"), the estimated tokens of
+        regenerating from scratch (`full_regeneration_tokens`) and the
+        difference (`tokens_saved`).
+        """
+        route, _ = model_router.resolve(diagram_type)
+        route = route or self.default_route()
+        with stage("template"):
+            llm_prompt = PromptTemplates.edit_template(diagram_type, mermaid_code, instruction)
+        reply, usage = await self._complete(llm_prompt, len(mermaid_code) + len(instruction), route)
+        self._record_usage(usage, diagram_type)
+        
+        with stage("clean"):
+            patch = self._patch_lines(reply)
+            if patch:
+                edited = self._apply_patch(mermaid_code, patch)
+                if edited is None:
+                    raise EditRejected("The model's patch does not match the diagram")
+                edited = self._fix_syntax_errors(edited, diagram_type)
+            else:
+                edited = self._clean_mermaid_code(reply, diagram_type)
+        with stage("validate"):
+            if not self._validate_mermaid_code(edited, diagram_type):
+                raise EditRejected("The edited diagram is not valid")
+        
+        # What /generate would have spent on the same change, at the observed tokens per character
+        prompt_ratio = usage["prompt_tokens"] / len(llm_prompt) if usage["prompt_tokens"] else 1 / CHARS_PER_TOKEN
+        completion_ratio = usage["completion_tokens"] / len(reply) if usage["completion_tokens"] and reply else 1 / CHARS_PER_TOKEN
+        full_prompt = PromptTemplates.get_template(diagram_type, f"{original_prompt}\n{instruction}")
+        full_tokens = round(len(full_prompt) * prompt_ratio + len(edited) * completion_ratio)
+        
+        mode = "patch" if patch else "full"
+        usage.update(edit_mode=mode, full_regeneration_tokens=full_tokens, tokens_saved=full_tokens - usage["total_tokens"])
+        metrics.increment("diagram_edits", mode=mode, diagram_type=diagram_type.value)
+        metrics.increment("edit_tokens_saved", usage["tokens_saved"], diagram_type=diagram_type.value)
+        logger.info("Edited %s diagram using %r (%s)", diagram_type.value, route, mode)
+        return GenerationResult(edited, usage, provider=route.provider)
+    
+    @staticmethod
+    def _patch_lines(reply: str) -> List[str]:
+        """
+        The reply's change lines if it is a patch, else [].
+
+        A patch is "+"/"-" lines, optionally in unified diff form: the file
+        headers and "@@" hunk lines are dropped and space-prefixed context
+        lines are kept for `_apply_patch` to position additions.
+        """
+        if "```" in reply:
+            reply = reply.split("```")[1]
+            if reply.startswith("diff") or reply.startswith("mermaid"):
+                reply = reply.split("\n", 1)[1] if "\n" in reply else ""
+        lines = [line.rstrip() for line in reply.strip("\n").split("\n") if line.strip()]
+        while lines and lines[0].startswith(("--- ", "+++ ")):
+            lines.pop(0)
+        lines = [line for line in lines if not line.startswith("@@")]
+        changes = [line for line in lines if line.startswith(("+", "-"))]
+        if changes and all(line.startswith(("+", "-", " ")) for line in lines):
+            return lines
+        return []
+    
+    @staticmethod
+    def _apply_patch(code: str, patch: List[str]) -> Optional[str]:
+        """
+        Apply "- old line" / "+ new line" changes to code (None if a removed line is missing).
+        
+        Lines are matched ignoring indentation. Added lines go where the last
+        removed line was, after the last context line (" line") found, or at
+        the end, and take the indentation of the diagram's body.
+        """
+        lines = code.split("\n")
+        body = next((line for line in lines[1:] if line.strip()), "    ")
+        indent = body[:len(body) - len(body.lstrip())] or "    "
+        insert_at = None
+        for change in patch:
+            text = change[1:].strip()
+            if change.startswith("-"):
+                index = next((i for i, line in enumerate(lines) if line.strip() == text), None)
+                if index is None:
+                    return None
+                del lines[index]
+                insert_at = index
+            elif change.startswith(" "):
+                # Context the model got wrong only loses the position, not the change
+                index = next((i for i, line in enumerate(lines) if line.strip() == text), None)
+                if index is not None:
+                    insert_at = index + 1
+            elif text:
+                position = len(lines) if insert_at is None else insert_at
+                lines.insert(position, indent + text)
+                insert_at = position + 1
+        return "\n".join(lines)
+    
+    def _generate_with_rules(self, prompt: str, diagram_type: DiagramType) -> Optional[GenerationResult]:
+        """Try the rule-based fast path; None means the prompt needs the LLM."""
+        started = time.monotonic()
+        with stage("rules"):
+            mermaid_code = rule_based_generator.generate(prompt, diagram_type)
+        hit = mermaid_code is not None and self._validate_mermaid_code(mermaid_code, diagram_type)
+        
+        # Hit rate per type is fast_path_hits / fast_path_attempts
+        metrics.increment("fast_path_attempts", diagram_type=diagram_type.value)
+        if not hit:
+            return None
+        duration = time.monotonic() - started
+        metrics.increment("fast_path_hits", diagram_type=diagram_type.value)
+        metrics.observe("fast_path_ms", duration * 1000, diagram_type=diagram_type.value)
+        logger.info("Generated %s diagram using %s", diagram_type.value, RULES_PROVIDER)
+        
+        usage = build_usage(RULES_PROVIDER, RULES_PROVIDER, 0, 0, None, duration, len(prompt), len(prompt))
+        usage.update(valid=True, explored=False)
+        return GenerationResult(mermaid_code, usage, provider=RULES_PROVIDER)
+    
+    def default_route(self) -> ModelRoute:
+        """Route for diagram types without a `MODEL_ROUTES` entry."""
+        if self.provider == "groq":
+            return ModelRoute("groq", self.groq_model, 30.0)
+        return ModelRoute("ollama", self.ollama_model, float(self.ollama_timeout))
+    
+    @staticmethod
+    def _record_route(usage: Dict, diagram_type: DiagramType, valid: bool, explored: bool):
+        """Mark the usage record with the outcome so routes can be compared (see `GET /stats/routes`)."""
+        usage.update(valid=valid, explored=explored)
+        labels = {"diagram_type": diagram_type.value, "provider": usage["provider"], "model": usage["model"]}
+        metrics.increment("route_generations", valid=str(valid).lower(), **labels)
+        metrics.observe("route_duration_ms", usage["duration_ms"], **labels)
+    
+    @staticmethod
+    def _record_usage(usage: Dict, diagram_type: DiagramType):
+        labels = {"model": usage["model"], "diagram_type": diagram_type.value}
+        metrics.increment("llm_prompt_tokens", usage["prompt_tokens"], **labels)
+        metrics.increment("llm_completion_tokens", usage["completion_tokens"], **labels)
+        if usage["tokens_per_second"] is not None:
+            metrics.observe("llm_tokens_per_second", usage["tokens_per_second"], model=usage["model"])
+
+    async def _complete(self, llm_prompt: str, user_chars: int, route: ModelRoute) -> Tuple[str, Dict]:
+        """
+        Send a rendered prompt on a route and return the raw reply and its usage.
+        
+        `user_chars` is how much of the prompt is the user's own text; the
+        rest is counted as template overhead.
+        """
+        if route.provider == "groq":
+            return await self._generate_with_groq(llm_prompt, user_chars, route)
+        return await self._generate_with_ollama(llm_prompt, user_chars, route)
+    
+    async def _generate_with_groq(self, llm_prompt: str, user_chars: int, route: ModelRoute) -> Tuple[str, Dict]:
         """Generate using Groq API."""
-        if not self.groq_api_key:
+        if not self.groq_api_key and not llm_traffic.replaying:
             raise Exception("Groq API Key not configured")
-            
-        llm_prompt = PromptTemplates.get_template(diagram_type, prompt)
         
         headers = {
             "Authorization": f"Bearer {self.groq_api_key}",
@@ -61,7 +454,7 @@ class LLMService:
         }
         
         payload = {
-            "model": self.groq_model,
+            "model": route.model,
             "messages": [
                 {
                     "role": "system",
@@ -72,28 +465,31 @@ class LLMService:
                     "content": llm_prompt
                 }
             ],
-            "temperature": 0.2,
-            "max_tokens": 4096
+            "temperature": route.temperature,
+            "max_tokens": route.max_tokens
         }
         
         try:
-            response = requests.post(self.groq_url, json=payload, headers=headers, timeout=30)
-            response.raise_for_status()
-            result = response.json()
-            return result['choices'][0]['message']['content'].strip()
-        except requests.RequestException as e:
+            started = time.monotonic()
+            result = await self._post_json(
+                "groq", self.groq_url, payload, timeout=stage_timeout("provider", route.timeout), headers=headers
+            )
+            usage = groq_usage(result, route.model, time.monotonic() - started, len(llm_prompt), user_chars)
+            return result['choices'][0]['message']['content'].strip(), usage
+        except httpx.HTTPError as e:
             error_msg = f"Groq request failed: {str(e)}"
-            if hasattr(e, 'response') and e.response is not None:
-                error_msg += f"\nResponse: {e.response.text}"
-            logger.error(error_msg)
+            if isinstance(e, httpx.HTTPStatusError):
+                body = e.response.text
+                if len(body) > MAX_ERROR_BODY_CHARS:
+                    body = body[:MAX_ERROR_BODY_CHARS] + f"... ({len(body)} chars)"
+                error_msg += f"\nResponse: {body}"
+            logger.error("%s", error_msg)
             raise Exception(error_msg)
 
-    async def _generate_with_ollama(self, prompt: str, diagram_type: DiagramType) -> str:
+    async def _generate_with_ollama(self, llm_prompt: str, user_chars: int, route: ModelRoute) -> Tuple[str, Dict]:
         """Generate using Ollama API."""
-        llm_prompt = PromptTemplates.get_template(diagram_type, prompt)
-        
         payload = {
-            "model": self.ollama_model,
+            "model": route.model,
             "messages": [
                 {
                     "role": "system",
@@ -105,25 +501,37 @@ class LLMService:
                 }
             ],
             "stream": False,
+            "keep_alive": self.ollama_keep_alive,
             "options": {
-                "num_predict": 4096,
-                "temperature": 0.2
+                "num_predict": route.max_tokens,
+                "temperature": route.temperature
             }
         }
         
         try:
-            response = requests.post(self.ollama_url, json=payload, timeout=self.ollama_timeout)
-            response.raise_for_status()
-            result = response.json()
-            return result.get('message', {}).get('content', '').strip()
-        except requests.RequestException as e:
-            logger.error(f"Ollama request failed: {str(e)}")
+            started = time.monotonic()
+            result = await self._post_json(
+                "ollama", self.ollama_url, payload, timeout=stage_timeout("provider", route.timeout)
+            )
+            self._record_model_load(result, route.model)
+            usage = ollama_usage(result, route.model, time.monotonic() - started, len(llm_prompt), user_chars)
+            return result.get('message', {}).get('content', '').strip(), usage
+        except httpx.HTTPError as e:
+            logger.error("Ollama request failed: %s", e)
             raise Exception(f"Ollama service error: {str(e)}")
 
     def _clean_mermaid_code(self, code: str, diagram_type: DiagramType) -> str:
         """Clean and format the generated Mermaid code."""
-        import re
+        cleaned_code = self._extract_mermaid_code(code, diagram_type)
         
+        # Apply common syntax fixes
+        with stage("fix_syntax"):
+            cleaned_code = self._fix_syntax_errors(cleaned_code, diagram_type)
+        
+        return cleaned_code
+    
+    def _extract_mermaid_code(self, code: str, diagram_type: DiagramType) -> str:
+        """Strip markdown fences and any chatter before the diagram declaration."""
         # Remove markdown code blocks if present
         if "```mermaid" in code:
             code = code.split("```mermaid")[1].split("```")[0]
@@ -132,37 +540,17 @@ class LLMService:
             
         lines = code.strip().split('\n')
         
-        # Define regex patterns for each diagram type
-        patterns = {
-            DiagramType.FLOWCHART: r"^(graph|flowchart)\s+(TD|LR|TB|BT|RL)",
-            DiagramType.SEQUENCE: r"^sequenceDiagram",
-            DiagramType.ER_DIAGRAM: r"^(erDiagram|graph|flowchart)",
-            DiagramType.CLASS_DIAGRAM: r"^classDiagram",
-            DiagramType.STATE_DIAGRAM: r"^stateDiagram(-v2)?",
-            DiagramType.MINDMAP: r"^mindmap",
-            DiagramType.GANTT: r"^gantt",
-            DiagramType.PIE_CHART: r"^pie",
-            DiagramType.USER_JOURNEY: r"^journey",
-            DiagramType.GIT_GRAPH: r"^gitGraph",
-            DiagramType.TIKZ: r"^\\documentclass",
-        }
-        
-        pattern = patterns.get(diagram_type, r"^graph")
+        pattern = diagram_registry.get(diagram_type).clean_pattern
         
         # Find the first line that matches the pattern
         start_index = 0
         for i, line in enumerate(lines):
-            if re.match(pattern, line.strip(), re.IGNORECASE):
+            if pattern.match(line.strip()):
                 start_index = i
                 break
         
         # Return from the correct starting point
-        cleaned_code = '\n'.join(lines[start_index:]).strip()
-        
-        # Apply common syntax fixes
-        cleaned_code = self._fix_syntax_errors(cleaned_code, diagram_type)
-        
-        return cleaned_code
+        return '\n'.join(lines[start_index:]).strip()
     
     def _fix_syntax_errors(self, code: str, diagram_type: DiagramType) -> str:
         """Fix common syntax errors made by LLMs."""
@@ -182,7 +570,7 @@ class LLMService:
         if diagram_type == DiagramType.GIT_GRAPH:
             def normalize_commit_line(match):
                 indent = match.group(1)
-                args = match.group(2).strip()
+                args = (match.group(2) or "").strip()
                 
                 if not args:
                     return f"{indent}commit"
@@ -261,23 +649,8 @@ class LLMService:
         if not code:
             return False
         
-        code = code.strip()
-        prefixes = {
-            DiagramType.FLOWCHART: ("graph", "flowchart"),
-            DiagramType.SEQUENCE: ("sequenceDiagram",),
-            DiagramType.ER_DIAGRAM: ("erDiagram", "graph", "flowchart"),
-            DiagramType.CLASS_DIAGRAM: ("classDiagram",),
-            DiagramType.STATE_DIAGRAM: ("stateDiagram",),
-            DiagramType.MINDMAP: ("mindmap",),
-            DiagramType.GANTT: ("gantt",),
-            DiagramType.PIE_CHART: ("pie",),
-            DiagramType.USER_JOURNEY: ("journey",),
-            DiagramType.PIE_CHART: ("pie",),
-            DiagramType.USER_JOURNEY: ("journey",),
-            DiagramType.GIT_GRAPH: ("gitGraph",),
-            DiagramType.TIKZ: ("\\documentclass",),
-        }
-        valid_prefixes = prefixes.get(diagram_type, ("graph",))
+        code = strip_frontmatter(code).strip()
+        valid_prefixes = diagram_registry.get(diagram_type).valid_prefixes
         return code.startswith(valid_prefixes) 
     
     def _generate_fallback(self, prompt: str, diagram_type: DiagramType) -> str:
@@ -299,14 +672,69 @@ class LLMService:
         }
         return fallback_templates.get(diagram_type, fallback_templates[DiagramType.FLOWCHART])
     
+    def _record_model_load(self, result: Dict, model: str):
+        """Count Ollama responses that paid for loading the model into memory."""
+        load_ms = result.get('load_duration', 0) / 1e6
+        if load_ms >= settings.OLLAMA_COLD_LOAD_THRESHOLD_MS:
+            metrics.increment("ollama_cold_loads", model=model)
+            metrics.observe("ollama_cold_load_ms", load_ms, model=model)
+            logger.warning("Ollama cold-loaded %s in %.0f ms", model, load_ms)
+
+    async def warm_up(self) -> bool:
+        """Pre-load every Ollama model in use so the first generation does not pay the load time."""
+        if llm_traffic.replaying:
+            return True
+        warmed = True
+        for model in self.ollama_models():
+            try:
+                # A generate request without a prompt only loads the model and sets its keep_alive
+                result = await self._post_json(
+                    "ollama",
+                    self.ollama_url.replace('/api/chat', '/api/generate'),
+                    {"model": model, "keep_alive": self.ollama_keep_alive, "stream": False},
+                    timeout=self.ollama_timeout
+                )
+                # Loads paid here are expected, so they are kept out of the cold-load metrics
+                metrics.increment("ollama_warmups", model=model)
+                metrics.observe("ollama_warmup_load_ms", result.get('load_duration', 0) / 1e6, model=model)
+            except Exception as e:
+                logger.warning("Ollama warm-up of %s failed: %s", model, e)
+                warmed = False
+        return warmed
+
+    @staticmethod
+    def _in_traffic_hours(hour: int) -> bool:
+        start, end = (int(part) for part in settings.OLLAMA_KEEPWARM_HOURS.split("-"))
+        if start <= end:
+            return start <= hour < end
+        return hour >= start or hour < end
+
+    async def keep_warm(self, interval_seconds: int):
+        """
+        Ping Ollama every `interval_seconds` during traffic hours so the model stays loaded.
+
+        With several worker processes only the holder of the "ollama_keep_warm"
+        lease pings (an extra ping is harmless, so all ping if MongoDB is down).
+        """
+        # Imported here so the service can be used without a database (benchmarks.eval_templates)
+        from app.services.shared_state import shared_state
+        while True:
+            await asyncio.sleep(interval_seconds)
+            if not self._in_traffic_hours(datetime.utcnow().hour):
+                continue
+            if await asyncio.to_thread(shared_state.acquire_lease, "ollama_keep_warm", 2 * interval_seconds, True):
+                await self.warm_up()
+
     async def check_health(self) -> bool:
         """Check if LLM service is available."""
+        if llm_traffic.replaying:
+            return True
         if self.provider == "groq":
             # Simple check for Groq (e.g. list models or just assume true if key exists)
             return bool(self.groq_api_key)
         else:
             try:
-                response = requests.get(self.ollama_url.replace('/api/chat', '/api/tags'), timeout=5)
+                response = await self._get_client().get(self.ollama_url.replace('/api/chat', '/api/tags'), timeout=5)
                 return response.status_code == 200
             except:
                 return False
@@ -0,0 +1,135 @@
+import asyncio
+import hashlib
+import logging
+import os
+import re
+from datetime import datetime
+from typing import Dict, Optional
+import httpx
+import orjson
+from app.core.config import settings
+from app.core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+TRAFFIC_MODES = ("off", "record", "replay")
+
+# Payload fields that do not change the response and may differ between
+# the recording and the replaying environment
+_UNKEYED_FIELDS = ("keep_alive", "stream")
+
+class TrafficNotRecorded(LookupError):
+    """Replay mode found no recording for a provider request."""
+
+def prompt_hash(payload: Dict) -> str:
+    """Stable hash of a provider request payload (model excluded; it is part of the path)."""
+    keyed = {k: v for k, v in payload.items() if k not in _UNKEYED_FIELDS and k != "model"}
+    return hashlib.sha256(orjson.dumps(keyed, option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+def _slug(value: str) -> str:
+    return re.sub(r"[^A-Za-z0-9._-]", "_", value) or "_"
+
+class LLMTraffic:
+    """
+    Record and replay of provider requests, keyed on provider, model and prompt hash.
+
+    In record mode every successful provider response is appended, with its
+    latency, to `<LLM_TRAFFIC_DIR>/<provider>/<model>/<hash>.json`. In
+    replay mode requests are answered from those files without touching the
+    network, after sleeping for the recorded latency times
+    `LLM_REPLAY_LATENCY_SCALE` (0 answers at once). Several recordings of one
+    request are served in turn. Request headers (API keys) are never stored.
+    """
+
+    def __init__(self, mode: str, directory: str, latency_scale: float = 1.0):
+        if mode not in TRAFFIC_MODES:
+            raise ValueError(f"LLM_TRAFFIC_MODE must be one of {', '.join(TRAFFIC_MODES)}, got {mode!r}")
+        self.mode = mode
+        self.directory = directory
+        self.latency_scale = latency_scale
+        self._cache: Dict[str, Dict] = {}
+        self._turns: Dict[str, int] = {}
+
+    @property
+    def recording(self) -> bool:
+        return self.mode == "record"
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == "replay"
+
+    def path(self, provider: str, payload: Dict) -> str:
+        model = _slug(str(payload.get("model", "")))
+        return os.path.join(self.directory, _slug(provider), model, f"{prompt_hash(payload)}.json")
+
+    @staticmethod
+    def _read(path: str) -> Optional[Dict]:
+        try:
+            with open(path, "rb") as f:
+                return orjson.loads(f.read())
+        except FileNotFoundError:
+            return None
+
+    @staticmethod
+    def _write(path: str, entry: Dict):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(orjson.dumps(entry, option=orjson.OPT_INDENT_2))
+        os.replace(tmp_path, path)
+
+    async def record(self, provider: str, url: str, payload: Dict, response: Dict, latency_seconds: float):
+        """Append a provider response to its recording file. Failures are logged, never raised."""
+        path = self.path(provider, payload)
+        try:
+            entry = self._cache.get(path) or await asyncio.to_thread(self._read, path) or {
+                "provider": provider,
+                "model": payload.get("model"),
+                "prompt_hash": prompt_hash(payload),
+                "url": url,
+                "request": payload,
+                "recordings": []
+            }
+            entry["recordings"].append({
+                "response": response,
+                "latency_ms": round(latency_seconds * 1000, 1),
+                "recorded_at": datetime.utcnow().isoformat()
+            })
+            self._cache[path] = entry
+            await asyncio.to_thread(self._write, path, entry)
+            metrics.increment("llm_traffic_recorded", provider=provider)
+        except Exception as e:
+            logger.warning("Failed to record %s traffic to %s: %s", provider, path, e)
+
+    async def replay(self, provider: str, payload: Dict, timeout: float) -> Dict:
+        """
+        Serve a recorded response after its (scaled) latency.
+
+        A latency beyond `timeout` sleeps for `timeout` and raises
+        `httpx.ReadTimeout`, as the real request would have.
+        """
+        path = self.path(provider, payload)
+        entry = self._cache.get(path)
+        if entry is None:
+            entry = await asyncio.to_thread(self._read, path)
+            if entry is not None:
+                self._cache[path] = entry
+        if not entry or not entry.get("recordings"):
+            metrics.increment("llm_traffic_replays", provider=provider, outcome="miss")
+            raise TrafficNotRecorded(f"No recorded {provider} response for {path}")
+
+        turn = self._turns.get(path, 0)
+        self._turns[path] = turn + 1
+        recording = entry["recordings"][turn % len(entry["recordings"])]
+        metrics.increment("llm_traffic_replays", provider=provider, outcome="hit")
+
+        delay = recording.get("latency_ms", 0) / 1000 * self.latency_scale
+        if timeout is not None and delay > timeout:
+            await asyncio.sleep(timeout)
+            raise httpx.ReadTimeout(f"Replayed latency {delay:.1f}s exceeds timeout {timeout:.1f}s")
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return recording["response"]
+
+# Singleton instance
+llm_traffic = LLMTraffic(settings.LLM_TRAFFIC_MODE, settings.LLM_TRAFFIC_DIR, settings.LLM_REPLAY_LATENCY_SCALE)
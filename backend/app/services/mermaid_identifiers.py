@@ -0,0 +1,65 @@
+import re
+from typing import List
+
+# Mermaid/TikZ keywords that carry no meaning for search
+_KEYWORDS = {
+    "graph", "flowchart", "td", "tb", "bt", "lr", "rl", "subgraph", "end", "style", "classdef",
+    "click", "linkstyle", "sequencediagram", "participant", "actor", "as", "activate",
+    "deactivate", "alt", "else", "opt", "loop", "par", "and", "note", "over", "left", "right",
+    "of", "erdiagram", "classdiagram", "class", "statediagram", "statediagram-v2", "state",
+    "mindmap", "root", "gantt", "title", "dateformat", "section", "axisformat", "excludes",
+    "after", "done", "active", "crit", "milestone", "pie", "showdata", "journey", "gitgraph",
+    "commit", "branch", "checkout", "merge", "id", "msg", "type", "tag", "string", "int",
+    "float", "date", "datetime", "boolean", "bool", "void", "pk", "fk", "uk", "documentclass",
+    "usepackage", "begin", "tikzpicture", "node", "draw", "document", "standalone", "tikz",
+    "fill", "stroke", "stroke-width", "color",
+}
+
+# [Label], (Label), {Label}, ((Label)), [(Label)] and friends
+_BRACKET_LABEL = re.compile(r"[\[\(\{]+\s*\"?([^\[\]\(\)\{\}\"\n|]+?)\"?\s*[\]\)\}]+")
+# "quoted" labels used by pie charts, ER relationship labels and git commits
+_QUOTED = re.compile(r"\"([^\"\n]+)\"")
+# Edge labels: -->|label| and A -- label --> B
+_EDGE_LABEL = re.compile(r"\|([^|\n]+)\|")
+# Text after a colon: sequence messages, ER/class relationship labels, journey steps
+_COLON_TEXT = re.compile(r":\s*([^:\n]+)$", re.MULTILINE)
+# Bare identifiers: node ids, entity names, class names, participants, states
+_IDENTIFIER = re.compile(r"\b([A-Za-z_][A-Za-z0-9_\-]*)\b")
+
+MAX_SEARCH_TERMS = 200
+
+def extract_identifiers(code: str) -> List[str]:
+    """
+    Extract searchable identifiers from generated diagram code.
+
+    Returns node labels, entity/class/participant names and message text with
+    syntax keywords removed, deduplicated in order of first appearance.
+    """
+    if not code:
+        return []
+
+    terms = []
+    seen = set()
+
+    def add(term: str):
+        term = term.strip()
+        key = term.lower()
+        if len(term) < 2 or key in _KEYWORDS or key in seen or key.isdigit():
+            return
+        seen.add(key)
+        terms.append(term)
+
+    for pattern in (_BRACKET_LABEL, _QUOTED, _EDGE_LABEL, _COLON_TEXT):
+        for match in pattern.finditer(code):
+            add(match.group(1))
+
+    # Strip labels before collecting identifiers so label words are not split twice
+    bare = _QUOTED.sub(" ", _BRACKET_LABEL.sub(" ", code))
+    for match in _IDENTIFIER.finditer(bare):
+        add(match.group(1))
+
+    return terms[:MAX_SEARCH_TERMS]
+
+def build_search_terms(code: str) -> str:
+    """Flatten extracted identifiers into the string stored in the text index."""
+    return " ".join(extract_identifiers(code))
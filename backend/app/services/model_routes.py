@@ -0,0 +1,85 @@
+import random
+from typing import Dict, List, Optional, Tuple
+from app.models.enums import DiagramType
+from app.core.config import settings
+
+PROVIDERS = ("groq", "ollama")
+
+class ModelRoute:
+    """Provider, model and request limits used for one diagram type."""
+
+    __slots__ = ("provider", "model", "timeout", "max_tokens", "temperature")
+
+    def __init__(self, provider: str, model: str, timeout: float, max_tokens: int = 4096, temperature: float = 0.2):
+        self.provider = provider
+        self.model = model
+        self.timeout = timeout
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+
+    @classmethod
+    def from_config(cls, config: Dict, where: str) -> "ModelRoute":
+        """Build a route from a `MODEL_ROUTES` entry; omitted fields use the provider's defaults."""
+        provider = config.get("provider", settings.LLM_PROVIDER)
+        if provider not in PROVIDERS:
+            raise ValueError(f"{where}: unknown provider {provider!r} (expected one of {', '.join(PROVIDERS)})")
+        default_model, default_timeout = (
+            (settings.GROQ_MODEL, 30.0) if provider == "groq" else (settings.OLLAMA_MODEL, float(settings.OLLAMA_TIMEOUT))
+        )
+        return cls(
+            provider,
+            config.get("model", default_model),
+            float(config.get("timeout", default_timeout)),
+            int(config.get("max_tokens", 4096)),
+            float(config.get("temperature", 0.2))
+        )
+
+    def __repr__(self) -> str:
+        return f"{self.provider}:{self.model}"
+
+def _diagram_type(key: str, where: str) -> DiagramType:
+    try:
+        return DiagramType(key)
+    except ValueError:
+        raise ValueError(f"{where}: unknown diagram type {key!r}")
+
+class ModelRouter:
+    """
+    Chooses the provider and model for each diagram type.
+
+    `MODEL_ROUTES` maps a diagram type to its route; types without one use
+    `LLM_PROVIDER` and its configured model (`resolve` returns None). With `MODEL_ROUTE_EXPLORE_RATE`
+    above 0, that share of generations of a type is sent to one of its
+    `MODEL_ROUTE_CANDIDATES` instead, so latency and validation rate can be
+    compared per route (`GET /stats/routes`) before promoting a cheaper model.
+    """
+
+    def __init__(self):
+        self.routes: Dict[DiagramType, ModelRoute] = {}
+        self.candidates: Dict[DiagramType, List[ModelRoute]] = {}
+        self.explore_rate = 0.0
+        self.load(settings.MODEL_ROUTES, settings.MODEL_ROUTE_CANDIDATES, settings.MODEL_ROUTE_EXPLORE_RATE)
+
+    def load(self, routes: Dict[str, Dict], candidates: Dict[str, List[Dict]], explore_rate: float):
+        """Replace the routing table, validating every entry."""
+        self.routes = {
+            _diagram_type(key, "MODEL_ROUTES"): ModelRoute.from_config(config, f"MODEL_ROUTES[{key}]")
+            for key, config in routes.items()
+        }
+        self.candidates = {
+            _diagram_type(key, "MODEL_ROUTE_CANDIDATES"): [
+                ModelRoute.from_config(config, f"MODEL_ROUTE_CANDIDATES[{key}]") for config in configs
+            ]
+            for key, configs in candidates.items()
+        }
+        self.explore_rate = max(0.0, min(1.0, explore_rate))
+
+    def resolve(self, diagram_type: DiagramType) -> Tuple[Optional[ModelRoute], bool]:
+        """The route for one generation, and whether it is an exploration of a candidate."""
+        candidates = self.candidates.get(diagram_type)
+        if candidates and self.explore_rate > 0 and random.random() < self.explore_rate:
+            return random.choice(candidates), True
+        return self.routes.get(diagram_type), False
+
+# Singleton instance
+model_router = ModelRouter()
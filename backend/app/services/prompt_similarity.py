@@ -0,0 +1,104 @@
+import hashlib
+import random
+import re
+from typing import Dict, FrozenSet, List, Tuple
+
+# Signature size and LSH banding: 16 bands of 4 rows make two prompts
+# candidates from about 0.5 estimated Jaccard similarity upwards
+NUM_PERMUTATIONS = 64
+BANDS = 16
+ROWS_PER_BAND = NUM_PERMUTATIONS // BANDS
+
+_PRIME = (1 << 31) - 1
+# Fixed seed: signatures are stored, so the permutations must never change
+_rng = random.Random(20240613)
+_COEFFICIENTS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERMUTATIONS)]
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+# Request phrasing that says nothing about the diagram itself
+_STOPWORDS = frozenset("""
+a an the and or of to for in on with by from into at as is are be this that these those it its
+me my our your we i you please can could would create make draw generate show build design give
+diagram chart graph simple basic
+""".split())
+
+def _words(prompt: str) -> List[str]:
+    """Normalized words of a prompt in order: lowercase, no filler words, no plural "s"."""
+    words = []
+    for word in _WORD.findall(prompt.lower()):
+        if word in _STOPWORDS:
+            continue
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        words.append(word)
+    return words
+
+def shingles(prompt: str) -> FrozenSet[str]:
+    """
+    Normalized word set of a prompt.
+
+    Case, punctuation, word order, filler words and plural "s" are ignored,
+    so rewordings of the same request end up with the same or a close set.
+    """
+    return frozenset(_words(prompt))
+
+def numeric_facts(prompt: str) -> List[str]:
+    """
+    The prompt's numbers, each with the word before it, as a sorted multiset.
+
+    A word set cannot tell "Q11 1100" from "Q11 1150" in a long prompt, or
+    which value belongs to which label. Near-duplicates must have exactly the
+    same facts, so a reused diagram never carries other data.
+    """
+    words = _words(prompt)
+    return sorted(
+        f"{words[i - 1] if i else ''} {word}"
+        for i, word in enumerate(words) if any(char.isdigit() for char in word)
+    )
+
+def _hash(shingle: str) -> int:
+    return int.from_bytes(hashlib.blake2b(shingle.encode(), digest_size=4).digest(), "big")
+
+def signature(prompt_shingles: FrozenSet[str]) -> List[int]:
+    """MinHash signature: per permutation, the smallest hash over the shingles."""
+    if not prompt_shingles:
+        return []
+    hashes = [_hash(s) for s in prompt_shingles]
+    return [min((a * h + b) % _PRIME for h in hashes) for a, b in _COEFFICIENTS]
+
+def bands(prompt_signature: List[int]) -> List[str]:
+    """LSH band keys; prompts sharing any key are candidate near-duplicates."""
+    keys = []
+    for band in range(BANDS):
+        rows = prompt_signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND]
+        digest = hashlib.blake2b(",".join(map(str, rows)).encode(), digest_size=6).hexdigest()
+        keys.append(f"{band}:{digest}")
+    return keys
+
+def similarity(first: List[int], second: List[int]) -> float:
+    """Estimated Jaccard similarity of two signatures."""
+    if not first or len(first) != len(second):
+        return 0.0
+    return sum(x == y for x, y in zip(first, second)) / len(first)
+
+def index_fields(prompt: str) -> Dict:
+    """Fields stored on a history entry so it can be found by near-duplicate prompts."""
+    prompt_signature = signature(shingles(prompt))
+    if not prompt_signature:
+        return {}
+    return {"prompt_minhash": prompt_signature, "prompt_bands": bands(prompt_signature)}
+
+def best_match(prompt: str, prompt_signature: List[int], candidates: List[Dict]) -> Tuple[Dict, float]:
+    """
+    The candidate (with `prompt` and `prompt_minhash`) most similar to a prompt, and its similarity.
+
+    Candidates whose `numeric_facts` differ from the prompt's are skipped.
+    """
+    facts = numeric_facts(prompt)
+    best, best_score = None, 0.0
+    for candidate in candidates:
+        score = similarity(prompt_signature, candidate.get("prompt_minhash") or [])
+        if score > best_score and numeric_facts(candidate["prompt"]) == facts:
+            best, best_score = candidate, score
+    return best, best_score
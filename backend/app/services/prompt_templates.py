@@ -6,23 +6,26 @@ class PromptTemplates:
     @staticmethod
     def get_template(diagram_type: DiagramType, user_prompt: str) -> str:
         """Get the appropriate prompt template for the diagram type."""
-        templates = {
-            DiagramType.FLOWCHART: PromptTemplates._flowchart_template,
-            DiagramType.SEQUENCE: PromptTemplates._sequence_template,
-            DiagramType.ER_DIAGRAM: PromptTemplates._er_diagram_template,
-            DiagramType.CLASS_DIAGRAM: PromptTemplates._class_diagram_template,
-            DiagramType.STATE_DIAGRAM: PromptTemplates._state_diagram_template,
-            DiagramType.MINDMAP: PromptTemplates._mindmap_template,
-            DiagramType.GANTT: PromptTemplates._gantt_template,
-            DiagramType.PIE_CHART: PromptTemplates._pie_chart_template,
-            DiagramType.USER_JOURNEY: PromptTemplates._user_journey_template,
-            DiagramType.GIT_GRAPH: PromptTemplates._git_graph_template,
-            DiagramType.TIKZ: PromptTemplates._tikz_template,
-        }
-        
-        template_func = templates.get(diagram_type, PromptTemplates._flowchart_template)
+        from app.services.diagram_registry import diagram_registry
+        template_func = diagram_registry.get(diagram_type).template
         return template_func(user_prompt)
     
+    @staticmethod
+    def edit_template(diagram_type: DiagramType, code: str, instruction: str) -> str:
+        """Compact prompt for changing an existing diagram instead of regenerating it."""
+        return f"""Edit this {diagram_type.value} diagram code as instructed.
+
+CODE:
+{code}
+
+INSTRUCTION: {instruction}
+
+Reply with ONLY a patch, one change per line:
+- <existing line, exactly as written>
++ <new line>
+Added lines go where the last removed line was, or at the end.
+If most lines change, reply with the complete updated code instead. No explanations, no Markdown."""
+    
     @staticmethod
     def _flowchart_template(user_prompt: str) -> str:
         return f"""You are a Mermaid.js diagram expert. Convert the description into a valid Mermaid flowchart.
@@ -0,0 +1,170 @@
+import re
+from datetime import date
+from typing import Callable, Dict, List, Optional, Pattern, Tuple
+from app.models.enums import DiagramType
+
+# Conservative limits: anything bigger or odder goes to the LLM
+MAX_PROMPT_CHARS = 1000
+MAX_ITEMS = 50
+MAX_LABEL_CHARS = 60
+# Without a "Title:" prefix, a longer first label is probably a title run into the first item
+MAX_UNTITLED_FIRST_LABEL_WORDS = 3
+
+_LABEL = r"[A-Za-z][\w .+#&/'()?-]*?"
+_SEPARATORS = re.compile(r"\s*(?:[,;\n]|\band\b)\s*", re.IGNORECASE)
+
+_PIE_ITEM = re.compile(rf"^(?P<label>{_LABEL})\s*[:=]?\s*(?P<value>\d+(?:\.\d+)?)\s*%?$")
+_PIE_TITLE_NOISE = re.compile(r"^(?:a\s+)?pie(?:\s+chart)?(?:\s+(?:of|for|showing))?\s*", re.IGNORECASE)
+
+_ARROW = re.compile(r"\s*(?:-->|->|=>|→)\s*")
+_NODE_LABEL = re.compile(rf"^{_LABEL}$")
+_FLOWCHART_TITLE_NOISE = re.compile(r"^(?:a\s+)?(?:flow(?:chart)?|process)(?:\s+(?:of|for))?\s*", re.IGNORECASE)
+
+_GANTT_TASK = re.compile(rf"^(?P<label>{_LABEL})\s*[:=]?\s*(?P<amount>\d+)\s*(?P<unit>d|days?|w|weeks?|h|hours?)$", re.IGNORECASE)
+_GANTT_START = re.compile(r"^(?:start(?:ing)?|from|beginning)\s*(?:on\s*)?(?P<date>\d{4}-\d{2}-\d{2})$", re.IGNORECASE)
+_GANTT_TITLE_NOISE = re.compile(r"^(?:a\s+)?(?:gantt(?:\s+chart)?|timeline|schedule)(?:\s+(?:of|for))?\s*", re.IGNORECASE)
+
+def _split_items(text: str) -> List[str]:
+    return [part for part in _SEPARATORS.split(text.strip()) if part]
+
+def _split_title(prompt: str, noise: Pattern) -> List[Tuple[Optional[str], str]]:
+    """
+    Ways to read a prompt: as items only, and (if it has a digit-free
+    "Title:" prefix) as title plus items.
+    """
+    readings = [(None, prompt)]
+    head, sep, rest = prompt.partition(":")
+    if sep and rest.strip() and not any(ch.isdigit() for ch in head):
+        title = noise.sub("", head.strip()).strip()
+        readings.append((title or None, rest))
+    return readings
+
+def _label_ok(label: str) -> bool:
+    return 0 < len(label) <= MAX_LABEL_CHARS
+
+def _first_label_ok(label: str, title: Optional[str]) -> bool:
+    return title is not None or len(label.split()) <= MAX_UNTITLED_FIRST_LABEL_WORDS
+
+def _frontmatter_title(title: Optional[str]) -> List[str]:
+    """Mermaid frontmatter lines giving a diagram without a title keyword its title."""
+    return ["---", f"title: {title}", "---"] if title else []
+
+def pie_chart(prompt: str) -> Optional[str]:
+    """'Python 40%, JS 35%, Go 25%' (optionally 'Title: ...') -> pie chart."""
+    for title, body in _split_title(prompt, _PIE_TITLE_NOISE):
+        items = _split_items(body)
+        if not 2 <= len(items) <= MAX_ITEMS:
+            continue
+        slices = []
+        for item in items:
+            match = _PIE_ITEM.match(item)
+            if not match or not _label_ok(match["label"].strip()) or float(match["value"]) <= 0:
+                break
+            if not slices and not _first_label_ok(match["label"].strip(), title):
+                break
+            slices.append((match["label"].strip(), match["value"]))
+        else:
+            lines = ["pie"]
+            if title:
+                lines.append(f"    title {title}")
+            lines.extend(f'    "{label}" : {value}' for label, value in slices)
+            return "\n".join(lines)
+    return None
+
+def flowchart_chain(prompt: str) -> Optional[str]:
+    """'A -> B -> C' chains (one per line or separated by ';', optionally 'Title: ...') -> flowchart."""
+    for title, body in _split_title(prompt, _FLOWCHART_TITLE_NOISE):
+        if title is not None and _ARROW.search(title):
+            continue
+        code = _flowchart(body, title)
+        if code:
+            return code
+    return None
+
+def _flowchart(body: str, title: Optional[str]) -> Optional[str]:
+    chains = [chain.strip() for chain in re.split(r"[;\n]", body) if chain.strip()]
+    if not chains:
+        return None
+
+    ids: Dict[str, str] = {}
+    edges: List[Tuple[str, str]] = []
+    for chain in chains:
+        labels = [label.strip() for label in _ARROW.split(chain)]
+        if len(labels) < 2:
+            return None
+        for label in labels:
+            if not _label_ok(label) or not _NODE_LABEL.match(label):
+                return None
+            ids.setdefault(label, f"N{len(ids) + 1}")
+        edges.extend(zip(labels, labels[1:]))
+    if len(ids) > MAX_ITEMS:
+        return None
+
+    lines = _frontmatter_title(title) + ["graph TD"]
+    declared = set()
+    for source, target in edges:
+        parts = []
+        for label in (source, target):
+            node = ids[label]
+            if node in declared:
+                parts.append(node)
+            else:
+                declared.add(node)
+                parts.append(f'{node}["{label}"]')
+        lines.append(f"    {parts[0]} --> {parts[1]}")
+    return "\n".join(lines)
+
+def gantt_chart(prompt: str) -> Optional[str]:
+    """'Design 3d, Build 2 weeks, Test 5 days' (optionally 'Title: ...', 'starting 2024-01-01') -> sequential gantt chart."""
+    for title, body in _split_title(prompt, _GANTT_TITLE_NOISE):
+        start = None
+        tasks = []
+        for item in _split_items(body):
+            start_match = _GANTT_START.match(item)
+            if start_match and start is None:
+                start = start_match["date"]
+                continue
+            match = _GANTT_TASK.match(item)
+            if not match or not _label_ok(match["label"].strip()):
+                break
+            if not tasks and not _first_label_ok(match["label"].strip(), title):
+                break
+            tasks.append((match["label"].strip(), f"{match['amount']}{match['unit'][0].lower()}"))
+        else:
+            if not 2 <= len(tasks) <= MAX_ITEMS:
+                continue
+            lines = ["gantt", f"    title {title or 'Timeline'}", "    dateFormat YYYY-MM-DD", "    section Tasks"]
+            for i, (label, duration) in enumerate(tasks, start=1):
+                when = (start or date.today().isoformat()) if i == 1 else f"after t{i - 1}"
+                lines.append(f"    {label} :t{i}, {when}, {duration}")
+            return "\n".join(lines)
+    return None
+
+class RuleBasedGenerator:
+    """
+    Deterministic generators for prompts that already spell out the diagram.
+
+    Each rule either parses the whole prompt confidently and returns Mermaid
+    code, or returns None so the caller goes to the LLM. There is no partial
+    matching: one unrecognized item defers the whole prompt.
+    """
+
+    def __init__(self):
+        self._rules: Dict[DiagramType, Callable[[str], Optional[str]]] = {
+            DiagramType.PIE_CHART: pie_chart,
+            DiagramType.FLOWCHART: flowchart_chain,
+            DiagramType.GANTT: gantt_chart,
+        }
+
+    def supports(self, diagram_type: DiagramType) -> bool:
+        return diagram_type in self._rules
+
+    def generate(self, prompt: str, diagram_type: DiagramType) -> Optional[str]:
+        rule = self._rules.get(diagram_type)
+        prompt = prompt.strip()
+        if rule is None or not prompt or len(prompt) > MAX_PROMPT_CHARS:
+            return None
+        return rule(prompt)
+
+# Singleton instance
+rule_based_generator = RuleBasedGenerator()
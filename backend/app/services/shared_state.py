@@ -0,0 +1,116 @@
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+from app.core.metrics import metrics
+from app.db.mongodb import mongodb
+
+logger = logging.getLogger(__name__)
+
+_LEASE = "lease:"
+_COUNTER = "counter:"
+_SUMMARY = "summary:"
+
+class SharedState:
+    """
+    State shared by all worker processes, kept in the `shared_state` collection.
+
+    - Leases: background duties that must run once per deployment (retention
+      sweeps, Ollama keep-warm pings) run only in the process holding the
+      lease. A lease lapses if its holder stops renewing it, and another
+      process takes over.
+    - Metrics: each process periodically adds its counter and summary changes
+      to shared totals, so `/metrics` can report the whole deployment.
+    """
+
+    def __init__(self):
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+    def acquire_lease(self, name: str, ttl_seconds: float, on_error: bool = False) -> bool:
+        """
+        Take or renew a lease; True if this process holds it for the next `ttl_seconds`.
+
+        `on_error` is returned when MongoDB cannot be reached: True for duties
+        that are harmless to duplicate, False for ones that must not overlap.
+        """
+        now = datetime.utcnow()
+        try:
+            with mongodb.breaker:
+                mongodb.shared_state_collection.find_one_and_update(
+                    {"_id": _LEASE + name, "$or": [{"owner": self.owner}, {"expires_at": {"$lt": now}}]},
+                    {"$set": {"owner": self.owner, "expires_at": now + timedelta(seconds=ttl_seconds)}},
+                    upsert=True,
+                    return_document=ReturnDocument.AFTER
+                )
+            return True
+        except DuplicateKeyError:
+            # Held by another process: the upsert tried to insert the existing _id
+            return False
+        except Exception as e:
+            logger.warning("Could not acquire lease %s: %s", name, e)
+            return on_error
+
+    def release_lease(self, name: str):
+        """Give up a lease early (on shutdown) so another process can take it over at once."""
+        try:
+            with mongodb.breaker:
+                mongodb.shared_state_collection.delete_one({"_id": _LEASE + name, "owner": self.owner})
+        except Exception as e:
+            logger.warning("Could not release lease %s: %s", name, e)
+
+    def flush_metrics(self) -> int:
+        """Add this process's metric changes to the shared totals. Returns the number of keys written."""
+        counters, summaries = metrics.drain()
+        operations = [
+            UpdateOne({"_id": _COUNTER + key}, {"$inc": {"value": value}}, upsert=True)
+            for key, value in counters.items()
+        ]
+        operations.extend(
+            UpdateOne(
+                {"_id": _SUMMARY + key},
+                {"$inc": {"count": summary["count"], "sum": summary["sum"]}, "$max": {"max": summary["max"]}},
+                upsert=True
+            )
+            for key, summary in summaries.items()
+        )
+        if not operations:
+            return 0
+        try:
+            with mongodb.breaker:
+                mongodb.shared_state_collection.bulk_write(operations, ordered=False)
+        except Exception as e:
+            metrics.restore(counters, summaries)
+            logger.warning("Failed to share metrics, keeping them for the next flush: %s", e)
+            return 0
+        return len(operations)
+
+    def metrics_snapshot(self) -> Dict:
+        """Deployment-wide metrics: the shared totals plus this process's unflushed changes."""
+        counters, summaries = metrics.pending()
+        with mongodb.breaker:
+            docs = list(mongodb.shared_state_collection.find({"_id": {"$regex": f"^({_COUNTER}|{_SUMMARY})"}}))
+        for doc in docs:
+            if doc["_id"].startswith(_COUNTER):
+                key = doc["_id"][len(_COUNTER):]
+                counters[key] = counters.get(key, 0) + doc["value"]
+            else:
+                key = doc["_id"][len(_SUMMARY):]
+                summary = summaries.setdefault(key, {"count": 0, "sum": 0.0, "max": 0.0})
+                summary["count"] += doc["count"]
+                summary["sum"] += doc["sum"]
+                summary["max"] = max(summary["max"], doc["max"])
+        return {"counters": counters, "summaries": summaries}
+
+    async def share_metrics_periodically(self, interval_seconds: float):
+        """Flush metric changes every `interval_seconds` until cancelled."""
+        while True:
+            await asyncio.sleep(interval_seconds)
+            await asyncio.to_thread(self.flush_metrics)
+
+# Singleton instance
+shared_state = SharedState()
@@ -0,0 +1,67 @@
+import math
+import threading
+from typing import Dict, List
+from app.models.enums import DiagramType
+from app.core.config import settings
+
+class AdaptiveSampler:
+    """
+    Number of concurrent samples to request per diagram type.
+
+    Tracks an exponentially weighted failure (validation) rate per type from
+    every sample, and for types in `SPECULATIVE_TYPES` picks the smallest K
+    for which at least one of K independent samples is expected to validate
+    with probability `SPECULATIVE_TARGET_SUCCESS`, capped at
+    `SPECULATIVE_MAX_SAMPLES`. Reliable types settle at K=1 and cost nothing
+    extra.
+    """
+
+    def __init__(self, alpha: float = 0.1):
+        self.alpha = alpha
+        self._lock = threading.Lock()
+        self._failure_rates: Dict[str, float] = {}
+
+    def enabled(self, diagram_type: DiagramType) -> bool:
+        return diagram_type.value in settings.SPECULATIVE_TYPES
+
+    def record(self, diagram_type: DiagramType, valid: bool):
+        """Fold one sample's validation outcome into the type's failure rate."""
+        with self._lock:
+            rate = self._failure_rates.get(diagram_type.value, settings.SPECULATIVE_PRIOR_FAILURE_RATE)
+            self._failure_rates[diagram_type.value] = rate + self.alpha * ((0.0 if valid else 1.0) - rate)
+
+    def failure_rate(self, diagram_type: DiagramType) -> float:
+        with self._lock:
+            return self._failure_rates.get(diagram_type.value, settings.SPECULATIVE_PRIOR_FAILURE_RATE)
+
+    def samples_for(self, diagram_type: DiagramType) -> int:
+        if not self.enabled(diagram_type):
+            return 1
+        rate = self.failure_rate(diagram_type)
+        if rate <= 0:
+            return 1
+        if rate >= 1:
+            return max(1, settings.SPECULATIVE_MAX_SAMPLES)
+        # P(all K samples fail) = rate^K <= 1 - target
+        k = math.ceil(math.log(1 - settings.SPECULATIVE_TARGET_SUCCESS) / math.log(rate) - 1e-9)
+        return max(1, min(settings.SPECULATIVE_MAX_SAMPLES, k))
+
+    @staticmethod
+    def temperatures(k: int) -> List[float]:
+        """Sampling temperature of each of K samples (the configured list, repeated if short)."""
+        configured = settings.SPECULATIVE_TEMPERATURES or [0.2]
+        return [configured[i % len(configured)] for i in range(k)]
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """Failure rate and current K of every speculative type."""
+        return {
+            diagram_type.value: {
+                "failure_rate": round(self.failure_rate(diagram_type), 3),
+                "samples": self.samples_for(diagram_type)
+            }
+            for diagram_type in DiagramType
+            if self.enabled(diagram_type)
+        }
+
+# Singleton instance
+adaptive_sampler = AdaptiveSampler()
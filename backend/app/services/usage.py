@@ -0,0 +1,79 @@
+from typing import Dict, Optional
+from app.core.config import settings
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int) -> Optional[float]:
+    """Cost in USD from `MODEL_PRICES` (per million tokens), or None for unpriced models."""
+    prices = settings.MODEL_PRICES.get(model)
+    if not prices:
+        return None
+    return round(
+        (prompt_tokens * prices.get("input", 0.0) + completion_tokens * prices.get("output", 0.0)) / 1_000_000,
+        8
+    )
+
+def build_usage(
+    provider: str,
+    model: str,
+    prompt_tokens: int,
+    completion_tokens: int,
+    generation_seconds: Optional[float],
+    duration_seconds: float,
+    template_chars: int,
+    prompt_chars: int
+) -> Dict:
+    """
+    Normalized usage record stored with each generation.
+
+    `template_overhead_tokens` estimates how many prompt tokens the
+    `PromptTemplates` wrapper added around the user's prompt, by splitting
+    the prompt tokens in proportion to characters.
+    """
+    overhead = 0
+    if template_chars > 0:
+        overhead = round(prompt_tokens * max(0, template_chars - prompt_chars) / template_chars)
+
+    tokens_per_second = None
+    if generation_seconds and generation_seconds > 0:
+        tokens_per_second = round(completion_tokens / generation_seconds, 1)
+
+    return {
+        "provider": provider,
+        "model": model,
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+        "template_overhead_tokens": overhead,
+        "tokens_per_second": tokens_per_second,
+        "duration_ms": round(duration_seconds * 1000, 1),
+        "cost_usd": estimate_cost(model, prompt_tokens, completion_tokens)
+    }
+
+def groq_usage(result: Dict, model: str, duration_seconds: float, template_chars: int, prompt_chars: int) -> Dict:
+    """Usage from a Groq (OpenAI-compatible) response's `usage` block."""
+    usage = result.get("usage") or {}
+    completion_tokens = usage.get("completion_tokens", 0)
+    return build_usage(
+        "groq",
+        result.get("model") or model,
+        prompt_tokens=usage.get("prompt_tokens", 0),
+        completion_tokens=completion_tokens,
+        # Groq reports server-side generation time; fall back to our wall time
+        generation_seconds=usage.get("completion_time") or duration_seconds,
+        duration_seconds=duration_seconds,
+        template_chars=template_chars,
+        prompt_chars=prompt_chars
+    )
+
+def ollama_usage(result: Dict, model: str, duration_seconds: float, template_chars: int, prompt_chars: int) -> Dict:
+    """Usage from an Ollama response's eval counters (durations are in nanoseconds)."""
+    eval_duration = result.get("eval_duration", 0) / 1e9
+    return build_usage(
+        "ollama",
+        model,
+        prompt_tokens=result.get("prompt_eval_count", 0),
+        completion_tokens=result.get("eval_count", 0),
+        generation_seconds=eval_duration or duration_seconds,
+        duration_seconds=duration_seconds,
+        template_chars=template_chars,
+        prompt_chars=prompt_chars
+    )
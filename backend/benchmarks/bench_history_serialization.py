@@ -0,0 +1,91 @@
+"""
+Microbenchmark for the /history serialization paths.
+
+Compares the original path (dict per document -> HistoryItem -> HistoryResponse
+-> FastAPI validation -> jsonable_encoder -> stdlib json) with the fast path
+(raw Mongo documents -> orjson) for one page of history.
+
+Run from the backend directory:
+    python -m benchmarks.bench_history_serialization --items 100 --code-size 4000
+"""
+import argparse
+import json
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+from app.models.history import HistoryItem, HistoryResponse
+from app.core import fast_json
+
+def make_documents(items: int, code_size: int) -> list:
+    """Build raw documents shaped like the `history` collection."""
+    line = "    NodeA[Some label] --> NodeB{Decision?}\n"
+    code = "graph TD\n" + line * max(1, code_size // len(line))
+    now = datetime.utcnow()
+    return [
+        {
+            "_id": ObjectId(),
+            "prompt": f"Create a login flow with authentication and error handling #{i}",
+            "mermaid_code": code,
+            "diagram_type": "flowchart",
+            "created_at": now - timedelta(seconds=i)
+        }
+        for i in range(items)
+    ]
+
+def pydantic_path(docs: list, limit: int) -> bytes:
+    history_data = [
+        {
+            "id": str(doc["_id"]),
+            "prompt": doc["prompt"],
+            "mermaid_code": doc["mermaid_code"],
+            "diagram_type": doc.get("diagram_type", "flowchart"),
+            "created_at": doc["created_at"]
+        }
+        for doc in docs
+    ]
+    items = [HistoryItem(**item) for item in history_data]
+    response = HistoryResponse(history=items, total=len(items), limit=limit, diagram_type_filter=None)
+    # FastAPI re-validates against response_model before encoding
+    validated = HistoryResponse.validate(response)
+    return json.dumps(jsonable_encoder(validated)).encode("utf-8")
+
+def fast_path(docs: list, limit: int) -> bytes:
+    return fast_json.history_page(docs, limit, None)
+
+def measure(func, docs: list, limit: int, iterations: int) -> dict:
+    func(docs, limit)  # warm up
+
+    start = time.process_time()
+    for _ in range(iterations):
+        func(docs, limit)
+    cpu_ms = (time.process_time() - start) * 1000 / iterations
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    func(docs, limit)
+    after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    stats = after.compare_to(before, "filename")
+    allocations = sum(stat.count_diff for stat in stats if stat.count_diff > 0)
+    return {"cpu_ms": cpu_ms, "peak_kib": peak / 1024, "allocations": allocations}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=100, help="Documents per page")
+    parser.add_argument("--code-size", type=int, default=4000, help="Approximate mermaid_code size in bytes")
+    parser.add_argument("--iterations", type=int, default=200, help="Timed iterations per path")
+    args = parser.parse_args()
+
+    docs = make_documents(args.items, args.code_size)
+    print(f"{args.items} items/page, ~{args.code_size} B of code each, {args.iterations} iterations")
+    print(f"{'path':<10} {'cpu ms/page':>12} {'peak KiB':>10} {'allocs':>8}")
+    for name, func in (("pydantic", pydantic_path), ("fast", fast_path)):
+        result = measure(func, docs, args.items, args.iterations)
+        print(f"{name:<10} {result['cpu_ms']:>12.3f} {result['peak_kib']:>10.1f} {result['allocations']:>8}")
+
+if __name__ == "__main__":
+    main()
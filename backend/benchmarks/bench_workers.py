@@ -0,0 +1,172 @@
+"""
+Throughput of the API at different worker-process counts.
+
+Starts the server once per worker count (gunicorn with gunicorn.conf.py, or
+uvicorn --workers), drives it with concurrent clients for a fixed duration
+and reports requests per second, latency percentiles and the speedup over the
+first worker count. Needs a reachable MongoDB (MONGODB_URL).
+
+Scenarios:
+    types   GET /diagram-types - framework and serialization overhead only
+    rules   POST /diagrams/generate with structured pie prompts - the
+            rule-based fast path, validation and history writes, no LLM
+    replay  POST /diagrams/generate with the prompts of eval_corpus.json,
+            answered from recorded provider traffic (record them once with
+            LLM_TRAFFIC_MODE=record); latency scaled by LLM_REPLAY_LATENCY_SCALE
+
+Run from the backend directory:
+    python -m benchmarks.bench_workers --workers 1,2,4 --scenario rules --duration 20
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import signal
+import subprocess
+import sys
+import time
+from typing import Dict, List, Tuple
+import httpx
+
+API = "/api/v1"
+CORPUS = os.path.join(os.path.dirname(__file__), "eval_corpus.json")
+LABELS = ["Python", "Go", "Rust", "Java", "Kotlin", "Swift", "Ruby", "Elixir"]
+
+def make_requests(scenario: str) -> List[Tuple[str, str, Dict]]:
+    """(method, path, json body) of the requests one client cycles through."""
+    if scenario == "types":
+        return [("GET", f"{API}/diagram-types", None)]
+    if scenario == "rules":
+        requests = []
+        for _ in range(200):
+            labels = random.sample(LABELS, 3)
+            prompt = ", ".join(f"{label} {random.randint(1, 60)}%" for label in labels)
+            requests.append(("POST", f"{API}/diagrams/generate", {"prompt": f"Languages: {prompt}", "diagram_type": "pie"}))
+        return requests
+    with open(CORPUS) as f:
+        cases = json.load(f)
+    return [
+        ("POST", f"{API}/diagrams/generate", {"prompt": case["prompt"], "diagram_type": case["diagram_type"]})
+        for case in cases
+    ]
+
+def start_server(server: str, workers: int, port: int, scenario: str) -> subprocess.Popen:
+    env = dict(os.environ, LOG_LEVEL="WARNING", WEB_WORKERS=str(workers), WEB_BIND=f"127.0.0.1:{port}")
+    if scenario == "replay":
+        env["LLM_TRAFFIC_MODE"] = "replay"
+    if server == "gunicorn":
+        command = [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "app.main:app"]
+    else:
+        command = [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1",
+                   "--port", str(port), "--workers", str(workers), "--log-level", "warning"]
+    # Own process group, so the workers go down with the server
+    return subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+
+def wait_until_ready(base_url: str, process: subprocess.Popen, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with status {process.returncode}")
+        try:
+            if httpx.get(f"{base_url}{API}/diagram-types", timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("Server did not become ready")
+
+def stop_server(process: subprocess.Popen):
+    if process.poll() is not None:
+        return
+    os.killpg(process.pid, signal.SIGTERM)
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        os.killpg(process.pid, signal.SIGKILL)
+
+async def _drive(base_url: str, scenario: str, concurrency: int, duration: float) -> Tuple[List[float], int]:
+    requests = make_requests(scenario)
+    latencies: List[float] = []
+    errors = 0
+    stop_at = time.perf_counter() + duration
+
+    async def user(client: httpx.AsyncClient, offset: int):
+        nonlocal errors
+        i = offset
+        while time.perf_counter() < stop_at:
+            method, path, body = requests[i % len(requests)]
+            i += 1
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, path, json=body)
+                ok = response.status_code < 400
+            except httpx.HTTPError:
+                ok = False
+            if ok:
+                latencies.append((time.perf_counter() - start) * 1000)
+            else:
+                errors += 1
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=60, limits=limits) as client:
+        await asyncio.gather(*(user(client, offset) for offset in range(concurrency)))
+    return latencies, errors
+
+def _client(args: Tuple[str, str, int, float]) -> Tuple[List[float], int]:
+    return asyncio.run(_drive(*args))
+
+def percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def run(server: str, workers: int, args) -> Dict:
+    port = args.port
+    base_url = f"http://127.0.0.1:{port}"
+    process = start_server(server, workers, port, args.scenario)
+    try:
+        wait_until_ready(base_url, process)
+        # Warm-up: connections, imports and Mongo pools in every worker
+        _client((base_url, args.scenario, args.concurrency, min(3.0, args.duration)))
+        # Several client processes, so the load generator is not the bottleneck
+        per_client = max(1, args.concurrency // args.clients)
+        with multiprocessing.Pool(args.clients) as pool:
+            results = pool.map(_client, [(base_url, args.scenario, per_client, args.duration)] * args.clients)
+    finally:
+        stop_server(process)
+    latencies = [latency for client_latencies, _ in results for latency in client_latencies]
+    return {
+        "workers": workers,
+        "rps": len(latencies) / args.duration,
+        "p50": percentile(latencies, 0.5),
+        "p95": percentile(latencies, 0.95),
+        "errors": sum(errors for _, errors in results)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", default="1,2,4", help="Comma-separated worker counts")
+    parser.add_argument("--server", choices=["gunicorn", "uvicorn"], default="gunicorn")
+    parser.add_argument("--scenario", choices=["types", "rules", "replay"], default="rules")
+    parser.add_argument("--duration", type=float, default=15, help="Seconds of load per worker count")
+    parser.add_argument("--concurrency", type=int, default=64, help="Concurrent requests in flight")
+    parser.add_argument("--clients", type=int, default=2, help="Load generator processes")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    print(f"{args.server}, scenario {args.scenario}, {args.concurrency} concurrent, "
+          f"{args.duration:g}s per run, {multiprocessing.cpu_count()} CPU cores")
+    print(f"{'workers':>8} {'req/s':>10} {'p50 ms':>9} {'p95 ms':>9} {'errors':>7} {'speedup':>8}")
+    baseline = None
+    for workers in (int(w) for w in args.workers.split(",")):
+        result = run(args.server, workers, args)
+        baseline = baseline or result["rps"] or None
+        speedup = result["rps"] / baseline if baseline else 0.0
+        print(f"{result['workers']:>8} {result['rps']:>10.1f} {result['p50']:>9.1f} "
+              f"{result['p95']:>9.1f} {result['errors']:>7} {speedup:>7.2f}x")
+
+if __name__ == "__main__":
+    main()
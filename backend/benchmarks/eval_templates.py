@@ -0,0 +1,161 @@
+"""
+Offline evaluation of prompt templates and post-processing.
+
+Runs every case of a fixed corpus (prompt + raw LLM response per diagram
+type) through `PromptTemplates` and `LLMService`'s cleaning and validation,
+without calling a provider, and reports per diagram type:
+
+- prompt_chars / prompt_tokens: size of the rendered template (tokens are
+  estimated at 4 characters each unless the case records real usage)
+- output_tokens: completion size
+- fixed_rate: share of responses changed by `_fix_syntax_errors`
+- valid_rate / fallback_rate: share that validated, or fell back to the
+  static diagram
+- clean_us: mean time of `_clean_mermaid_code`
+
+With a baseline file the report is diffed against it and the exit status is 1
+if anything regressed beyond the thresholds. Run from the backend directory:
+    python -m benchmarks.eval_templates [--corpus benchmarks/eval_corpus.json]
+        [--baseline benchmarks/eval_baseline.json] [--write-baseline]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List
+from app.models.enums import DiagramType
+from app.services.prompt_templates import PromptTemplates
+from app.services.llm_service import llm_service
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CORPUS = os.path.join(HERE, "eval_corpus.json")
+DEFAULT_BASELINE = os.path.join(HERE, "eval_baseline.json")
+
+CHARS_PER_TOKEN = 4
+
+# Allowed change against the baseline before a metric counts as a regression
+THRESHOLDS = {
+    "valid_rate": -0.0,       # any drop
+    "fallback_rate": 0.0,     # any increase
+    "prompt_tokens": 0.10,    # >10% template growth
+    "output_tokens": 0.10,
+}
+
+def _tokens(text: str) -> int:
+    return max(1, round(len(text) / CHARS_PER_TOKEN))
+
+def _time_clean(raw: str, diagram_type: DiagramType, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        llm_service._clean_mermaid_code(raw, diagram_type)
+    return (time.perf_counter() - start) / repeat * 1e6
+
+def evaluate(cases: List[Dict], repeat: int = 200) -> Dict[str, Dict]:
+    """Run the corpus and return metrics per diagram type."""
+    totals: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+    for case in cases:
+        diagram_type = DiagramType(case["diagram_type"])
+        raw = case["response"]
+        usage = case.get("usage") or {}
+
+        rendered = PromptTemplates.get_template(diagram_type, case["prompt"])
+        extracted = llm_service._extract_mermaid_code(raw, diagram_type)
+        cleaned = llm_service._fix_syntax_errors(extracted, diagram_type)
+        valid = llm_service._validate_mermaid_code(cleaned, diagram_type)
+
+        row = totals[diagram_type.value]
+        row["cases"] += 1
+        row["prompt_chars"] += len(rendered)
+        row["prompt_tokens"] += usage.get("prompt_tokens") or _tokens(rendered)
+        row["output_tokens"] += usage.get("completion_tokens") or _tokens(raw)
+        row["fixed"] += cleaned != extracted
+        row["valid"] += valid
+        row["clean_us"] += _time_clean(raw, diagram_type, repeat)
+
+    report = {}
+    for name, row in sorted(totals.items()):
+        n = row["cases"]
+        report[name] = {
+            "cases": int(n),
+            "prompt_chars": round(row["prompt_chars"] / n),
+            "prompt_tokens": round(row["prompt_tokens"] / n),
+            "output_tokens": round(row["output_tokens"] / n),
+            "fixed_rate": round(row["fixed"] / n, 3),
+            "valid_rate": round(row["valid"] / n, 3),
+            "fallback_rate": round(1 - row["valid"] / n, 3),
+            "clean_us": round(row["clean_us"] / n, 1),
+        }
+    return report
+
+def diff(report: Dict[str, Dict], baseline: Dict[str, Dict]) -> List[str]:
+    """Describe regressions of `report` against `baseline`."""
+    regressions = []
+    for name, metrics in report.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        for metric, allowed in THRESHOLDS.items():
+            old, new = base.get(metric), metrics.get(metric)
+            if old is None or new is None:
+                continue
+            if metric in ("prompt_tokens", "output_tokens"):
+                regressed = old > 0 and (new - old) / old > allowed
+            elif metric == "valid_rate":
+                regressed = new - old < allowed
+            else:
+                regressed = new - old > allowed
+            if regressed:
+                regressions.append(f"{name}.{metric}: {old} -> {new}")
+    return regressions
+
+def print_report(report: Dict[str, Dict], baseline: Dict[str, Dict]):
+    columns = ["cases", "prompt_chars", "prompt_tokens", "output_tokens", "fixed_rate", "valid_rate", "fallback_rate", "clean_us"]
+    print(f"{'type':<10}" + "".join(f"{column:>15}" for column in columns))
+    for name, metrics in report.items():
+        base = baseline.get(name, {})
+        cells = []
+        for column in columns:
+            value = metrics[column]
+            old = base.get(column)
+            cell = f"{value}" if old is None or old == value or column == "clean_us" else f"{old}->{value}"
+            cells.append(f"{cell:>15}")
+        print(f"{name:<10}" + "".join(cells))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--write-baseline", action="store_true", help="Save this run as the new baseline")
+    parser.add_argument("--repeat", type=int, default=200, help="Timing iterations per case")
+    args = parser.parse_args()
+
+    with open(args.corpus) as f:
+        cases = json.load(f)
+    report = evaluate(cases, args.repeat)
+
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.write_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    print_report(report, baseline)
+
+    if args.write_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        print(f"\nBaseline written to {args.baseline}")
+        return
+
+    regressions = diff(report, baseline)
+    if regressions:
+        print("\nRegressions against baseline:")
+        for line in regressions:
+            print(f"  {line}")
+        sys.exit(1)
+    if baseline:
+        print("\nNo regressions against baseline")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,28 @@
+"""
+Production server: gunicorn managing uvicorn worker processes.
+
+    gunicorn -c gunicorn.conf.py app.main:app
+
+Every worker is a full copy of the app with its own MongoDB client, HTTP
+client, circuit breakers and adaptive sampler; work that must run once per
+deployment (retention sweeps, Ollama keep-warm) is coordinated through leases
+in MongoDB (see app/services/shared_state.py). Send SIGHUP to replace the
+workers gracefully after a deploy.
+"""
+import multiprocessing
+from app.core.config import settings
+
+bind = settings.WEB_BIND
+workers = settings.WEB_WORKERS or multiprocessing.cpu_count()
+worker_class = "uvicorn.workers.UvicornWorker"
+
+# Import the app in each worker after the fork: pymongo clients are not fork-safe
+preload_app = False
+
+# In-flight generations can take a while; give them time to finish on HUP/TERM
+graceful_timeout = settings.WEB_GRACEFUL_TIMEOUT
+timeout = max(120, settings.WEB_GRACEFUL_TIMEOUT)
+max_requests = settings.WEB_MAX_REQUESTS
+max_requests_jitter = settings.WEB_MAX_REQUESTS // 10
+
+accesslog = None  # requests are logged by RequestContextMiddleware
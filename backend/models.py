@@ -1,27 +1,21 @@
-from pymongo import MongoClient
-from datetime import datetime
+"""
+Legacy persistence helpers, kept for code that still imports them.
 
-client = MongoClient("mongodb://localhost:27017/")
-db = client.diagramcraft
+They delegate to the application's MongoDB connection. Diagrams are written
+once, to `history`; the old `diagrams` collection is no longer written and can
+be folded into `history` with `python -m scripts.migrate_legacy_diagrams`.
+"""
+from app.db.mongodb import mongodb
+from app.models.enums import DiagramType
+from app.services.history_writer import history_writer
 
-history_collection = db.history
-diagrams_collection = db.diagrams
-
-def save_prompt_and_diagram(prompt: str, mermaid_code: str):
+def save_prompt_and_diagram(prompt: str, mermaid_code: str) -> str:
     """Save the prompt and generated diagram Mermaid code to the database."""
-    entry = {
-        "prompt": prompt,
-        "mermaid_code": mermaid_code,
-        "created_at": datetime.utcnow()
-    }
-    result = history_collection.insert_one(entry)
-    diagrams_collection.insert_one({
-        "diagram_id": result.inserted_id,
-        "mermaid_code": mermaid_code,
-        "created_at": datetime.utcnow()
-    })
+    return history_writer.save(prompt, mermaid_code, DiagramType.FLOWCHART.value)
 
 def get_history(limit=10):
     """Retrieve the last 'limit' entries from the history collection."""
-    cursor = history_collection.find().sort("created_at", -1).limit(limit)
-    return [{"prompt": doc["prompt"], "mermaid_code": doc["mermaid_code"], "created_at": doc["created_at"].isoformat()} for doc in cursor]
+    return [
+        {"prompt": doc["prompt"], "mermaid_code": doc["mermaid_code"], "created_at": doc["created_at"].isoformat()}
+        for doc in mongodb.iter_history(limit=limit)
+    ]
@@ -0,0 +1,61 @@
+"""
+Tag history documents created before per-user history with an owner.
+
+Rows without a `user_id` field get `user_id: null` (anonymous), or the id of
+the user given with --email. Run from the backend directory:
+    python -m scripts.backfill_history_owner [--email user@example.com] [--batch-size 1000]
+"""
+import argparse
+import logging
+import sys
+from bson import ObjectId
+from app.db.mongodb import mongodb
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+def backfill(owner, batch_size: int) -> int:
+    """Walk documents missing `user_id` in _id order and tag them in batches."""
+    updated = 0
+    last_id = None
+    while True:
+        query = {"user_id": {"$exists": False}}
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+
+        ids = [
+            doc["_id"]
+            for doc in mongodb.history_collection.find(query, projection={"_id": 1}).sort("_id", 1).limit(batch_size)
+        ]
+        if not ids:
+            break
+
+        result = mongodb.history_collection.update_many(
+            {"_id": {"$in": ids}, "user_id": {"$exists": False}},
+            {"$set": {"user_id": owner}}
+        )
+        updated += result.modified_count
+        last_id = ids[-1]
+        logger.info("Tagged %s documents", updated)
+
+    return updated
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--email", help="Assign unowned rows to this user instead of marking them anonymous")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    owner = None
+    if args.email:
+        user = mongodb.get_user_by_email(args.email)
+        if not user:
+            logger.error("No user with email %s", args.email)
+            sys.exit(1)
+        owner = ObjectId(user["id"])
+
+    total = backfill(owner, args.batch_size)
+    logger.info("Done, %s documents tagged", total)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Populate `prompt_minhash` / `prompt_bands` on history documents created before
+near-duplicate prompt matching, so their prompts can be matched too.
+`--recompute` rewrites every signature, e.g. after the shingling changed.
+
+Run from the backend directory:
+    python -m scripts.backfill_prompt_minhash [--batch-size 1000] [--recompute]
+"""
+import argparse
+import logging
+from pymongo import UpdateOne
+from app.db.mongodb import mongodb
+from app.services.prompt_similarity import index_fields
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+def backfill(batch_size: int, recompute: bool = False) -> int:
+    """Walk generated (non-edit) documents missing `prompt_bands` (or all) in _id order and update them in batches."""
+    updated = 0
+    last_id = None
+    while True:
+        query = {"parent_id": {"$exists": False}}
+        if not recompute:
+            query["prompt_bands"] = {"$exists": False}
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+
+        batch = list(
+            mongodb.history_collection.find(query, projection={"prompt": 1})
+            .sort("_id", 1)
+            .limit(batch_size)
+        )
+        if not batch:
+            break
+
+        operations = []
+        for doc in batch:
+            fields = index_fields(doc.get("prompt", ""))
+            if fields:
+                operations.append(UpdateOne({"_id": doc["_id"]}, {"$set": fields}))
+        if operations:
+            result = mongodb.history_collection.bulk_write(operations, ordered=False)
+            updated += result.modified_count
+        last_id = batch[-1]["_id"]
+        logger.info("Backfilled %s documents", updated)
+
+    return updated
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--recompute", action="store_true", help="Recompute existing signatures too")
+    args = parser.parse_args()
+
+    total = backfill(args.batch_size, args.recompute)
+    logger.info("Done, %s documents updated", total)
+
+if __name__ == "__main__":
+    main()
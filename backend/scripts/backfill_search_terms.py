@@ -0,0 +1,53 @@
+"""
+Populate `search_terms` on history documents created before full-text search.
+
+Run from the backend directory:
+    python -m scripts.backfill_search_terms [--batch-size 1000]
+"""
+import argparse
+import logging
+from pymongo import UpdateOne
+from app.db.mongodb import mongodb
+from app.services.mermaid_identifiers import build_search_terms
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+def backfill(batch_size: int) -> int:
+    """Walk documents missing `search_terms` in _id order and update them in batches."""
+    updated = 0
+    last_id = None
+    while True:
+        query = {"search_terms": {"$exists": False}}
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+
+        batch = list(
+            mongodb.history_collection.find(query, projection={"mermaid_code": 1})
+            .sort("_id", 1)
+            .limit(batch_size)
+        )
+        if not batch:
+            break
+
+        operations = [
+            UpdateOne({"_id": doc["_id"]}, {"$set": {"search_terms": build_search_terms(doc.get("mermaid_code", ""))}})
+            for doc in batch
+        ]
+        result = mongodb.history_collection.bulk_write(operations, ordered=False)
+        updated += result.modified_count
+        last_id = batch[-1]["_id"]
+        logger.info("Backfilled %s documents", updated)
+
+    return updated
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    total = backfill(args.batch_size)
+    logger.info("Done, %s documents updated", total)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+"""
+Archive old history entries to disk, or restore them.
+
+Run from the backend directory:
+    python -m scripts.history_archive sweep
+    python -m scripts.history_archive restore --start 2024-01-01 --end 2024-01-31
+"""
+import argparse
+import logging
+from datetime import date
+from app.services.archival import history_archiver
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("sweep", help="Archive entries past their retention window")
+    restore = subparsers.add_parser("restore", help="Re-import archived entries for a date range")
+    restore.add_argument("--start", type=date.fromisoformat, required=True, help="First day (YYYY-MM-DD)")
+    restore.add_argument("--end", type=date.fromisoformat, required=True, help="Last day, inclusive (YYYY-MM-DD)")
+    args = parser.parse_args()
+
+    if args.command == "sweep":
+        count = history_archiver.sweep()
+        logger.info("Archived %s entries", count)
+    else:
+        count = history_archiver.restore(args.start, args.end)
+        logger.info("Restored %s entries", count)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""
+Export history to a file or bulk-import it, across all owners.
+
+Run from the backend directory:
+    python -m scripts.history_transfer export --out history.ndjson [--format zip] [--type pie] [--start 2024-01-01] [--end 2024-02-01]
+    python -m scripts.history_transfer import history.ndjson
+"""
+import argparse
+import logging
+from datetime import datetime
+from app.services import history_transfer
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export = subparsers.add_parser("export", help="Stream history to a file")
+    export.add_argument("--out", required=True)
+    export.add_argument("--format", choices=["ndjson", "zip"], default="ndjson")
+    export.add_argument("--type", dest="diagram_type")
+    export.add_argument("--start", type=datetime.fromisoformat, help="Created at or after (ISO 8601)")
+    export.add_argument("--end", type=datetime.fromisoformat, help="Created before (ISO 8601)")
+
+    importer = subparsers.add_parser("import", help="Bulk-load an NDJSON export, skipping existing entries")
+    importer.add_argument("path")
+
+    args = parser.parse_args()
+
+    if args.command == "export":
+        query = history_transfer.build_export_query(
+            diagram_type=args.diagram_type, start=args.start, end=args.end, all_owners=True
+        )
+        with open(args.out, "wb") as out:
+            history_transfer.export_to_file(query, args.format, out)
+        logger.info("Exported history to %s", args.out)
+    else:
+        with open(args.path, "rb") as f:
+            result = history_transfer.import_ndjson(f, keep_owner=True)
+        logger.info("Inserted %s, skipped %s existing entries", result['inserted'], result['skipped'])
+
+if __name__ == "__main__":
+    main()
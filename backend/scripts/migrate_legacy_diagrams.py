@@ -0,0 +1,131 @@
+"""
+Fold the legacy `diagrams` collection into `history`.
+
+The original backend wrote every diagram twice: to `history` and to
+`diagrams` ({diagram_id, mermaid_code, created_at}). This streams `diagrams`
+in _id order, in batches:
+
+- entries whose history row still exists get a `diagram_type` if they
+  lack one;
+- entries whose history row is gone are left alone: the row was deleted by
+  its owner or archived by retention.
+
+With `--recreate-missing`, rows that are gone and not found in the history
+archive are re-created in the current schema (same _id, type inferred from
+the code). They get the anonymous owner, so every anonymous caller can see
+them; only use it when history rows were lost some other way.
+
+Re-running is safe: existing rows are skipped. Run from the backend directory:
+    python -m scripts.migrate_legacy_diagrams [--batch-size 1000] [--recreate-missing] [--drop]
+"""
+import argparse
+import logging
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Set
+from bson import ObjectId
+from pymongo import UpdateOne
+from app.db.mongodb import mongodb
+from app.services.archival import history_archiver
+from app.services.diagram_registry import diagram_registry
+from app.services.mermaid_identifiers import build_search_terms
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+def _history_entry(legacy: Dict) -> Dict:
+    mermaid_code = legacy.get("mermaid_code", "")
+    return {
+        "_id": legacy.get("diagram_id") or legacy["_id"],
+        "user_id": None,
+        # The legacy collection never stored the prompt
+        "prompt": "",
+        "mermaid_code": mermaid_code,
+        "diagram_type": diagram_registry.detect(mermaid_code).value,
+        "search_terms": build_search_terms(mermaid_code),
+        "created_at": legacy.get("created_at") or datetime.utcnow()
+    }
+
+class ArchivedIds:
+    """Ids in the history archive, read one date partition at a time."""
+
+    def __init__(self):
+        self._by_day: Dict[date, Set[ObjectId]] = {}
+
+    def _day(self, day: date) -> Set[ObjectId]:
+        if day not in self._by_day:
+            self._by_day[day] = {doc["_id"] for doc in history_archiver.iter_archived(day, day)}
+        return self._by_day[day]
+
+    def __contains__(self, entry: Dict) -> bool:
+        # The legacy and history timestamps were taken separately and may straddle midnight
+        day = entry["created_at"].date()
+        return any(entry["_id"] in self._day(day + timedelta(days=offset)) for offset in (-1, 0, 1))
+
+def migrate_batch(batch: List[Dict], archived: ArchivedIds = None) -> Dict[str, int]:
+    """Type the batch's existing history rows; with `archived`, re-create missing rows not in the archive."""
+    entries = [_history_entry(doc) for doc in batch]
+    ids = [entry["_id"] for entry in entries]
+    existing = {
+        doc["_id"]
+        for doc in mongodb.history_collection.find({"_id": {"$in": ids}}, projection={"_id": 1})
+    }
+
+    inserted = 0
+    if archived is not None:
+        missing = [entry for entry in entries if entry["_id"] not in existing and entry not in archived]
+        inserted = mongodb.insert_history_batch(missing) if missing else 0
+
+    updates = [
+        UpdateOne(
+            {"_id": entry["_id"], "diagram_type": {"$exists": False}},
+            {"$set": {"diagram_type": entry["diagram_type"]}}
+        )
+        for entry in entries if entry["_id"] in existing
+    ]
+    typed = mongodb.history_collection.bulk_write(updates, ordered=False).modified_count if updates else 0
+
+    return {"inserted": inserted, "typed": typed}
+
+def migrate(batch_size: int, recreate_missing: bool = False) -> Dict[str, int]:
+    """Stream `diagrams` into `history`; returns counts of scanned, inserted and typed rows."""
+    totals = {"scanned": 0, "inserted": 0, "typed": 0}
+    archived = ArchivedIds() if recreate_missing else None
+    cursor = mongodb.db.diagrams.find().sort("_id", 1).batch_size(batch_size)
+
+    batch = []
+    for doc in cursor:
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            _add(totals, batch, archived)
+            batch = []
+    if batch:
+        _add(totals, batch, archived)
+
+    return totals
+
+def _add(totals: Dict[str, int], batch: List[Dict], archived: ArchivedIds = None):
+    counts = migrate_batch(batch, archived)
+    totals["scanned"] += len(batch)
+    totals["inserted"] += counts["inserted"]
+    totals["typed"] += counts["typed"]
+    logger.info("Scanned %s legacy diagrams (%s re-created, %s typed)", totals['scanned'], totals['inserted'], totals['typed'])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument(
+        "--recreate-missing", action="store_true",
+        help="Re-create rows missing from history and from the archive, as anonymous entries"
+    )
+    parser.add_argument("--drop", action="store_true", help="Drop the `diagrams` collection after a complete run")
+    args = parser.parse_args()
+
+    totals = migrate(args.batch_size, args.recreate_missing)
+    logger.info("Done: %s", totals)
+
+    if args.drop:
+        mongodb.db.drop_collection("diagrams")
+        logger.info("Dropped legacy `diagrams` collection")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+"""
+Rebuild activity rollups from the history collection.
+
+Use it to backfill buckets for diagrams generated before rollups existed, or
+to repair them. Buckets in the range are overwritten with counts derived from
+history; entries saved without a `provider` are counted as "unknown". Avoid
+running it over ranges that are still receiving traffic, since increments
+made during the rebuild can be overwritten. Run from the backend directory:
+    python -m scripts.rebuild_activity_rollups [--since 2024-01-01] [--until 2024-02-01]
+"""
+import argparse
+import logging
+from datetime import datetime
+from app.db.mongodb import mongodb
+from app.services.activity_rollups import activity_rollups
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--since", type=datetime.fromisoformat, help="Only history created at or after this UTC date")
+    parser.add_argument("--until", type=datetime.fromisoformat, help="Only history created before this UTC date")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    query = {}
+    if args.since or args.until:
+        query["created_at"] = {}
+        if args.since:
+            query["created_at"]["$gte"] = args.since
+        if args.until:
+            query["created_at"]["$lt"] = args.until
+
+    entries = mongodb.history_collection.find(
+        query, projection={"_id": 0, "diagram_type": 1, "provider": 1, "created_at": 1}
+    ).batch_size(args.batch_size)
+    written = activity_rollups.rebuild(entries)
+    logger.info("Done, %s buckets written", written)
+
+if __name__ == "__main__":
+    main()
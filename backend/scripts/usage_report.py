@@ -0,0 +1,29 @@
+"""
+Print token usage and cost across all users.
+
+Run from the backend directory:
+    python -m scripts.usage_report [--group-by user|diagram_type|model|provider] [--since 2024-01-01] [--until 2024-02-01]
+"""
+import argparse
+from datetime import datetime
+from app.db.mongodb import mongodb, USAGE_GROUP_FIELDS
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--group-by", choices=sorted(USAGE_GROUP_FIELDS), default="user")
+    parser.add_argument("--since", type=datetime.fromisoformat)
+    parser.add_argument("--until", type=datetime.fromisoformat)
+    args = parser.parse_args()
+
+    groups = mongodb.get_usage_stats(args.group_by, start=args.since, end=args.until, all_owners=True)
+
+    print(f"{args.group_by:<26} {'gens':>7} {'prompt':>10} {'completion':>11} {'overhead':>9} {'tok/s':>7} {'cost $':>10}")
+    for group in groups:
+        print(
+            f"{str(group['key']):<26} {group['generations']:>7} {group['prompt_tokens']:>10} "
+            f"{group['completion_tokens']:>11} {group['avg_template_overhead_tokens'] or 0:>9.0f} "
+            f"{group['avg_tokens_per_second'] or 0:>7.1f} {group['cost_usd']:>10.4f}"
+        )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""Parsing and applying the line patches the model answers edit requests with."""
+from app.services.llm_service import LLMService
+
+CODE = "graph TD\n    A[Start] --> B[Login]\n    B --> C[Home]"
+
+def edit(reply: str, code: str = CODE):
+    patch = LLMService._patch_lines(reply)
+    assert patch, "reply not recognised as a patch"
+    return LLMService._apply_patch(code, patch)
+
+def test_plain_patch_replaces_line_in_place():
+    reply = "- B --> C[Home]\n+ B --> D[Forgot password]\n+ D --> C[Home]"
+    assert edit(reply) == "graph TD\n    A[Start] --> B[Login]\n    B --> D[Forgot password]\n    D --> C[Home]"
+
+def test_fenced_diff_block():
+    reply = "Here is the change:\n```diff\n- A[Start] --> B[Login]\n+ A[Begin] --> B[Login]\n```"
+    assert edit(reply) == "graph TD\n    A[Begin] --> B[Login]\n    B --> C[Home]"
+
+def test_unified_diff_headers_and_hunks_are_dropped():
+    reply = (
+        "--- a/diagram.mmd\n"
+        "+++ b/diagram.mmd\n"
+        "@@ -1,3 +1,3 @@\n"
+        " graph TD\n"
+        "     A[Start] --> B[Login]\n"
+        "-    B --> C[Home]\n"
+        "+    B --> C[Dashboard]\n"
+    )
+    assert edit(reply) == "graph TD\n    A[Start] --> B[Login]\n    B --> C[Dashboard]"
+
+def test_unified_diff_context_positions_additions():
+    code = "graph TD\n    A[Start] --> B[Login]\n    B --> C[Home]\n    C --> D[Logout]"
+    reply = "@@ -2,2 +2,3 @@\n     A[Start] --> B[Login]\n+    B --> E[Forgot password]\n     B --> C[Home]"
+    assert edit(reply, code) == (
+        "graph TD\n    A[Start] --> B[Login]\n    B --> E[Forgot password]\n    B --> C[Home]\n    C --> D[Logout]"
+    )
+
+def test_unknown_context_appends_at_the_end():
+    reply = "  X --> Y\n+ C --> D[Logout]"
+    assert edit(reply) == CODE + "\n    C --> D[Logout]"
+
+def test_missing_removed_line_rejects_the_patch():
+    assert edit("- X --> Y\n+ X --> Z") is None
+
+def test_full_code_is_not_a_patch():
+    assert LLMService._patch_lines(CODE) == []
+    assert LLMService._patch_lines("```mermaid\n" + CODE + "\n```") == []
+
+def test_context_only_is_not_a_patch():
+    assert LLMService._patch_lines("@@ -1,2 +1,2 @@\n     A[Start] --> B[Login]\n     B --> C[Home]") == []
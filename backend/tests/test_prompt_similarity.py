@@ -0,0 +1,62 @@
+"""Near-duplicate prompt matching: rewordings match, prompts with other data never do."""
+import pytest
+from app.core.config import settings
+from app.services.prompt_similarity import best_match, index_fields, numeric_facts, shingles
+
+DATA_PROMPT = (
+    "Create a line chart of quarterly revenue in thousands: Q8 900, Q9 950, Q10 1020, "
+    "Q11 {q11}, Q12 1210, with a dashed target line at 1000 and the growth labelled per quarter"
+)
+
+REWORDINGS = [
+    ("Create a flowchart of the user login process", "User login process flowchart"),
+    ("Draw an ER diagram for a library with books, members and loans",
+     "ER diagram for a library with members, loans and books"),
+    ("Sequence diagram: client sends request to API, API queries database",
+     "sequence diagram - Client sends request to API; API queries database."),
+    ("Python 40%, JS 35%, Go 25%", "JS 35%, Go 25%, Python 40%"),
+]
+
+DIFFERENT_DATA = [
+    (DATA_PROMPT.format(q11=1100), DATA_PROMPT.format(q11=1150)),
+    ("Python 40%, JS 35%, Go 25%", "Python 35%, JS 40%, Go 25%"),
+    ("Sprint plan: design 3 days, build 5 days, test 2 days", "Sprint plan: design 3 days, build 5 days, test 4 days"),
+]
+
+def lookup(prompt: str, earlier: str):
+    fields = index_fields(prompt)
+    candidate = {"prompt": earlier, **index_fields(earlier)}
+    return best_match(prompt, fields["prompt_minhash"], [candidate])
+
+@pytest.mark.parametrize("prompt,earlier", REWORDINGS)
+def test_rewordings_are_reused(prompt, earlier):
+    match, score = lookup(prompt, earlier)
+    assert match is not None
+    assert score >= settings.DUPLICATE_THRESHOLD
+
+@pytest.mark.parametrize("prompt,earlier", DIFFERENT_DATA)
+def test_prompts_with_other_numbers_are_not_reused(prompt, earlier):
+    match, score = lookup(prompt, earlier)
+    assert match is None
+    assert score == 0.0
+
+def test_changed_value_in_long_prompt_keeps_a_close_signature():
+    # The word sets are nearly equal; only the numeric facts tell them apart
+    first, second = (shingles(DATA_PROMPT.format(q11=q11)) for q11 in (1100, 1150))
+    assert len(first & second) / len(first | second) >= settings.DUPLICATE_THRESHOLD
+    assert numeric_facts(DATA_PROMPT.format(q11=1100)) != numeric_facts(DATA_PROMPT.format(q11=1150))
+
+def test_numeric_facts_pair_values_with_their_labels():
+    assert numeric_facts("Python 40%, JS 35%") == ["js 35", "python 40"]
+    assert numeric_facts("User login process") == []
+
+def test_best_match_prefers_the_closest_candidate_with_the_same_facts():
+    prompt = "Pie chart of browser share: Chrome 65, Safari 19, Edge 5"
+    candidates = [
+        {"prompt": "Pie chart of browser share: Chrome 60, Safari 19, Edge 5"},
+        {"prompt": "Browser share pie: Chrome 65, Safari 19, Edge 5"},
+    ]
+    for candidate in candidates:
+        candidate.update(index_fields(candidate["prompt"]))
+    match, _ = best_match(prompt, index_fields(prompt)["prompt_minhash"], candidates)
+    assert match is candidates[1]